@@ -1,8 +1,16 @@
+import os
+import re
+import time
+import pickle
+import shutil
+import tempfile
+import contextlib
+import tracemalloc
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from sklearn.cluster import KMeans
-from scipy.spatial import ConvexHull
+from scipy.spatial import ConvexHull, cKDTree
 import umap
 from matplotlib.patches import Polygon
 import mysql.connector
@@ -25,9 +33,34 @@ DB_CONFIG = {
     'charset': 'utf8mb4',
     'connect_timeout': 600,  # 连接超时时间设为10分钟
     'raise_on_warnings': True,  # 显示警告信息
-    'use_pure': True  # 使用纯Python实现，避免C扩展可能的问题
+    # 有C扩展时默认使用C扩展（读取大量行时快得多）；C扩展有问题时可设置环境变量MYSQL_USE_PURE=1改用纯Python实现
+    'use_pure': os.environ.get('MYSQL_USE_PURE') == '1' or not getattr(mysql.connector, 'HAVE_CEXT', False)
 }
 
+# 流式读取时每次从服务器取的行数
+READ_CHUNK_SIZE = int(os.environ.get('EMOTION_READ_CHUNK', 10000))
+
+# 结果表的写入模式：replace先删除同一run_id的旧结果再写入，upsert按(run_id, poemId)覆盖已有的行
+SAVE_MODES = ('replace', 'upsert')
+
+# 写入方式：infile为临时CSV + LOAD DATA LOCAL INFILE，insert为多行INSERT，auto先试infile不可用时改用insert
+SAVE_METHODS = ('auto', 'infile', 'insert')
+
+# 不指定--run_id时使用的运行ID，每次运行覆盖上一次的结果
+DEFAULT_RUN_ID = 'default'
+
+# 多行INSERT每条语句包含的行数
+INSERT_ROWS_PER_STATEMENT = 1000
+
+# 拟合好的UMAP和KMeans模型保存在 models/<run_id>/v<版本号>/ 下
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+
+# 每次运行最多保留的模型版本数
+MODEL_KEEP_VERSIONS = int(os.environ.get('MODEL_KEEP_VERSIONS', 5))
+
+# auto: 有参数相同的已保存模型时只投影新增或变化的诗，否则全量拟合；refit: 全量拟合；transform: 只投影
+EMBEDDING_MODES = ('auto', 'refit', 'transform')
+
 # 情感映射字典
 EMOTION_MAP = {
     '思': [1, 0, 0, 0, 0],
@@ -52,24 +85,32 @@ EMOTION_COLORS = {
 
 def get_data_from_db():
     """从数据库获取情感数据"""
+    emotions = []
+    for _, chunk in iter_emotion_chunks():
+        emotions.extend(chunk)
+    print(f"成功获取到 {len(emotions)} 条数据")
+    return emotions
+
+def iter_emotion_chunks(chunk_size=READ_CHUNK_SIZE):
+    """用非缓冲游标分批读取情感数据，每批生成 (poemId列表, 情感字符串列表)
+
+    非缓冲游标不会在execute时把整个结果集读到客户端，每次fetchmany只从服务器
+    取chunk_size行，内存占用与表的大小无关。
+    """
     try:
         print("正在连接数据库...")
         print(f"连接配置: {DB_CONFIG}")
         conn = mysql.connector.connect(**DB_CONFIG)
-        print("数据库连接成功")
-        
-        cursor = conn.cursor()
-        print("正在执行查询...")
-        cursor.execute("SELECT COUNT(*) FROM emotion")  # 先获取数据总数
-        total_count = cursor.fetchone()[0]
-        print(f"emotion表中共有 {total_count} 条数据")
+        print(f"数据库连接成功（{'纯Python实现' if DB_CONFIG['use_pure'] else 'C扩展'}）")
         
+        cursor = conn.cursor(buffered=False)
         print("正在获取情感数据...")
-        cursor.execute("SELECT emotion FROM emotion")
-        data = cursor.fetchall()
-        print(f"成功获取到 {len(data)} 条数据")
-        
-        return [row[0] for row in data]
+        cursor.execute("SELECT poemId, emotion FROM emotion")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [row[0] for row in rows], [row[1] for row in rows]
     except mysql.connector.Error as err:
         print(f"数据库错误: {err}")
         if err.errno == 2003:  # Can't connect to MySQL server
@@ -91,13 +132,46 @@ def get_data_from_db():
         raise
     finally:
         if 'cursor' in locals():
-            cursor.close()
+            try:
+                cursor.close()
+            except mysql.connector.Error:
+                # 提前停止读取时非缓冲游标还有未读的行
+                pass
         if 'conn' in locals():
             conn.close()
             print("数据库连接已关闭")
 
-def convert_to_vector(emotion_str):
-    """将情感字符串转换为5维向量，多情感时第一个情感权重更大"""
+def stream_emotions(chunk_size=READ_CHUNK_SIZE):
+    """流式读取并编码情感数据，返回 (poemId数组, 情感字符串列表, 向量矩阵, 颜色矩阵)
+
+    每读到一批就交给encode_emotions编码，各批共用同一个解析缓存；相同的情感字符串
+    只保留一个对象，情感列表每行只占一个引用。
+    """
+    cache = {}
+    canonical = {}
+    poem_ids = []
+    emotions = []
+    vector_chunks = []
+    color_chunks = []
+    start = time.perf_counter()
+    for chunk_ids, chunk in iter_emotion_chunks(chunk_size):
+        vectors, colors = encode_emotions(chunk, cache)
+        poem_ids.extend(chunk_ids)
+        vector_chunks.append(vectors)
+        color_chunks.append(colors)
+        emotions.extend(canonical.setdefault(e, e) for e in chunk)
+        elapsed = time.perf_counter() - start
+        print(f"已读取 {len(emotions)} 条，{len(emotions) / max(elapsed, 1e-9):.0f} 条/秒")
+
+    elapsed = time.perf_counter() - start
+    print(f"成功获取到 {len(emotions)} 条数据（{len(canonical)} 种不同的情感），"
+          f"用时 {elapsed:.2f} 秒，{len(emotions) / max(elapsed, 1e-9):.0f} 条/秒")
+    if not vector_chunks:
+        return np.array(poem_ids, dtype=int), emotions, np.zeros((0, 5)), np.zeros((0, 4))
+    return np.array(poem_ids, dtype=int), emotions, np.concatenate(vector_chunks), np.concatenate(color_chunks)
+
+def convert_to_vector(emotion_str, verbose=True):
+    """将情感字符串转换为5维向量，多情感时第一个情感权重更大，verbose为False时不打印调试信息"""
     if not emotion_str or pd.isna(emotion_str):
         return np.zeros(5)
     
@@ -106,8 +180,9 @@ def convert_to_vector(emotion_str):
     emotions = [e.strip() for e in emotion_str.replace('，', ',').split(',')]
     
     # 打印调试信息
-    print(f"处理情感字符串: {emotion_str}")
-    print(f"分割后的情感列表: {emotions}")
+    if verbose:
+        print(f"处理情感字符串: {emotion_str}")
+        print(f"分割后的情感列表: {emotions}")
     
     # 计算权重
     total_emotions = len(emotions)
@@ -121,7 +196,8 @@ def convert_to_vector(emotion_str):
                 # 第一个情感使用较大权重，其他情感使用剩余权重
                 weight = first_weight if i == 0 else remaining_weight
                 vector += np.array(EMOTION_MAP[emotion]) * weight
-                print(f"情感 {emotion} 权重 {weight}: {np.array(EMOTION_MAP[emotion]) * weight}")
+                if verbose:
+                    print(f"情感 {emotion} 权重 {weight}: {np.array(EMOTION_MAP[emotion]) * weight}")
             else:
                 # 尝试处理可能的"怒/豪"格式
                 if '/' in emotion:
@@ -130,7 +206,8 @@ def convert_to_vector(emotion_str):
                         if part in EMOTION_MAP:
                             weight = first_weight if i == 0 else remaining_weight
                             vector += np.array(EMOTION_MAP[part]) * weight
-                            print(f"拆分情感 {part} 权重 {weight}: {np.array(EMOTION_MAP[part]) * weight}")
+                            if verbose:
+                                print(f"拆分情感 {part} 权重 {weight}: {np.array(EMOTION_MAP[part]) * weight}")
                 else:
                     print(f"警告：未知情感 '{emotion}'")
     
@@ -138,14 +215,57 @@ def convert_to_vector(emotion_str):
     vector_sum = np.sum(vector)
     if vector_sum > 0:
         vector = vector / vector_sum
-        print(f"最终归一化向量: {vector}")
+        if verbose:
+            print(f"最终归一化向量: {vector}")
     else:
         print("警告：向量和为0")
     
     return vector
 
-def reduce_dimensions(vectors, n_neighbors=5, min_dist=0.8, spread=3.0, scale=1.5, random_state=42):
-    """使用UMAP进行降维，参数参考topic_clustering.py"""
+def encode_emotions(emotions, cache=None):
+    """向量化编码情感字符串，一次得到向量矩阵和颜色矩阵
+
+    情感字符串的种类是有限的：先用pd.factorize把每行映射到不同字符串的编号，
+    每种字符串只解析一次，再按编号取出整行结果。cache为 情感字符串 -> (向量, 颜色)，
+    分批编码时传入同一个字典可以跨批复用解析结果。
+    """
+    if cache is None:
+        cache = {}
+    codes, uniques = pd.factorize(pd.Series(emotions, dtype=object))
+    for emotion_str in uniques:
+        if emotion_str not in cache:
+            cache[emotion_str] = (convert_to_vector(emotion_str, verbose=False), get_emotion_color(emotion_str))
+
+    # 空值被编码为-1，对应表的最后一行：零向量和默认灰色
+    vector_table = np.array([cache[e][0] for e in uniques] + [np.zeros(5)], dtype=float)
+    color_table = np.array([cache[e][1] for e in uniques] + [[0.5, 0.5, 0.5, 1.0]], dtype=float)
+    return vector_table[codes], color_table[codes]
+
+def benchmark_encoding(sizes=(8000, 1000000), random_state=42):
+    """对比逐行解析和向量化编码的耗时，数据为随机生成的情感字符串"""
+    samples = ['思', '乐', '哀', '喜', '怒', '豪', '怒/豪', '思,哀', '乐，喜', '哀, 思, 怒',
+               '豪,乐', '喜,思,哀', '怒/豪,思', '', None]
+    rng = np.random.default_rng(random_state)
+    for size in sizes:
+        emotions = [samples[i] for i in rng.integers(0, len(samples), size)]
+
+        # 原来的逐行路径：main中逐行转换向量，create_interactive_plot中逐行计算颜色
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            row_vectors = np.array([convert_to_vector(e) for e in emotions])
+            row_colors = np.array([get_emotion_color(e) for e in emotions])
+        row_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vectors, colors = encode_emotions(emotions)
+        encode_time = time.perf_counter() - start
+
+        same = np.allclose(row_vectors, vectors) and np.allclose(row_colors, colors)
+        print(f"{size} 行: 逐行解析 {row_time:.3f} 秒，向量化编码 {encode_time:.3f} 秒，"
+              f"加速 {row_time / max(encode_time, 1e-9):.1f} 倍，结果{'一致' if same else '不一致'}")
+
+def reduce_dimensions(vectors, n_neighbors=5, min_dist=0.8, spread=3.0, scale=1.5, random_state=42, models=None):
+    """使用UMAP进行降维，参数参考topic_clustering.py；models不为None时把拟合好的reducer和标准化参数存入models['umap']"""
     # 添加噪声以增加数据的可分性
     noise = np.random.normal(0, 0.01, vectors.shape)
     vectors_with_noise = vectors + noise
@@ -160,11 +280,20 @@ def reduce_dimensions(vectors, n_neighbors=5, min_dist=0.8, spread=3.0, scale=1.
     coords = reducer.fit_transform(vectors_with_noise)
     
     # 标准化并调整分散程度
-    coords = (coords - coords.mean(axis=0)) / coords.std(axis=0)
+    mean, std = coords.mean(axis=0), coords.std(axis=0)
+    coords = (coords - mean) / std
     coords *= scale  # 缩放因子
+    if models is not None:
+        models['umap'] = {'reducer': reducer, 'mean': mean, 'std': std, 'scale': scale}
     
     return coords
 
+def transform_umap(umap_model, vectors):
+    """用已保存的UMAP模型投影新的向量，与拟合时一样先加噪声，再按拟合时的参数标准化"""
+    noise = np.random.normal(0, 0.01, vectors.shape)
+    coords = umap_model['reducer'].transform(vectors + noise)
+    return (coords - umap_model['mean']) / umap_model['std'] * umap_model['scale']
+
 def create_smooth_boundary(points, expand_factor=1.5, padding=1.2, smoothness=0.3):
     """创建平滑的边界"""
     if len(points) < 4:
@@ -203,10 +332,51 @@ def create_smooth_boundary(points, expand_factor=1.5, padding=1.2, smoothness=0.
     except:
         return None
 
+def nearest_distances(grid_points, points):
+    """每个网格点到points中最近一点的距离
+
+    用KD树查询，内存只与网格点数和points的点数成正比，不需要构造
+    网格点数 x 点数 x 2 的距离矩阵
+    """
+    distances, _ = cKDTree(points).query(grid_points, k=1)
+    return distances
+
+def benchmark_background(sizes=(1000, 5000, 20000, 100000), grid_resolution=300, dense_limit_mb=2048, random_state=42):
+    """对比背景色计算中原来的全量距离矩阵和KD树查询的峰值内存与耗时"""
+    rng = np.random.default_rng(random_state)
+    xx, yy = np.meshgrid(np.linspace(-5, 5, grid_resolution), np.linspace(-5, 5, grid_resolution))
+    grid_points = np.c_[xx.ravel(), yy.ravel()]
+    for size in sizes:
+        points = rng.normal(0, 1.5, (size, 2))
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        tree_distances = nearest_distances(grid_points, points)
+        tree_time = time.perf_counter() - start
+        tree_peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+        line = f"N={size}, 网格 {grid_resolution}x{grid_resolution}: KD树 {tree_time:.3f} 秒，峰值 {tree_peak:.1f} MB"
+
+        # 原方法的距离矩阵大小：网格点数 x 点数 x 2 个float64
+        dense_mb = len(grid_points) * size * 2 * 8 / 1024 / 1024
+        if dense_mb <= dense_limit_mb:
+            tracemalloc.start()
+            start = time.perf_counter()
+            dense_distances = np.min(np.linalg.norm(grid_points[:, np.newaxis] - points, axis=2), axis=1)
+            dense_time = time.perf_counter() - start
+            dense_peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.stop()
+            same = np.allclose(dense_distances, tree_distances)
+            line += f"；全量距离矩阵 {dense_time:.3f} 秒，峰值 {dense_peak:.1f} MB，结果{'一致' if same else '不一致'}"
+        else:
+            line += f"；全量距离矩阵需要约 {dense_mb:.0f} MB，跳过"
+        print(line)
+
 def plot_clusters(coords, labels, kmeans_centers, output_file='emotion1/emotion_clusters.png', 
                   boundary_alpha=0.15, point_size=35, point_alpha=0.8, 
-                  jitter=0.02, color_scheme='Set2', expand_factor=1.5, padding=1.2, smoothness=0.3):
-    """绘制聚类结果"""
+                  jitter=0.02, color_scheme='Set2', expand_factor=1.5, padding=1.2, smoothness=0.3,
+                  grid_resolution=300):
+    """绘制聚类结果，grid_resolution为背景色网格每边的点数"""
     plt.figure(figsize=(16, 14))
     ax = plt.gca()
     
@@ -241,8 +411,8 @@ def plot_clusters(coords, labels, kmeans_centers, output_file='emotion1/emotion_
     # 创建网格以计算背景色
     x_min, x_max = coords[:, 0].min() - 1, coords[:, 0].max() + 1
     y_min, y_max = coords[:, 1].min() - 1, coords[:, 1].max() + 1
-    xx, yy = np.meshgrid(np.linspace(x_min, x_max, 300),
-                        np.linspace(y_min, y_max, 300))
+    xx, yy = np.meshgrid(np.linspace(x_min, x_max, grid_resolution),
+                        np.linspace(y_min, y_max, grid_resolution))
     grid_points = np.c_[xx.ravel(), yy.ravel()]
     
     # 计算每个网格点到各个聚类中心的距离
@@ -255,7 +425,7 @@ def plot_clusters(coords, labels, kmeans_centers, output_file='emotion1/emotion_
         color = colors[idx]
         
         # 计算网格点到当前聚类点的最小距离
-        distances = np.min(np.linalg.norm(grid_points[:, np.newaxis] - cluster_points, axis=2), axis=1)
+        distances = nearest_distances(grid_points, cluster_points)
         
         # 使用高斯核计算权重
         sigma = 0.8
@@ -359,8 +529,8 @@ def get_emotion_color(emotion_str):
     
     return color
 
-def create_interactive_plot(coords, labels, emotions, vectors, output_file='emotion1/emotion_clusters.png'):
-    """创建交互式散点图"""
+def create_interactive_plot(coords, labels, emotions, vectors, output_file='emotion1/emotion_clusters.png', point_colors=None):
+    """创建交互式散点图，point_colors为encode_emotions得到的颜色矩阵，不传时重新计算"""
     fig = plt.figure(figsize=(16, 14))
     ax = plt.gca()
     
@@ -372,7 +542,8 @@ def create_interactive_plot(coords, labels, emotions, vectors, output_file='emot
     ax.grid(True, linestyle='--', alpha=0.2)
     
     # 为每个点计算颜色
-    point_colors = np.array([get_emotion_color(emotion) for emotion in emotions])
+    if point_colors is None:
+        _, point_colors = encode_emotions(emotions)
     
     # 获取唯一的标签
     unique_labels = np.unique(labels)
@@ -509,6 +680,7 @@ def parse_args():
     parser.add_argument('--expand_factor', type=float, default=1.5, help='边界扩展因子')
     parser.add_argument('--padding', type=float, default=1.2, help='边界padding大小')
     parser.add_argument('--smoothness', type=float, default=0.3, help='边界平滑度')
+    parser.add_argument('--grid_resolution', type=int, default=300, help='聚类背景色网格每边的点数')
     
     # 颜色方案
     parser.add_argument('--color_scheme', type=str, default='Set2', 
@@ -517,19 +689,265 @@ def parse_args():
     
     # 输出文件
     parser.add_argument('--output', type=str, default='emotion1/emotion_clusters.png', help='输出文件路径')
+    parser.add_argument('--cluster_plot', type=str, default=None,
+                        help='同时用上面的点、边界和颜色参数绘制带聚类背景色的静态图，保存到该路径')
+    
+    # 读取数据库时每批的行数
+    parser.add_argument('--chunk_size', type=int, default=READ_CHUNK_SIZE, help='从数据库流式读取时每批的行数')
+    
+    # 全量拟合或增量投影
+    parser.add_argument('--embedding', type=str, default='auto', choices=EMBEDDING_MODES,
+                        help='auto: 有参数相同的已保存模型时只投影新增或变化的诗；refit: 全量拟合并保存新版本模型；'
+                             'transform: 只用已保存的模型投影新增或变化的诗')
+    
+    # 结果写入数据库的方式
+    parser.add_argument('--run_id', type=str, default=DEFAULT_RUN_ID,
+                        help='本次运行的ID，结果按(run_id, poemId)保存，同一ID重复运行时覆盖')
+    parser.add_argument('--save_mode', type=str, default='replace', choices=SAVE_MODES,
+                        help='replace: 先删除同一run_id的旧结果再写入；upsert: 只覆盖本次写入的诗')
+    parser.add_argument('--save_method', type=str, default='auto', choices=SAVE_METHODS,
+                        help='infile: 临时CSV + LOAD DATA LOCAL INFILE；insert: 多行INSERT；auto: 先试infile')
+    parser.add_argument('--save_benchmark', action='store_true', help='保存前用两种写入方式各写一遍，比较每秒写入行数')
+    
+    # 基准测试
+    parser.add_argument('--benchmark', action='store_true', help='对比逐行解析和向量化编码情感字符串的耗时后退出')
+    parser.add_argument('--benchmark_rows', type=str, default='8000,1000000', help='基准测试的数据行数，逗号分隔')
+    parser.add_argument('--benchmark_background', type=str, default=None,
+                        help='对比聚类背景色计算的峰值内存和耗时后退出，参数为逗号分隔的点数，如 1000,20000,100000')
     
     return parser.parse_args()
 
-def save_results_to_db(coords, labels, emotions, vectors):
-    """保存处理结果到数据库"""
+# 按列构建要写入的行，避免逐行逐元素访问numpy数组
+def build_result_rows(poem_ids, run_id, texts, vectors, coords, labels):
+    vectors = np.asarray(vectors, dtype=float)
+    coords = np.asarray(coords, dtype=float)
+    columns = [np.asarray(poem_ids).astype(int).tolist(), [run_id] * len(texts), list(texts)]
+    columns += [vectors[:, i].tolist() for i in range(vectors.shape[1])]
+    columns += [coords[:, 0].tolist(), coords[:, 1].tolist(), np.asarray(labels).astype(int).tolist()]
+    return list(zip(*columns))
+
+# 旧版本创建的结果表没有poemId和run_id列，补上这两列和唯一索引
+def ensure_key_columns(cursor, table):
+    cursor.execute("SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+                   "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (table,))
+    columns = {row[0] for row in cursor.fetchall()}
+    if 'poemId' not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN poemId INT AFTER id")
+    if 'run_id' not in columns:
+        # 旧数据归入默认运行，第一次以replace模式写入默认运行时被清理
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN run_id VARCHAR(64) NOT NULL DEFAULT '{DEFAULT_RUN_ID}' AFTER poemId")
+    cursor.execute("SELECT INDEX_NAME FROM information_schema.STATISTICS "
+                   "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = 'run_poem'", (table,))
+    if not cursor.fetchall():
+        cursor.execute(f"ALTER TABLE {table} ADD UNIQUE KEY run_poem (run_id, poemId)")
+
+# CSV中的一个字段：None写为不加引号的NULL，字符串加引号
+def csv_field(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    return repr(value)
+
+# 写临时CSV并用LOAD DATA LOCAL INFILE导入，upsert时用REPLACE覆盖唯一键相同的行
+def load_rows_infile(cursor, table, columns, rows, upsert=False):
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', newline='', delete=False) as f:
+        for row in rows:
+            f.write(','.join(map(csv_field, row)) + '\n')
+        path = f.name
+    try:
+        # ESCAPED BY ''：不处理反斜杠转义，字段内容按原样导入
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE %s {'REPLACE' if upsert else ''} INTO TABLE {table} "
+            "CHARACTER SET utf8mb4 FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '' "
+            f"LINES TERMINATED BY '\\n' ({', '.join(columns)})",
+            (path.replace('\\', '/'),)
+        )
+    finally:
+        os.remove(path)
+
+# 多行INSERT写入，upsert时用REPLACE覆盖唯一键相同的行
+def insert_rows(cursor, table, columns, rows, upsert=False):
+    sql = f"{'REPLACE' if upsert else 'INSERT'} INTO {table} ({', '.join(columns)}) VALUES "
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    for i in range(0, len(rows), INSERT_ROWS_PER_STATEMENT):
+        batch = rows[i:i + INSERT_ROWS_PER_STATEMENT]
+        cursor.execute(sql + ', '.join([placeholders] * len(batch)), [value for row in batch for value in row])
+
+# 在一个事务中写入一次运行的结果，返回 (实际使用的写入方式, 用时)
+def write_result_rows(conn, table, columns, rows, run_id, mode='replace', method='auto'):
+    methods = ['infile', 'insert'] if method == 'auto' else [method]
+    for index, current in enumerate(methods):
+        cursor = conn.cursor()
+        start = time.perf_counter()
+        try:
+            if mode == 'replace':
+                cursor.execute(f"DELETE FROM {table} WHERE run_id = %s", (run_id,))
+            if current == 'infile':
+                load_rows_infile(cursor, table, columns, rows, upsert=mode == 'upsert')
+            else:
+                insert_rows(cursor, table, columns, rows, upsert=mode == 'upsert')
+            conn.commit()
+        except mysql.connector.Error as e:
+            conn.rollback()
+            if index + 1 < len(methods):
+                print(f"LOAD DATA LOCAL INFILE 不可用（{e}），改用多行INSERT")
+                continue
+            raise
+        finally:
+            cursor.close()
+        elapsed = time.perf_counter() - start
+        print(f"已用{current}方式写入 {len(rows)} 条结果到{table}（{mode}，run_id={run_id}），"
+              f"用时 {elapsed:.2f} 秒，{len(rows) / max(elapsed, 1e-9):.0f} 条/秒")
+        return current, elapsed
+
+# 基准测试：用两种写入方式各写一遍到临时的run_id，比较每秒写入行数后删除
+def benchmark_save(conn, table, columns, rows, run_id):
+    for method in ('infile', 'insert'):
+        bench_run_id = f"{run_id}-benchmark-{method}"[:64]
+        bench_rows = [(row[0], bench_run_id) + tuple(row[2:]) for row in rows]
+        try:
+            write_result_rows(conn, table, columns, bench_rows, bench_run_id, 'replace', method)
+        except mysql.connector.Error as e:
+            print(f"{method}方式写入失败: {e}")
+        cursor = conn.cursor()
+        cursor.execute(f"DELETE FROM {table} WHERE run_id = %s", (bench_run_id,))
+        conn.commit()
+        cursor.close()
+
+# 结果表的列，poemId和run_id为唯一键
+RESULT_COLUMNS = ['poemId', 'run_id', 'original_emotion', 'vector_dim1', 'vector_dim2', 'vector_dim3',
+                  'vector_dim4', 'vector_dim5', 'umap_x', 'umap_y', 'cluster_label']
+
+# 列出某次运行已保存的模型版本号（升序）
+def model_versions(run_id):
+    directory = os.path.join(MODEL_DIR, run_id)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(int(name[1:]) for name in os.listdir(directory) if re.fullmatch(r'v\d+', name))
+
+def model_path(run_id, version, name):
+    return os.path.join(MODEL_DIR, run_id, f"v{version:04d}", name)
+
+# 保存全量拟合得到的模型和每首诗的结果，返回新的版本号；只保留最近MODEL_KEEP_VERSIONS个版本
+def save_model(run_id, model, state):
+    versions = model_versions(run_id)
+    version = versions[-1] + 1 if versions else 1
+    os.makedirs(os.path.dirname(model_path(run_id, version, 'model.pkl')), exist_ok=True)
+    model = dict(model, version=version, created_at=time.time())
+    with open(model_path(run_id, version, 'model.pkl'), 'wb') as f:
+        pickle.dump(model, f)
+    save_state(run_id, version, state)
+    for old in versions[:max(0, len(versions) + 1 - MODEL_KEEP_VERSIONS)]:
+        shutil.rmtree(os.path.dirname(model_path(run_id, old, 'model.pkl')), ignore_errors=True)
+    print(f"已保存模型 {run_id} 版本 v{version:04d}")
+    return version
+
+# 保存每首诗的输入和结果（增量模式据此判断哪些诗是新增或变化的）
+def save_state(run_id, version, state):
+    path = model_path(run_id, version, 'state.pkl')
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+# 读取模型和每首诗的结果，version为None时读取最新版本，没有时返回None
+def load_model(run_id, version=None):
+    versions = model_versions(run_id)
+    if not versions:
+        return None
+    version = versions[-1] if version is None else version
+    with open(model_path(run_id, version, 'model.pkl'), 'rb') as f:
+        model = pickle.load(f)
+    with open(model_path(run_id, version, 'state.pkl'), 'rb') as f:
+        state = pickle.load(f)
+    return model, state
+
+# 选择本次运行的方式：refit全量拟合，transform只投影新增或变化的诗
+def choose_embedding(mode, run_id, params):
+    if mode == 'refit':
+        return 'refit', None
+    loaded = load_model(run_id)
+    if loaded is None:
+        if mode == 'transform':
+            raise ValueError(f"运行 {run_id} 还没有保存的模型，请先用 --embedding refit 全量拟合")
+        print(f"运行 {run_id} 还没有保存的模型，进行全量拟合")
+        return 'refit', None
+    if mode == 'auto' and loaded[0]['params'] != params:
+        print(f"参数与已保存的模型 v{loaded[0]['version']:04d} 不同，进行全量拟合")
+        return 'refit', None
+    print(f"使用已保存的模型 v{loaded[0]['version']:04d}（{time.strftime('%Y-%m-%d %H:%M', time.localtime(loaded[0]['created_at']))} 拟合）")
+    return 'transform', loaded
+
+# 找出新增或输入发生变化的诗，返回它们在本次输入中的下标
+def find_changed(state, poem_ids, inputs):
+    known = dict(zip(state['poem_ids'].tolist(), state['inputs']))
+    missing = object()
+    return np.array([i for i, (poem_id, text) in enumerate(zip(np.asarray(poem_ids).tolist(), inputs))
+                     if known.get(poem_id, missing) != text], dtype=int)
+
+# 从已保存的结果中删除本次输入里已经没有的诗，返回被删除的poemId
+def drop_missing(state, poem_ids):
+    keep = np.isin(state['poem_ids'], np.asarray(poem_ids))
+    removed = state['poem_ids'][~keep]
+    if len(removed):
+        state['inputs'] = [text for text, kept in zip(state['inputs'], keep) if kept]
+        for key in ('poem_ids', 'coords', 'labels', 'vectors'):
+            state[key] = np.asarray(state[key])[keep]
+    return removed
+
+# 把新投影的诗合并到已保存的结果中：已有的诗覆盖，新诗追加在末尾；arrays为coords、labels、vectors等按诗排列的数组
+def update_state(state, poem_ids, inputs, **arrays):
+    poem_ids = np.asarray(poem_ids)
+    index = {poem_id: i for i, poem_id in enumerate(state['poem_ids'].tolist())}
+    appended = []
+    for j, poem_id in enumerate(poem_ids.tolist()):
+        i = index.get(poem_id)
+        if i is None:
+            appended.append(j)
+            continue
+        state['inputs'][i] = inputs[j]
+        for key, values in arrays.items():
+            state[key][i] = values[j]
+    if appended:
+        state['poem_ids'] = np.concatenate([state['poem_ids'], poem_ids[appended]])
+        state['inputs'] = list(state['inputs']) + [inputs[j] for j in appended]
+        for key, values in arrays.items():
+            state[key] = np.concatenate([state[key], np.asarray(values)[appended]])
+    return state
+
+def delete_results_from_db(poem_ids, run_id=DEFAULT_RUN_ID):
+    """删除某次运行中已经不存在的诗的结果"""
     try:
         conn = mysql.connector.connect(**DB_CONFIG)
         cursor = conn.cursor()
+        poem_ids = [int(poem_id) for poem_id in poem_ids]
+        for i in range(0, len(poem_ids), INSERT_ROWS_PER_STATEMENT):
+            batch = poem_ids[i:i + INSERT_ROWS_PER_STATEMENT]
+            cursor.execute(f"DELETE FROM emotion_visualization WHERE run_id = %s AND poemId IN ({', '.join(['%s'] * len(batch))})",
+                           [run_id] + batch)
+        conn.commit()
+        cursor.close()
+        print(f"已从数据库删除{len(poem_ids)}首已不存在的诗的结果。")
+    except Exception as e:
+        print(f"数据库操作出错: {str(e)}")
+        raise e
+    finally:
+        if 'conn' in locals():
+            conn.close()
+
+def save_results_to_db(coords, labels, emotions, vectors, poem_ids=None, run_id=DEFAULT_RUN_ID,
+                       mode='replace', method='auto', benchmark=False):
+    """保存处理结果到数据库，同一run_id重复运行时覆盖而不是追加"""
+    try:
+        conn = mysql.connector.connect(**DB_CONFIG, allow_local_infile=method != 'insert' or benchmark)
+        cursor = conn.cursor()
         
         # 创建新表来存储降维和聚类结果
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS emotion_visualization (
                 id INT AUTO_INCREMENT PRIMARY KEY,
+                poemId INT,
+                run_id VARCHAR(64) NOT NULL DEFAULT 'default',
                 original_emotion VARCHAR(255),
                 vector_dim1 FLOAT,
                 vector_dim2 FLOAT,
@@ -539,56 +957,27 @@ def save_results_to_db(coords, labels, emotions, vectors):
                 umap_x FLOAT,
                 umap_y FLOAT,
                 cluster_label INT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE KEY run_poem (run_id, poemId)
             )
         """)
+        ensure_key_columns(cursor, 'emotion_visualization')
+        cursor.close()
         
-        # 准备插入数据
-        insert_query = """
-            INSERT INTO emotion_visualization 
-            (original_emotion, vector_dim1, vector_dim2, vector_dim3, vector_dim4, vector_dim5, 
-             umap_x, umap_y, cluster_label)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        # 构建数据
-        data_to_insert = []
-        for i in range(len(emotions)):
-            data_to_insert.append((
-                emotions[i],
-                float(vectors[i][0]),
-                float(vectors[i][1]),
-                float(vectors[i][2]),
-                float(vectors[i][3]),
-                float(vectors[i][4]),
-                float(coords[i][0]),
-                float(coords[i][1]),
-                int(labels[i])
-            ))
-        
-        # 分批插入数据，每批1000条
-        batch_size = 1000
-        total_batches = (len(data_to_insert) + batch_size - 1) // batch_size
-        
-        for i in range(0, len(data_to_insert), batch_size):
-            batch = data_to_insert[i:i + batch_size]
-            try:
-                cursor.executemany(insert_query, batch)
-                conn.commit()
-                print(f"已插入第 {i//batch_size + 1}/{total_batches} 批数据，共 {len(batch)} 条")
-            except Exception as e:
-                print(f"插入第 {i//batch_size + 1} 批数据时出错: {str(e)}")
-                conn.rollback()
-                raise e
+        # 构建数据，没有poemId时按行号编号
+        if poem_ids is None:
+            poem_ids = np.arange(1, len(emotions) + 1)
+        rows = build_result_rows(poem_ids, run_id, emotions, vectors, coords, labels)
         
-        print(f"成功将{len(data_to_insert)}条处理结果保存到数据库。")
+        if benchmark:
+            benchmark_save(conn, 'emotion_visualization', RESULT_COLUMNS, rows, run_id)
+        write_result_rows(conn, 'emotion_visualization', RESULT_COLUMNS, rows, run_id, mode, method)
+        print(f"成功将{len(rows)}条处理结果保存到数据库。")
         
     except Exception as e:
         print(f"数据库操作出错: {str(e)}")
         raise e
     finally:
-        if 'cursor' in locals():
-            cursor.close()
         if 'conn' in locals():
             conn.close()
 
@@ -596,36 +985,105 @@ def main():
     # 解析命令行参数
     args = parse_args()
     
-    print("正在从数据库获取数据...")
-    emotions = get_data_from_db()
-    
-    print("正在转换情感数据为向量...")
-    vectors = np.array([convert_to_vector(e) for e in emotions])
-    
-    print("正在进行降维...")
-    coords = reduce_dimensions(
-        vectors, 
-        n_neighbors=args.n_neighbors,
-        min_dist=args.min_dist,
-        spread=args.spread,
-        scale=args.scale
-    )
-    
-    print("正在进行聚类...")
-    kmeans = KMeans(
-        n_clusters=args.n_clusters, 
-        random_state=42,
-        n_init=50,
-        max_iter=1000
-    )
-    labels = kmeans.fit_predict(coords)
-    
-    # 保存结果到数据库
-    print("正在保存结果到数据库...")
-    save_results_to_db(coords, labels, emotions, vectors)
+    if args.benchmark:
+        benchmark_encoding([int(n) for n in args.benchmark_rows.split(',') if n.strip()])
+        return
+    if args.benchmark_background:
+        benchmark_background([int(n) for n in args.benchmark_background.split(',') if n.strip()],
+                             grid_resolution=args.grid_resolution)
+        return
+    
+    print("正在从数据库读取并转换情感数据...")
+    poem_ids, emotions, vectors, point_colors = stream_emotions(args.chunk_size)
+    
+    params = {
+        'n_neighbors': args.n_neighbors,
+        'min_dist': args.min_dist,
+        'spread': args.spread,
+        'scale': args.scale,
+        'n_clusters': args.n_clusters
+    }
+    embedding, loaded = choose_embedding(args.embedding, args.run_id, params)
+    
+    if embedding == 'transform':
+        model, state = loaded
+        kmeans = model['kmeans']
+        changed = find_changed(state, poem_ids, emotions)
+        removed = drop_missing(state, poem_ids)
+        print(f"增量模式: {len(emotions)} 首诗中有 {len(changed)} 首新增或变化，{len(removed)} 首已删除")
+        if len(removed):
+            delete_results_from_db(removed, run_id=args.run_id)
+        if len(changed):
+            start = time.perf_counter()
+            new_coords = transform_umap(model['umap'], vectors[changed])
+            new_labels = kmeans.predict(new_coords)
+            print(f"投影和聚类完成，用时 {time.perf_counter() - start:.2f} 秒")
+            
+            # 只写入新增或变化的诗
+            print("正在将新增或变化的结果保存到数据库...")
+            changed_emotions = [emotions[i] for i in changed]
+            save_results_to_db(
+                new_coords,
+                new_labels,
+                changed_emotions,
+                vectors[changed],
+                poem_ids=poem_ids[changed],
+                run_id=args.run_id,
+                mode='upsert',
+                method=args.save_method
+            )
+            update_state(state, poem_ids[changed], changed_emotions,
+                         coords=new_coords, labels=new_labels, vectors=vectors[changed])
+        if len(changed) or len(removed):
+            save_state(args.run_id, model['version'], state)
+        
+        # 用已保存的全部结果生成可视化
+        coords, labels, emotions, vectors = state['coords'], state['labels'], state['inputs'], state['vectors']
+        point_colors = None
+    else:
+        print("正在进行降维（全量拟合）...")
+        models = {}
+        coords = reduce_dimensions(
+            vectors, 
+            n_neighbors=args.n_neighbors,
+            min_dist=args.min_dist,
+            spread=args.spread,
+            scale=args.scale,
+            models=models
+        )
+        
+        print("正在进行聚类...")
+        kmeans = KMeans(
+            n_clusters=args.n_clusters, 
+            random_state=42,
+            n_init=50,
+            max_iter=1000
+        )
+        labels = kmeans.fit_predict(coords)
+        
+        # 保存结果到数据库
+        print("正在保存结果到数据库...")
+        save_results_to_db(
+            coords,
+            labels,
+            emotions,
+            vectors,
+            poem_ids=poem_ids,
+            run_id=args.run_id,
+            mode=args.save_mode,
+            method=args.save_method,
+            benchmark=args.save_benchmark
+        )
+        
+        # 保存模型，之后新增或变化的诗可以只做投影
+        save_model(
+            args.run_id,
+            {'params': params, 'umap': models['umap'], 'kmeans': kmeans},
+            {'poem_ids': poem_ids, 'inputs': emotions, 'coords': coords, 'labels': labels, 'vectors': vectors}
+        )
     
-    # 后处理：增加聚类中心之间的距离
-    centers = kmeans.cluster_centers_
+    # 后处理：增加聚类中心之间的距离（在副本上调整，不改变保存的KMeans模型）
+    centers = kmeans.cluster_centers_.copy()
     
     # 计算中心点之间的距离
     center_distances = []
@@ -649,13 +1107,32 @@ def main():
             if np.linalg.norm(direction) > 0:
                 centers[i] += direction * 0.8
     
+    if args.cluster_plot:
+        print("正在生成聚类背景图...")
+        plot_clusters(
+            coords,
+            labels,
+            centers,
+            output_file=args.cluster_plot,
+            boundary_alpha=args.boundary_alpha,
+            point_size=args.point_size,
+            point_alpha=args.point_alpha,
+            jitter=args.jitter,
+            color_scheme=args.color_scheme,
+            expand_factor=args.expand_factor,
+            padding=args.padding,
+            smoothness=args.smoothness,
+            grid_resolution=args.grid_resolution
+        )
+    
     print("正在生成交互式可视化...")
     create_interactive_plot(
         coords, 
         labels, 
         emotions, 
         vectors,
-        output_file=args.output
+        output_file=args.output,
+        point_colors=point_colors
     )
     
     print(f"处理完成！共处理了{len(vectors)}首诗的情感分布。")
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+
+# 订阅配置，可通过环境变量覆盖
+HUB_CONFIG = {
+    'queue_size': int(os.environ.get('EVENT_QUEUE_SIZE', 1000))  # 每个客户端最多积压的消息数
+}
+
+# 订阅所有任务事件的主题
+GLOBAL_TOPIC = '*'
+
+
+class Subscriber:
+    """一个客户端连接的订阅
+
+    消息放入有上限的队列，由独立的发送任务逐条发给客户端。客户端接收慢时
+    只会积压在自己的队列中，队列满后丢弃最旧的消息，不会拖慢发布方和其他客户端；
+    丢弃的条数会在之后以一条events_dropped消息告知客户端。
+    """
+
+    def __init__(self, hub, websocket, queue_size):
+        self.hub = hub
+        self.websocket = websocket
+        self.topics = set()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.sent = 0
+        self._unreported = 0
+        self._task = asyncio.create_task(self._send_loop())
+
+    def offer(self, payload):
+        """放入一条已序列化的消息，不会等待"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            self._unreported += 1
+        self.queue.put_nowait(payload)
+
+    async def _send_loop(self):
+        try:
+            while True:
+                payload = await self.queue.get()
+                if self._unreported:
+                    count, self._unreported = self._unreported, 0
+                    await self.websocket.send(json.dumps({'type': 'events_dropped', 'count': count}))
+                await self.websocket.send(payload)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # 发送失败，假定连接已关闭
+            self.hub.remove(self.websocket)
+
+    def close(self):
+        self._task.cancel()
+
+
+class EventHub:
+    """任务事件的发布/订阅中心
+
+    客户端订阅某个任务（主题为任务ID）或全局主题GLOBAL_TOPIC。每条事件只序列化
+    一次，然后把同一个字符串放入所有订阅者的队列。
+    """
+
+    def __init__(self, queue_size=1000):
+        self.queue_size = queue_size
+        self._subscribers = {}  # websocket -> Subscriber
+        self._topics = {}       # 主题 -> set(Subscriber)
+        self._stats = {'published': 0, 'delivered': 0, 'serialize_time': 0.0}
+
+    def subscribe(self, websocket, topic=GLOBAL_TOPIC):
+        subscriber = self._subscribers.get(websocket)
+        if subscriber is None:
+            subscriber = Subscriber(self, websocket, self.queue_size)
+            self._subscribers[websocket] = subscriber
+        subscriber.topics.add(topic)
+        self._topics.setdefault(topic, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, websocket, topic):
+        subscriber = self._subscribers.get(websocket)
+        if subscriber is None:
+            return
+        subscriber.topics.discard(topic)
+        subscribers = self._topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._topics[topic]
+
+    def remove(self, websocket):
+        """客户端断开：取消它的所有订阅"""
+        subscriber = self._subscribers.pop(websocket, None)
+        if subscriber is None:
+            return
+        for topic in list(subscriber.topics):
+            subscribers = self._topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._topics[topic]
+        subscriber.close()
+
+    def publish(self, topic, event):
+        """序列化一次事件并发给该主题和全局主题的所有订阅者，返回收到的订阅者数"""
+        start = time.perf_counter()
+        payload = json.dumps(event)
+        self._stats['serialize_time'] += time.perf_counter() - start
+        return self.publish_raw(topic, payload)
+
+    def publish_raw(self, topic, payload):
+        """发布已经序列化好的消息"""
+        targets = set(self._topics.get(topic, ()))
+        if topic != GLOBAL_TOPIC:
+            targets.update(self._topics.get(GLOBAL_TOPIC, ()))
+        for subscriber in targets:
+            subscriber.offer(payload)
+        self._stats['published'] += 1
+        self._stats['delivered'] += len(targets)
+        return len(targets)
+
+    def channel(self, topic):
+        """返回一个只有send方法的对象，发给它的消息会发布到topic"""
+        return TopicChannel(self, topic)
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats['serialize_time'] = round(stats['serialize_time'], 3)
+        stats.update({
+            'subscribers': len(self._subscribers),
+            'topics': len(self._topics),
+            'queued': sum(s.queue.qsize() for s in self._subscribers.values()),
+            'dropped': sum(s.dropped for s in self._subscribers.values())
+        })
+        return stats
+
+
+class TopicChannel:
+    """代替单个websocket传给run_command，消息发布到一个主题"""
+
+    def __init__(self, hub, topic):
+        self.hub = hub
+        self.topic = topic
+
+    async def send(self, payload):
+        self.hub.publish_raw(self.topic, payload)
+
+
+# 压力测试用的客户端替身，delay模拟网络慢的客户端
+class FakeWebSocket:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.received = 0
+        self.dropped_notices = 0
+
+    async def send(self, payload):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if payload.startswith('{"type": "events_dropped"'):
+            self.dropped_notices += 1
+        else:
+            self.received += 1
+
+
+# 压力测试：大量客户端同时订阅，其中一部分接收很慢，检查快客户端是否受影响
+async def load_test(subscribers=50, slow=5, events=20000, queue_size=1000, slow_delay=0.01):
+    hub = EventHub(queue_size=queue_size)
+    fast_clients = [FakeWebSocket() for _ in range(subscribers - slow)]
+    slow_clients = [FakeWebSocket(slow_delay) for _ in range(slow)]
+    for i, client in enumerate(fast_clients + slow_clients):
+        # 一半订阅全局主题，一半只订阅这个任务
+        hub.subscribe(client, GLOBAL_TOPIC if i % 2 else 'job-1')
+
+    event = {'type': 'output_batch', 'lines': [f'line {i}' for i in range(20)], 'scriptId': 'job-1'}
+    start = time.perf_counter()
+    publish_time = 0.0
+    for i in range(events):
+        t = time.perf_counter()
+        hub.publish('job-1', event)
+        publish_time += time.perf_counter() - t
+        if i % 100 == 0:
+            # 给发送任务运行的机会，模拟真实的事件间隔
+            await asyncio.sleep(0)
+
+    # 等待快客户端收完
+    while any(c.received < events for c in fast_clients) and time.perf_counter() - start < 60:
+        await asyncio.sleep(0.01)
+    fast_done = time.perf_counter() - start
+
+    stats = hub.stats()
+    print(f"订阅者 {subscribers} 个（其中慢客户端 {slow} 个），发布 {events} 条事件")
+    print(f"发布总耗时 {publish_time * 1000:.1f} ms，平均每条 {publish_time / events * 1e6:.1f} us"
+          f"（序列化 {stats['serialize_time'] * 1000:.1f} ms，共序列化 {stats['published']} 次）")
+    print(f"快客户端全部收完用时 {fast_done:.2f} 秒，"
+          f"最少收到 {min(c.received for c in fast_clients)}/{events} 条")
+    print(f"慢客户端最多收到 {max(c.received for c in slow_clients) if slow_clients else 0} 条，"
+          f"丢弃 {stats['dropped']} 条，队列积压 {stats['queued']} 条（上限 {queue_size}/客户端）")
+
+    for client in fast_clients + slow_clients:
+        hub.remove(client)
+    await asyncio.sleep(0)
+    ok = all(c.received == events for c in fast_clients)
+    print("压力测试通过" if ok else "压力测试失败：快客户端受到了影响")
+    return ok
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='任务事件发布/订阅压力测试')
+    parser.add_argument('--subscribers', type=int, default=50, help='同时订阅的客户端数')
+    parser.add_argument('--slow', type=int, default=5, help='其中接收很慢的客户端数')
+    parser.add_argument('--events', type=int, default=20000, help='发布的事件数')
+    parser.add_argument('--queue_size', type=int, default=1000, help='每个客户端的队列上限')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    asyncio.run(load_test(args.subscribers, args.slow, args.events, args.queue_size))
@@ -0,0 +1,295 @@
+import os
+import re
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+import collections
+
+try:
+    import resource
+except ImportError:
+    # Windows上没有resource模块，不设置资源限制
+    resource = None
+
+# 调度配置，可通过环境变量覆盖
+SCHEDULER_CONFIG = {
+    'max_running': int(os.environ.get('JOB_MAX_RUNNING', max(1, (os.cpu_count() or 2) // 2))),  # 同时运行的任务总数
+    'default_type_limit': int(os.environ.get('JOB_MAX_PER_TYPE', 2))                          # 每种脚本默认的并发上限
+}
+
+# 计算量大的脚本单独限制并发数（按脚本文件名，不含.py）
+TYPE_LIMITS = {
+    'topic_clustering': 1,        # t-SNE + UMAP
+    'emotion_visualization': 1
+}
+
+# 每个任务的资源限制，None表示不限制
+RESOURCE_LIMITS = {
+    'cpu_seconds': int(os.environ['JOB_CPU_SECONDS']) if os.environ.get('JOB_CPU_SECONDS') else None,
+    'memory_mb': int(os.environ['JOB_MEMORY_MB']) if os.environ.get('JOB_MEMORY_MB') else None,
+    'nice': int(os.environ.get('JOB_NICE', 5))
+}
+
+# 优先级名称，数值越小越先运行
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+
+# 内存中保留的已结束任务数
+FINISHED_HISTORY = 200
+
+FINISHED_STATES = ('completed', 'error', 'cancelled', 'terminated')
+
+
+# 从命令中提取任务类型：第一个.py脚本的文件名，否则为命令的第一个词
+def command_type(command):
+    match = re.search(r'([\w\-.]+)\.py\b', command)
+    if match:
+        return match.group(1)
+    parts = command.split()
+    return os.path.basename(parts[0].strip('"\'')) if parts else 'unknown'
+
+
+# 解析优先级，支持名称或整数
+def parse_priority(priority):
+    if priority is None:
+        return PRIORITIES['normal']
+    if isinstance(priority, str) and priority in PRIORITIES:
+        return PRIORITIES[priority]
+    return int(priority)
+
+
+# 生成在子进程中设置资源限制的preexec_fn，不支持或不需要限制时返回None
+def make_preexec_fn(cpu_seconds=None, memory_mb=None, nice=0):
+    if resource is None or not (cpu_seconds or memory_mb or nice):
+        return None
+
+    def preexec():
+        if cpu_seconds:
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+        if memory_mb:
+            limit = memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        if nice:
+            os.nice(nice)
+    return preexec
+
+
+class Job:
+    """一个脚本运行任务及其排队、运行、结束的时间
+
+    id每次提交都重新生成；script_id是客户端给的脚本标识（如按钮ID），
+    同一个脚本多次提交时script_id相同。
+    """
+
+    def __init__(self, command, script_id=None, priority=1, notify=None):
+        self.id = str(uuid.uuid4())
+        self.script_id = script_id or self.id
+        self.command = command
+        self.type = command_type(command)
+        self.priority = priority
+        self.notify = notify
+        self.status = 'queued'
+        self.position = None
+        self.queued_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.exit_code = None
+        self.task = None
+
+    def to_dict(self):
+        now = time.time()
+        return {
+            'id': self.id,
+            'script_id': self.script_id,
+            'command': self.command,
+            'type': self.type,
+            'priority': self.priority,
+            'status': self.status,
+            'position': self.position,
+            'queued_at': self.queued_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'wait_time': round((self.started_at or self.finished_at or now) - self.queued_at, 3),
+            'run_time': round((self.finished_at or now) - self.started_at, 3) if self.started_at else None,
+            'exit_code': self.exit_code
+        }
+
+
+class JobScheduler:
+    """带并发上限的任务调度器
+
+    任务按(优先级, 提交顺序)排队。同时运行的任务数不超过max_running，
+    同一类型（同一个脚本）的任务数不超过该类型的上限；排在前面但类型已满的任务
+    不会挡住后面其他类型的任务。排队中的任务可以取消，队列变化时通过任务的
+    notify回调通知其最新位置。
+    """
+
+    def __init__(self, max_running=2, default_type_limit=2, type_limits=None, resource_limits=None):
+        self.max_running = max_running
+        self.default_type_limit = default_type_limit
+        self.type_limits = dict(TYPE_LIMITS if type_limits is None else type_limits)
+        self.resource_limits = dict(RESOURCE_LIMITS if resource_limits is None else resource_limits)
+        self._queue = []   # 排队中的任务，按(优先级, 序号)排序
+        self._seq = 0
+        self._running = {}  # job_id -> Job
+        self._finished = collections.OrderedDict()
+        self._runners = {}  # job_id -> (runner, 序号)
+
+    def type_limit(self, job_type):
+        return self.type_limits.get(job_type, self.default_type_limit)
+
+    def preexec_fn(self):
+        """运行任务时传给子进程的资源限制函数"""
+        return make_preexec_fn(**self.resource_limits)
+
+    def submit(self, command, runner, script_id=None, priority=None, notify=None):
+        """提交任务；runner(job)是实际运行任务的协程函数，返回退出码"""
+        job = Job(command, script_id, parse_priority(priority), notify)
+        self._seq += 1
+        self._runners[job.id] = (runner, self._seq)
+        self._queue.append(job)
+        self._queue.sort(key=lambda j: (j.priority, self._runners[j.id][1]))
+        self._dispatch()
+        return job
+
+    def cancel(self, job_id):
+        """取消排队中的任务，任务已开始或不存在时返回False"""
+        for job in self._queue:
+            if job.id == job_id:
+                self._queue.remove(job)
+                self._runners.pop(job.id, None)
+                self._finish(job, 'cancelled')
+                self._dispatch()
+                return True
+        return False
+
+    def get(self, job_id):
+        for job in self._queue:
+            if job.id == job_id:
+                return job
+        return self._running.get(job_id) or self._finished.get(job_id)
+
+    def find(self, script_id, include_finished=False):
+        """按脚本标识查找任务，按提交顺序返回"""
+        return sorted((job for job in self.jobs(include_finished) if job.script_id == script_id),
+                      key=lambda job: job.queued_at)
+
+    def jobs(self, include_finished=False):
+        jobs = list(self._running.values()) + list(self._queue)
+        if include_finished:
+            jobs += list(self._finished.values())
+        return jobs
+
+    def _running_of_type(self, job_type):
+        return sum(1 for job in self._running.values() if job.type == job_type)
+
+    def _dispatch(self):
+        # 依次启动排在最前面、且所属类型未达上限的任务
+        while len(self._running) < self.max_running:
+            job = next((j for j in self._queue
+                        if self._running_of_type(j.type) < self.type_limit(j.type)), None)
+            if job is None:
+                break
+            self._queue.remove(job)
+            job.status = 'running'
+            job.position = None
+            job.started_at = time.time()
+            self._running[job.id] = job
+            runner, _ = self._runners.pop(job.id)
+            job.task = asyncio.create_task(self._run(job, runner))
+            self._notify(job)
+
+        # 通知排队中的任务它们的最新位置
+        for position, job in enumerate(self._queue, 1):
+            if job.position != position:
+                job.position = position
+                self._notify(job)
+
+    async def _run(self, job, runner):
+        status = 'error'
+        try:
+            job.exit_code = await runner(job)
+            if job.status == 'terminated':
+                status = 'terminated'
+            else:
+                status = 'completed' if job.exit_code == 0 else 'error'
+        except asyncio.CancelledError:
+            status = 'terminated'
+            raise
+        except Exception as e:
+            print(f"任务 {job.id} 运行出错: {str(e)}")
+        finally:
+            self._running.pop(job.id, None)
+            self._finish(job, status)
+            self._dispatch()
+
+    def _finish(self, job, status):
+        job.status = status
+        job.position = None
+        job.finished_at = time.time()
+        self._finished[job.id] = job
+        while len(self._finished) > FINISHED_HISTORY:
+            self._finished.popitem(last=False)
+        self._notify(job)
+
+    def _notify(self, job):
+        if job.notify is None:
+            return
+        try:
+            result = job.notify(job)
+            if asyncio.iscoroutine(result):
+                asyncio.ensure_future(result)
+        except Exception as e:
+            print(f"通知任务状态失败: {str(e)}")
+
+    def stats(self):
+        return {
+            'running': len(self._running),
+            'queued': len(self._queue),
+            'max_running': self.max_running,
+            'type_limits': self.type_limits,
+            'default_type_limit': self.default_type_limit,
+            'resource_limits': self.resource_limits
+        }
+
+
+# 自检：用同一个脚本标识连续提交多次，检查每次提交都能运行完，且任务ID互不相同
+async def check_duplicate_submits(count=3):
+    scheduler = JobScheduler(max_running=2, type_limits={'check': 1}, resource_limits={})
+    ran = []
+
+    async def runner(job):
+        ran.append(job.id)
+        await asyncio.sleep(0.01)
+        return 0
+
+    jobs = [scheduler.submit('python check.py', runner, script_id='check') for _ in range(count)]
+    cancelled = scheduler.submit('python check.py', runner, script_id='check')
+    scheduler.cancel(cancelled.id)
+    for _ in range(100):
+        if all(job.status in FINISHED_STATES for job in jobs):
+            break
+        await asyncio.sleep(0.01)
+
+    ids = [job.id for job in jobs]
+    ok = (len(set(ids)) == count and ran == ids
+          and all(job.status == 'completed' for job in jobs)
+          and cancelled.status == 'cancelled' and cancelled.id not in ran
+          and not scheduler.jobs())
+    for job in jobs + [cancelled]:
+        print(f"任务 {job.id}（{job.script_id}）: {job.status}")
+    print("自检通过" if ok else "自检失败")
+    return ok
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='任务调度器自检')
+    parser.add_argument('--count', type=int, default=3, help='用同一个脚本标识提交的次数')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    sys.exit(0 if asyncio.run(check_duplicate_submits(args.count)) else 1)
@@ -0,0 +1,348 @@
+import os
+import re
+import glob
+import time
+import sqlite3
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+# 任务记录和日志的默认位置
+JOBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'jobs')
+
+# 日志容量配置，可通过环境变量覆盖
+JOB_LOG_CONFIG = {
+    'segment_bytes': int(os.environ.get('JOB_LOG_SEGMENT_MB', 8)) * 1024 * 1024,  # 单个日志分段的大小
+    'max_segments': int(os.environ.get('JOB_LOG_SEGMENTS', 4)),                   # 每个任务最多保留的分段数
+    'max_total_bytes': int(os.environ.get('JOB_LOGS_MAX_MB', 512)) * 1024 * 1024, # 所有任务日志的总大小上限
+    'max_jobs': int(os.environ.get('JOB_HISTORY_MAX', 1000))                      # 最多保留的任务记录数
+}
+
+# 一次回放最多返回的字节数
+REPLAY_MAX_BYTES = 256 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    script_id TEXT,
+    command TEXT NOT NULL,
+    type TEXT,
+    status TEXT NOT NULL,
+    priority INTEGER,
+    queued_at REAL,
+    started_at REAL,
+    finished_at REAL,
+    exit_code INTEGER,
+    peak_rss_kb INTEGER,
+    log_bytes INTEGER NOT NULL DEFAULT 0,
+    log_start INTEGER NOT NULL DEFAULT 0,
+    log_lines INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_queued_at ON jobs (queued_at);
+"""
+
+JOB_FIELDS = ('id', 'script_id', 'command', 'type', 'status', 'priority', 'queued_at', 'started_at', 'finished_at',
+              'exit_code', 'peak_rss_kb', 'log_bytes', 'log_start', 'log_lines')
+
+# 日志分段文件名：<任务ID>.<该分段第一个字节的偏移量>.log
+SEGMENT_PATTERN = re.compile(r'^(?P<job>.+)\.(?P<offset>\d{12})\.log$')
+
+
+class JobLog:
+    """一个任务（一次运行）的追加写日志
+
+    日志按segment_bytes分段写入，超过max_segments后删除最早的分段，
+    因此单个任务的日志大小有上限。偏移量是从任务开始累计的字节数，
+    删除旧分段不会改变后续内容的偏移量。分段列表保存在内存中，写日志时不扫描目录。
+
+    提供executor时write()只把行放入队列，由executor的线程写入文件（文件只在该线程中
+    读写），事件循环中调用write()不会阻塞；不提供时直接写入。
+    """
+
+    def __init__(self, directory, job_id, segment_bytes, max_segments, executor=None):
+        self.directory = directory
+        self.job_id = job_id
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.executor = executor
+        self.offset = 0
+        self.lines = 0
+        self.peak_rss_kb = None
+        self._file = None
+        self._segment_start = 0
+        self._segments = []  # [(起始偏移量, 路径)]
+        self._pending = collections.deque()
+        self._drain_scheduled = False
+
+    def _segment_path(self, start):
+        return os.path.join(self.directory, f"{self.job_id}.{start:012d}.log")
+
+    def write(self, line):
+        if self.executor is None:
+            self._write(line)
+            return
+        self._pending.append(line)
+        if not self._drain_scheduled:
+            self._drain_scheduled = True
+            self.executor.submit(self._drain)
+
+    def _drain(self):
+        # 先清除标记再取队列，清除之后加入的行会再安排一次写入，不会遗漏
+        self._drain_scheduled = False
+        while self._pending:
+            self._write(self._pending.popleft())
+
+    def _write(self, line):
+        data = (line + '\n').encode('utf-8')
+        if self._file is None or self.offset - self._segment_start >= self.segment_bytes:
+            self._rotate()
+        self._file.write(data)
+        self.offset += len(data)
+        self.lines += 1
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        self._segment_start = self.offset
+        path = self._segment_path(self.offset)
+        self._file = open(path, 'wb')
+        self._segments.append((self.offset, path))
+        # 只保留最近的max_segments个分段
+        while len(self._segments) > self.max_segments:
+            _, old_path = self._segments.pop(0)
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        self._drain()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def start_offset(self):
+        return self._segments[0][0] if self._segments else self.offset
+
+
+# 列出任务的所有日志分段，返回按偏移量排序的 [(起始偏移量, 路径)]
+def list_segments(directory, job_id):
+    segments = []
+    for path in glob.glob(os.path.join(glob.escape(directory), glob.escape(job_id) + '.*.log')):
+        match = SEGMENT_PATTERN.match(os.path.basename(path))
+        if match and match.group('job') == job_id:
+            segments.append((int(match.group('offset')), path))
+    segments.sort()
+    return segments
+
+
+class JobStore:
+    """任务历史记录（SQLite）+ 每个任务一组追加写的日志文件
+
+    记录和日志按每次运行唯一的任务ID保存，同一个脚本（script_id）的多次运行各有一条记录，
+    记录中有命令、排队/开始/结束时间、退出码和峰值内存，
+    客户端重新连接后可以从任意偏移量回放任务的输出。
+    任务记录和日志按总数和总大小清理，最早结束的任务先被删除。
+    方法都是同步的，在事件循环中调用时应交给executor（单个线程，按提交顺序执行），
+    日志文件的写入也在这个线程中进行。
+    """
+
+    def __init__(self, directory=JOBS_DIR, segment_bytes=8 * 1024 * 1024, max_segments=4,
+                 max_total_bytes=512 * 1024 * 1024, max_jobs=1000):
+        self.directory = directory
+        self.log_directory = os.path.join(directory, 'logs')
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.max_total_bytes = max_total_bytes
+        self.max_jobs = max_jobs
+        self.path = os.path.join(directory, 'jobs.sqlite3')
+        self._local = threading.local()
+        self._logs = {}  # 运行中任务的 job_id -> JobLog
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='job-store')
+        os.makedirs(self.log_directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            # 旧版本的表没有script_id列（当时任务ID就是脚本标识）
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if 'script_id' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN script_id TEXT")
+                conn.execute("UPDATE jobs SET script_id = id")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_script_id ON jobs (script_id, queued_at)")
+            # 上次服务器退出时没有结束的任务标记为中断
+            conn.execute("""
+                UPDATE jobs SET status = 'interrupted', finished_at = COALESCE(finished_at, ?)
+                WHERE status IN ('queued', 'running')
+            """, (time.time(),))
+
+    def _connect(self):
+        # sqlite连接不能跨线程使用，每个线程各自持有一个
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def save_job(self, job, **extra):
+        """保存任务状态（job为Job.to_dict()的结果），extra中可以附带peak_rss_kb等字段"""
+        record = {field: job.get(field) for field in JOB_FIELDS if field in job}
+        record.update(extra)
+        log = self._logs.get(record['id'])
+        if log is not None:
+            record.update(log_bytes=log.offset, log_lines=log.lines, log_start=log.start_offset())
+            if log.peak_rss_kb is not None:
+                record['peak_rss_kb'] = log.peak_rss_kb
+        columns = ', '.join(record)
+        placeholders = ', '.join('?' * len(record))
+        updates = ', '.join(f"{column} = excluded.{column}" for column in record if column != 'id')
+        with self._connect() as conn:
+            conn.execute(f"INSERT INTO jobs ({columns}) VALUES ({placeholders}) "
+                         f"ON CONFLICT(id) DO UPDATE SET {updates}", list(record.values()))
+
+    def open_log(self, job_id):
+        """开始记录任务的输出，同一任务ID残留的旧日志先删除"""
+        for _, path in list_segments(self.log_directory, job_id):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        log = JobLog(self.log_directory, job_id, self.segment_bytes, self.max_segments, self.executor)
+        self._logs[job_id] = log
+        return log
+
+    def close_log(self, job_id):
+        """任务结束：关闭日志，并按容量清理旧任务"""
+        log = self._logs.pop(job_id, None)
+        if log is not None:
+            log.close()
+        self.prune()
+        return log
+
+    def get_job(self, job_id):
+        row = self._connect().execute(
+            f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(zip(JOB_FIELDS, row)) if row else None
+
+    def latest_job_id(self, script_id):
+        """脚本最近一次运行的任务ID，没有记录时返回None"""
+        row = self._connect().execute(
+            "SELECT id FROM jobs WHERE script_id = ? ORDER BY queued_at DESC LIMIT 1", (script_id,)).fetchone()
+        return row[0] if row else None
+
+    def recent_jobs(self, limit=50, script_id=None):
+        """最近的任务记录，指定script_id时只返回该脚本的运行记录"""
+        if script_id is None:
+            rows = self._connect().execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs ORDER BY queued_at DESC LIMIT ?", (limit,)).fetchall()
+        else:
+            rows = self._connect().execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE script_id = ? ORDER BY queued_at DESC LIMIT ?",
+                (script_id, limit)).fetchall()
+        return [dict(zip(JOB_FIELDS, row)) for row in rows]
+
+    def replay(self, job_id, offset=0, max_bytes=REPLAY_MAX_BYTES):
+        """从偏移量offset开始读取任务的输出，只返回完整的行
+
+        返回 {'lines', 'offset', 'next_offset', 'skipped', 'eof'}；offset早于保留的最早
+        分段时从最早分段开始，skipped为被跳过（已被清理）的字节数。
+        """
+        log = self._logs.get(job_id)
+        if log is not None:
+            log.flush()
+        segments = list_segments(self.log_directory, job_id)
+        if not segments:
+            return {'lines': [], 'offset': offset, 'next_offset': offset, 'skipped': 0, 'eof': True}
+
+        skipped = 0
+        if offset < segments[0][0]:
+            skipped = segments[0][0] - offset
+            offset = segments[0][0]
+
+        chunks = []
+        remaining = max_bytes
+        for index, (start, path) in enumerate(segments):
+            end = segments[index + 1][0] if index + 1 < len(segments) else None
+            if end is not None and offset >= end:
+                continue
+            with open(path, 'rb') as f:
+                f.seek(max(0, offset - start))
+                data = f.read(remaining)
+            chunks.append(data)
+            remaining -= len(data)
+            if remaining <= 0:
+                break
+        data = b''.join(chunks)
+
+        # 只返回到最后一个换行符为止的完整行
+        cut = data.rfind(b'\n') + 1
+        if cut == 0 and len(data) >= max_bytes:
+            cut = len(data)  # 单行超过max_bytes时整段返回
+        data = data[:cut]
+        next_offset = offset + len(data)
+        total = log.offset if log is not None else segments[-1][0] + os.path.getsize(segments[-1][1])
+        return {
+            'lines': data.decode('utf-8', errors='replace').splitlines(),
+            'offset': offset,
+            'next_offset': next_offset,
+            'skipped': skipped,
+            'eof': next_offset >= total
+        }
+
+    def prune(self):
+        """按任务数和日志总大小清理最早结束的任务"""
+        conn = self._connect()
+        running = set(self._logs)
+        rows = conn.execute(
+            "SELECT id FROM jobs WHERE finished_at IS NOT NULL ORDER BY finished_at").fetchall()
+        finished = [row[0] for row in rows if row[0] not in running]
+        total_jobs = conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+        sizes = {}
+        total_bytes = 0
+        for path in glob.glob(os.path.join(glob.escape(self.log_directory), '*.log')):
+            match = SEGMENT_PATTERN.match(os.path.basename(path))
+            if not match:
+                continue
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            sizes[match.group('job')] = sizes.get(match.group('job'), 0) + size
+            total_bytes += size
+
+        removed = []
+        for job_id in finished:
+            if total_jobs <= self.max_jobs and total_bytes <= self.max_total_bytes:
+                break
+            for _, path in list_segments(self.log_directory, job_id):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total_bytes -= sizes.get(job_id, 0)
+            total_jobs -= 1
+            removed.append(job_id)
+
+        if removed:
+            with conn:
+                conn.executemany("DELETE FROM jobs WHERE id = ?", ((job_id,) for job_id in removed))
+            print(f"已清理 {len(removed)} 个旧任务的记录和日志")
+        return removed
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+# 获取进程内共享的任务记录
+def get_job_store():
+    global _default_store
+    if _default_store is None:
+        with _default_store_lock:
+            if _default_store is None:
+                _default_store = JobStore(JOBS_DIR, **JOB_LOG_CONFIG)
+    return _default_store
@@ -14,7 +14,13 @@ import matplotlib.colors as mcolors
 import seaborn as sns
 from scipy.interpolate import splprep, splev
 import mysql.connector
+import os
+import re
 import argparse
+import time
+import pickle
+import shutil
+import tempfile
 from matplotlib.widgets import Button, CheckButtons
 
 # 设置中文字体显示
@@ -33,6 +39,27 @@ DB_CONFIG = {
     'use_pure': True  # 使用纯Python实现，避免C扩展可能的问题
 }
 
+# 结果表的写入模式：replace先删除同一run_id的旧结果再写入，upsert按(run_id, poemId)覆盖已有的行
+SAVE_MODES = ('replace', 'upsert')
+
+# 写入方式：infile为临时CSV + LOAD DATA LOCAL INFILE，insert为多行INSERT，auto先试infile不可用时改用insert
+SAVE_METHODS = ('auto', 'infile', 'insert')
+
+# 不指定--run_id时使用的运行ID，每次运行覆盖上一次的结果
+DEFAULT_RUN_ID = 'default'
+
+# 多行INSERT每条语句包含的行数
+INSERT_ROWS_PER_STATEMENT = 1000
+
+# 拟合好的UMAP和KMeans模型保存在 models/<run_id>/v<版本号>/ 下
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+
+# 每次运行最多保留的模型版本数
+MODEL_KEEP_VERSIONS = int(os.environ.get('MODEL_KEEP_VERSIONS', 5))
+
+# auto: 有参数相同的已保存模型时只投影新增或变化的诗，否则全量拟合；refit: 全量拟合；transform: 只投影
+EMBEDDING_MODES = ('auto', 'refit', 'transform')
+
 # 读取topic.csv文件
 def read_topic_csv(file_path):
     df = pd.read_csv(file_path)
@@ -50,17 +77,55 @@ def convert_to_vector(topics_str, num_topics=6):
             vector[topic] = 1
     return vector
 
-# 使用多种降维方法并结合它们的结果
-def reduce_dimensions(vectors, n_components=2, perplexity=30, random_state=42, n_neighbors=5, min_dist=0.8, spread=3.0, scale=1.5):
-    # PCA降维
+# 向量化编码：每种不同的主题字符串只解析一次，再按pd.factorize的编号广播到每首诗
+def encode_topics(topics, num_topics=6):
+    codes, uniques = pd.factorize(pd.Series(topics, dtype=object))
+    # 空值被编码为-1，对应表的最后一行（零向量）
+    table = np.array([convert_to_vector(t, num_topics) for t in uniques] + [[0] * num_topics]).reshape(-1, num_topics)
+    return table[codes]
+
+# 基准测试：逐行调用convert_to_vector vs 向量化编码，数据为随机生成的主题字符串
+def benchmark_encoding(sizes=(8000, 1000000), num_topics=6, random_state=42):
+    rng = np.random.default_rng(random_state)
+    for size in sizes:
+        topics = []
+        for n in rng.integers(0, 4, size):
+            # 约1/4为空值，其余为1-3个主题编号
+            topics.append(','.join(str(t) for t in rng.choice(num_topics, n, replace=False)) if n else np.nan)
+
+        start = time.perf_counter()
+        row_vectors = np.array([convert_to_vector(t, num_topics) for t in topics])
+        row_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vectors = encode_topics(topics, num_topics)
+        encode_time = time.perf_counter() - start
+
+        same = np.array_equal(row_vectors, vectors)
+        print(f"{size} 行: 逐行解析 {row_time:.3f} 秒，向量化编码 {encode_time:.3f} 秒，"
+              f"加速 {row_time / max(encode_time, 1e-9):.1f} 倍，结果{'一致' if same else '不一致'}")
+
+# 支持的降维方法
+REDUCTION_METHODS = ('umap', 'pca', 'tsne')
+
+# PCA降维
+def reduce_pca(vectors, n_components=2, **kwargs):
     pca = PCA(n_components=n_components)
-    pca_result = pca.fit_transform(vectors)
-    
-    # t-SNE降维
+    return pca.fit_transform(vectors)
+
+# t-SNE降维
+def reduce_tsne(vectors, n_components=2, perplexity=30, random_state=42, **kwargs):
+    # perplexity必须小于样本数
+    perplexity = min(perplexity, max(1, len(vectors) - 1))
     tsne = TSNE(n_components=n_components, perplexity=perplexity, random_state=random_state)
-    tsne_result = tsne.fit_transform(vectors)
-    
-    # UMAP降维 - 调整参数使点更分散
+    return tsne.fit_transform(vectors)
+
+# UMAP降维 - 调整参数使点更分散
+# weights为每个向量代表的诗词数（去重模式），用于按诗词数加权标准化
+# models不为None时把拟合好的reducer和标准化参数存入models['umap']，供增量模式使用
+def reduce_umap(vectors, n_components=2, random_state=42, n_neighbors=5, min_dist=0.8, spread=3.0, scale=1.5, weights=None, models=None, **kwargs):
+    # 邻居数必须小于样本数（去重后可能只有几十个向量）
+    n_neighbors = max(2, min(n_neighbors, len(vectors) - 1))
     reducer = umap.UMAP(
         n_components=n_components,
         n_neighbors=n_neighbors,  # 进一步减小邻居数量，使点更分散
@@ -71,19 +136,104 @@ def reduce_dimensions(vectors, n_components=2, perplexity=30, random_state=42, n
     umap_result = reducer.fit_transform(vectors)
     
     # 标准化UMAP结果并增大分散程度
-    umap_result = (umap_result - umap_result.mean(axis=0)) / umap_result.std(axis=0)
+    mean = np.average(umap_result, axis=0, weights=weights)
+    std = np.sqrt(np.average((umap_result - mean) ** 2, axis=0, weights=weights))
+    umap_result = (umap_result - mean) / std
     umap_result *= scale  # 增大缩放因子，使点分布更分散
-    
-    return {
-        'pca': pca_result,
-        'tsne': tsne_result,
-        'umap': umap_result
-    }
+    if models is not None:
+        models['umap'] = {'reducer': reducer, 'mean': mean, 'std': std, 'scale': scale}
+    return umap_result
+
+# 用已保存的UMAP模型投影新的向量，并按拟合时的参数标准化
+def transform_umap(umap_model, vectors):
+    coords = umap_model['reducer'].transform(vectors)
+    return (coords - umap_model['mean']) / umap_model['std'] * umap_model['scale']
+
+REDUCERS = {
+    'umap': reduce_umap,
+    'pca': reduce_pca,
+    'tsne': reduce_tsne
+}
+
+class LazyReductions(dict):
+    """按需计算的降维结果：第一次访问某个方法时才计算，并打印耗时；拟合好的模型保存在models中"""
 
-# 使用K-means进行聚类
-def cluster_points(points, n_clusters=6, random_state=42):
+    def __init__(self, vectors, methods, params):
+        super().__init__()
+        self.vectors = vectors
+        self.methods = tuple(methods)
+        self.params = params
+        self.timings = {}
+        self.models = {}
+
+    def __missing__(self, method):
+        if method not in self.methods:
+            raise KeyError(f"未选择的降维方法: {method}（可用 --methods 指定）")
+        start = time.perf_counter()
+        result = REDUCERS[method](self.vectors, models=self.models, **self.params)
+        self.timings[method] = time.perf_counter() - start
+        print(f"{method.upper()} 降维完成，用时 {self.timings[method]:.2f} 秒")
+        self[method] = result
+        return result
+
+    def compute_all(self):
+        """计算所有选择的方法"""
+        for method in self.methods:
+            self[method]
+        return self
+
+# 降维：只计算methods中选择的方法，且在第一次使用时才计算
+def reduce_dimensions(vectors, n_components=2, perplexity=30, random_state=42, n_neighbors=5, min_dist=0.8, spread=3.0, scale=1.5, methods=('umap',), weights=None):
+    unknown = [m for m in methods if m not in REDUCERS]
+    if unknown:
+        raise ValueError(f"不支持的降维方法: {', '.join(unknown)}，可选: {', '.join(REDUCTION_METHODS)}")
+    return LazyReductions(vectors, methods, {
+        'n_components': n_components,
+        'perplexity': perplexity,
+        'random_state': random_state,
+        'n_neighbors': n_neighbors,
+        'min_dist': min_dist,
+        'spread': spread,
+        'scale': scale,
+        'weights': weights
+    })
+
+# 解析--methods参数
+def parse_methods(text):
+    methods = [m.strip().lower() for m in text.split(',') if m.strip()]
+    # 聚类和可视化使用UMAP的结果，UMAP始终需要计算
+    if 'umap' not in methods:
+        methods.insert(0, 'umap')
+    return methods
+
+# 使用K-means进行聚类，sample_weight为每个点代表的诗词数；models不为None时把模型存入models['kmeans']
+def cluster_points(points, n_clusters=6, random_state=42, sample_weight=None, models=None):
+    # 聚类数不能多于点数
+    n_clusters = min(n_clusters, len(points))
     kmeans = KMeans(n_clusters=n_clusters, random_state=random_state)
-    return kmeans.fit_predict(points)
+    labels = kmeans.fit_predict(points, sample_weight=sample_weight)
+    if models is not None:
+        models['kmeans'] = kmeans
+    return labels
+
+# 去重：主题向量是6维0/1向量，最多64种，返回 (不同的向量, 每首诗对应的向量下标, 每种向量的诗词数)
+def dedup_vectors(vectors):
+    unique_vectors, inverse, counts = np.unique(vectors, axis=0, return_inverse=True, return_counts=True)
+    return unique_vectors, inverse.reshape(-1), counts
+
+# 把去重后向量的坐标展开回每首诗，加上少量随机抖动避免相同主题的诗完全重叠
+# 抖动按poemId取随机数种子：同一首诗每次运行（全量或增量）偏移相同，不同批次的诗偏移不同
+def expand_points(unique_points, inverse, poem_ids, jitter=0.05, random_state=42):
+    points = unique_points[inverse]
+    if jitter > 0:
+        offsets = np.array([np.random.default_rng([random_state, int(poem_id) % 2 ** 63])
+                            .normal(scale=jitter, size=points.shape[1]) for poem_id in poem_ids])
+        points = points + offsets.reshape(points.shape)
+    return points
+
+# 去重模式下展开每首诗的结果：标签由未加抖动的坐标得到，再给坐标加抖动，全量和增量两种方式一致
+def expand_results(coords, labels, inverse, poem_ids, jitter=0.05):
+    return expand_points(coords, inverse, poem_ids, jitter=jitter), np.asarray(labels)[inverse]
 
 # 创建平滑的边界曲线
 def create_smooth_boundary(points, expand_factor=1.2):  # 减小expand_factor使背景色范围更小
@@ -145,16 +295,141 @@ def plot_smooth_clusters(points, labels, ax, alpha=0.12):  # 进一步减小alph
             except:
                 continue
 
-def save_results_to_db(coords, labels, topics, vectors):
-    """保存处理结果到数据库"""
+# 按列构建要写入的行，避免逐行逐元素访问numpy数组
+def build_result_rows(poem_ids, run_id, texts, vectors, coords, labels):
+    vectors = np.asarray(vectors, dtype=float)
+    coords = np.asarray(coords, dtype=float)
+    columns = [np.asarray(poem_ids).astype(int).tolist(), [run_id] * len(texts), list(texts)]
+    columns += [vectors[:, i].tolist() for i in range(vectors.shape[1])]
+    columns += [coords[:, 0].tolist(), coords[:, 1].tolist(), np.asarray(labels).astype(int).tolist()]
+    return list(zip(*columns))
+
+# 旧版本创建的结果表没有poemId和run_id列，补上这两列和唯一索引
+def ensure_key_columns(cursor, table):
+    cursor.execute("SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+                   "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (table,))
+    columns = {row[0] for row in cursor.fetchall()}
+    if 'poemId' not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN poemId INT AFTER id")
+    if 'run_id' not in columns:
+        # 旧数据归入默认运行，第一次以replace模式写入默认运行时被清理
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN run_id VARCHAR(64) NOT NULL DEFAULT '{DEFAULT_RUN_ID}' AFTER poemId")
+    cursor.execute("SELECT INDEX_NAME FROM information_schema.STATISTICS "
+                   "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = 'run_poem'", (table,))
+    if not cursor.fetchall():
+        cursor.execute(f"ALTER TABLE {table} ADD UNIQUE KEY run_poem (run_id, poemId)")
+
+# CSV中的一个字段：None写为不加引号的NULL，字符串加引号
+def csv_field(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    return repr(value)
+
+# 写临时CSV并用LOAD DATA LOCAL INFILE导入，upsert时用REPLACE覆盖唯一键相同的行
+def load_rows_infile(cursor, table, columns, rows, upsert=False):
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', newline='', delete=False) as f:
+        for row in rows:
+            f.write(','.join(map(csv_field, row)) + '\n')
+        path = f.name
+    try:
+        # ESCAPED BY ''：不处理反斜杠转义，字段内容按原样导入
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE %s {'REPLACE' if upsert else ''} INTO TABLE {table} "
+            "CHARACTER SET utf8mb4 FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '' "
+            f"LINES TERMINATED BY '\\n' ({', '.join(columns)})",
+            (path.replace('\\', '/'),)
+        )
+    finally:
+        os.remove(path)
+
+# 多行INSERT写入，upsert时用REPLACE覆盖唯一键相同的行
+def insert_rows(cursor, table, columns, rows, upsert=False):
+    sql = f"{'REPLACE' if upsert else 'INSERT'} INTO {table} ({', '.join(columns)}) VALUES "
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    for i in range(0, len(rows), INSERT_ROWS_PER_STATEMENT):
+        batch = rows[i:i + INSERT_ROWS_PER_STATEMENT]
+        cursor.execute(sql + ', '.join([placeholders] * len(batch)), [value for row in batch for value in row])
+
+# 在一个事务中写入一次运行的结果，返回 (实际使用的写入方式, 用时)
+def write_result_rows(conn, table, columns, rows, run_id, mode='replace', method='auto'):
+    methods = ['infile', 'insert'] if method == 'auto' else [method]
+    for index, current in enumerate(methods):
+        cursor = conn.cursor()
+        start = time.perf_counter()
+        try:
+            if mode == 'replace':
+                cursor.execute(f"DELETE FROM {table} WHERE run_id = %s", (run_id,))
+            if current == 'infile':
+                load_rows_infile(cursor, table, columns, rows, upsert=mode == 'upsert')
+            else:
+                insert_rows(cursor, table, columns, rows, upsert=mode == 'upsert')
+            conn.commit()
+        except mysql.connector.Error as e:
+            conn.rollback()
+            if index + 1 < len(methods):
+                print(f"LOAD DATA LOCAL INFILE 不可用（{e}），改用多行INSERT")
+                continue
+            raise
+        finally:
+            cursor.close()
+        elapsed = time.perf_counter() - start
+        print(f"已用{current}方式写入 {len(rows)} 条结果到{table}（{mode}，run_id={run_id}），"
+              f"用时 {elapsed:.2f} 秒，{len(rows) / max(elapsed, 1e-9):.0f} 条/秒")
+        return current, elapsed
+
+# 基准测试：用两种写入方式各写一遍到临时的run_id，比较每秒写入行数后删除
+def benchmark_save(conn, table, columns, rows, run_id):
+    for method in ('infile', 'insert'):
+        bench_run_id = f"{run_id}-benchmark-{method}"[:64]
+        bench_rows = [(row[0], bench_run_id) + tuple(row[2:]) for row in rows]
+        try:
+            write_result_rows(conn, table, columns, bench_rows, bench_run_id, 'replace', method)
+        except mysql.connector.Error as e:
+            print(f"{method}方式写入失败: {e}")
+        cursor = conn.cursor()
+        cursor.execute(f"DELETE FROM {table} WHERE run_id = %s", (bench_run_id,))
+        conn.commit()
+        cursor.close()
+
+# 结果表的列，poemId和run_id为唯一键
+RESULT_COLUMNS = ['poemId', 'run_id', 'original_topic', 'vector_dim1', 'vector_dim2', 'vector_dim3',
+                  'vector_dim4', 'vector_dim5', 'vector_dim6', 'umap_x', 'umap_y', 'cluster_label']
+
+def delete_results_from_db(poem_ids, run_id=DEFAULT_RUN_ID):
+    """删除某次运行中已经不存在的诗的结果"""
     try:
         conn = mysql.connector.connect(**DB_CONFIG)
         cursor = conn.cursor()
+        poem_ids = [int(poem_id) for poem_id in poem_ids]
+        for i in range(0, len(poem_ids), INSERT_ROWS_PER_STATEMENT):
+            batch = poem_ids[i:i + INSERT_ROWS_PER_STATEMENT]
+            cursor.execute(f"DELETE FROM topic_visualization WHERE run_id = %s AND poemId IN ({', '.join(['%s'] * len(batch))})",
+                           [run_id] + batch)
+        conn.commit()
+        cursor.close()
+        print(f"已从数据库删除{len(poem_ids)}首已不存在的诗的结果。")
+    except Exception as e:
+        print(f"数据库操作出错: {str(e)}")
+        raise e
+    finally:
+        if 'conn' in locals():
+            conn.close()
+
+def save_results_to_db(coords, labels, topics, vectors, poem_ids=None, run_id=DEFAULT_RUN_ID,
+                       mode='replace', method='auto', benchmark=False):
+    """保存处理结果到数据库，同一run_id重复运行时覆盖而不是追加"""
+    try:
+        conn = mysql.connector.connect(**DB_CONFIG, allow_local_infile=method != 'insert' or benchmark)
+        cursor = conn.cursor()
         
         # 创建新表来存储降维和聚类结果
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS topic_visualization (
                 id INT AUTO_INCREMENT PRIMARY KEY,
+                poemId INT,
+                run_id VARCHAR(64) NOT NULL DEFAULT 'default',
                 original_topic VARCHAR(255),
                 vector_dim1 FLOAT,
                 vector_dim2 FLOAT,
@@ -165,61 +440,127 @@ def save_results_to_db(coords, labels, topics, vectors):
                 umap_x FLOAT,
                 umap_y FLOAT,
                 cluster_label INT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE KEY run_poem (run_id, poemId)
             )
         """)
+        ensure_key_columns(cursor, 'topic_visualization')
+        cursor.close()
         
-        # 准备插入数据
-        insert_query = """
-            INSERT INTO topic_visualization 
-            (original_topic, vector_dim1, vector_dim2, vector_dim3, vector_dim4, vector_dim5, vector_dim6, 
-             umap_x, umap_y, cluster_label)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
+        # 构建数据，没有poemId时按行号编号
+        if poem_ids is None:
+            poem_ids = np.arange(1, len(topics) + 1)
+        texts = pd.Series(topics, dtype=object).fillna('').astype(str).tolist()
+        rows = build_result_rows(poem_ids, run_id, texts, vectors, coords, labels)
         
-        # 构建数据
-        data_to_insert = []
-        for i in range(len(topics)):
-            topic_str = str(topics[i]) if not pd.isna(topics[i]) else ""
-            data_to_insert.append((
-                topic_str,
-                float(vectors[i][0]),
-                float(vectors[i][1]),
-                float(vectors[i][2]),
-                float(vectors[i][3]),
-                float(vectors[i][4]),
-                float(vectors[i][5]),
-                float(coords[i][0]),
-                float(coords[i][1]),
-                int(labels[i])
-            ))
-        
-        # 分批插入数据，每批1000条
-        batch_size = 1000
-        total_batches = (len(data_to_insert) + batch_size - 1) // batch_size
-        
-        for i in range(0, len(data_to_insert), batch_size):
-            batch = data_to_insert[i:i + batch_size]
-            try:
-                cursor.executemany(insert_query, batch)
-                conn.commit()
-                print(f"已插入第 {i//batch_size + 1}/{total_batches} 批数据，共 {len(batch)} 条")
-            except Exception as e:
-                print(f"插入第 {i//batch_size + 1} 批数据时出错: {str(e)}")
-                conn.rollback()
-                raise e
-        
-        print(f"成功将{len(data_to_insert)}条处理结果保存到数据库。")
+        if benchmark:
+            benchmark_save(conn, 'topic_visualization', RESULT_COLUMNS, rows, run_id)
+        write_result_rows(conn, 'topic_visualization', RESULT_COLUMNS, rows, run_id, mode, method)
+        print(f"成功将{len(rows)}条处理结果保存到数据库。")
         
     except Exception as e:
         print(f"数据库操作出错: {str(e)}")
         raise e
     finally:
-        if 'cursor' in locals():
-            cursor.close()
         if 'conn' in locals():
             conn.close()
 
+# 列出某次运行已保存的模型版本号（升序）
+def model_versions(run_id):
+    directory = os.path.join(MODEL_DIR, run_id)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(int(name[1:]) for name in os.listdir(directory) if re.fullmatch(r'v\d+', name))
+
+def model_path(run_id, version, name):
+    return os.path.join(MODEL_DIR, run_id, f"v{version:04d}", name)
+
+# 保存全量拟合得到的模型和每首诗的结果，返回新的版本号；只保留最近MODEL_KEEP_VERSIONS个版本
+def save_model(run_id, model, state):
+    versions = model_versions(run_id)
+    version = versions[-1] + 1 if versions else 1
+    os.makedirs(os.path.dirname(model_path(run_id, version, 'model.pkl')), exist_ok=True)
+    model = dict(model, version=version, created_at=time.time())
+    with open(model_path(run_id, version, 'model.pkl'), 'wb') as f:
+        pickle.dump(model, f)
+    save_state(run_id, version, state)
+    for old in versions[:max(0, len(versions) + 1 - MODEL_KEEP_VERSIONS)]:
+        shutil.rmtree(os.path.dirname(model_path(run_id, old, 'model.pkl')), ignore_errors=True)
+    print(f"已保存模型 {run_id} 版本 v{version:04d}")
+    return version
+
+# 保存每首诗的输入和结果（增量模式据此判断哪些诗是新增或变化的）
+def save_state(run_id, version, state):
+    path = model_path(run_id, version, 'state.pkl')
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+# 读取模型和每首诗的结果，version为None时读取最新版本，没有时返回None
+def load_model(run_id, version=None):
+    versions = model_versions(run_id)
+    if not versions:
+        return None
+    version = versions[-1] if version is None else version
+    with open(model_path(run_id, version, 'model.pkl'), 'rb') as f:
+        model = pickle.load(f)
+    with open(model_path(run_id, version, 'state.pkl'), 'rb') as f:
+        state = pickle.load(f)
+    return model, state
+
+# 选择本次运行的方式：refit全量拟合，transform只投影新增或变化的诗
+def choose_embedding(mode, run_id, params):
+    if mode == 'refit':
+        return 'refit', None
+    loaded = load_model(run_id)
+    if loaded is None:
+        if mode == 'transform':
+            raise ValueError(f"运行 {run_id} 还没有保存的模型，请先用 --embedding refit 全量拟合")
+        print(f"运行 {run_id} 还没有保存的模型，进行全量拟合")
+        return 'refit', None
+    if mode == 'auto' and loaded[0]['params'] != params:
+        print(f"参数与已保存的模型 v{loaded[0]['version']:04d} 不同，进行全量拟合")
+        return 'refit', None
+    print(f"使用已保存的模型 v{loaded[0]['version']:04d}（{time.strftime('%Y-%m-%d %H:%M', time.localtime(loaded[0]['created_at']))} 拟合）")
+    return 'transform', loaded
+
+# 找出新增或输入发生变化的诗，返回它们在本次输入中的下标
+def find_changed(state, poem_ids, inputs):
+    known = dict(zip(state['poem_ids'].tolist(), state['inputs']))
+    missing = object()
+    return np.array([i for i, (poem_id, text) in enumerate(zip(np.asarray(poem_ids).tolist(), inputs))
+                     if known.get(poem_id, missing) != text], dtype=int)
+
+# 从已保存的结果中删除本次输入里已经没有的诗，返回被删除的poemId
+def drop_missing(state, poem_ids):
+    keep = np.isin(state['poem_ids'], np.asarray(poem_ids))
+    removed = state['poem_ids'][~keep]
+    if len(removed):
+        state['inputs'] = [text for text, kept in zip(state['inputs'], keep) if kept]
+        for key in ('poem_ids', 'coords', 'labels', 'vectors'):
+            state[key] = np.asarray(state[key])[keep]
+    return removed
+
+# 把新投影的诗合并到已保存的结果中：已有的诗覆盖，新诗追加在末尾；arrays为coords、labels、vectors等按诗排列的数组
+def update_state(state, poem_ids, inputs, **arrays):
+    poem_ids = np.asarray(poem_ids)
+    index = {poem_id: i for i, poem_id in enumerate(state['poem_ids'].tolist())}
+    appended = []
+    for j, poem_id in enumerate(poem_ids.tolist()):
+        i = index.get(poem_id)
+        if i is None:
+            appended.append(j)
+            continue
+        state['inputs'][i] = inputs[j]
+        for key, values in arrays.items():
+            state[key][i] = values[j]
+    if appended:
+        state['poem_ids'] = np.concatenate([state['poem_ids'], poem_ids[appended]])
+        state['inputs'] = list(state['inputs']) + [inputs[j] for j in appended]
+        for key, values in arrays.items():
+            state[key] = np.concatenate([state[key], np.asarray(values)[appended]])
+    return state
+
 def create_interactive_plot(coords, labels, topic_strings, vectors, output_file='topic_clusters_interactive.png'):
     """创建交互式散点图"""
     fig = plt.figure(figsize=(16, 14))
@@ -372,21 +713,53 @@ def parse_args():
     parser.add_argument('--spread', type=float, default=3.0, help='UMAP的spread参数，较大的值使分布更分散')
     parser.add_argument('--scale', type=float, default=1.5, help='坐标缩放因子，较大的值使整体分布更大')
     
+    # 降维方法
+    parser.add_argument('--methods', type=str, default='umap',
+                        help='要计算的降维方法，逗号分隔，可选 umap,pca,tsne（聚类始终使用umap）')
+    
     # 聚类参数
     parser.add_argument('--n_clusters', type=int, default=6, help='聚类数量')
     
+    # 去重模式
+    parser.add_argument('--dedup', action='store_true',
+                        help='只对不同的主题向量降维和聚类（按诗词数加权），再展开回每首诗')
+    parser.add_argument('--dedup_jitter', type=float, default=0.05,
+                        help='去重模式下展开时加到每首诗坐标上的随机抖动（标准差），0表示不抖动')
+    
     # 输入文件
     parser.add_argument('--input', type=str, default='topic.csv', help='输入CSV文件路径')
     
     # 输出文件
     parser.add_argument('--output', type=str, default='topic_clusters_interactive.png', help='输出文件路径')
     
+    # 全量拟合或增量投影
+    parser.add_argument('--embedding', type=str, default='auto', choices=EMBEDDING_MODES,
+                        help='auto: 有参数相同的已保存模型时只投影新增或变化的诗；refit: 全量拟合并保存新版本模型；'
+                             'transform: 只用已保存的模型投影新增或变化的诗')
+    
+    # 结果写入数据库的方式
+    parser.add_argument('--run_id', type=str, default=DEFAULT_RUN_ID,
+                        help='本次运行的ID，结果按(run_id, poemId)保存，同一ID重复运行时覆盖')
+    parser.add_argument('--save_mode', type=str, default='replace', choices=SAVE_MODES,
+                        help='replace: 先删除同一run_id的旧结果再写入；upsert: 只覆盖本次写入的诗')
+    parser.add_argument('--save_method', type=str, default='auto', choices=SAVE_METHODS,
+                        help='infile: 临时CSV + LOAD DATA LOCAL INFILE；insert: 多行INSERT；auto: 先试infile')
+    parser.add_argument('--save_benchmark', action='store_true', help='保存前用两种写入方式各写一遍，比较每秒写入行数')
+    
+    # 基准测试
+    parser.add_argument('--benchmark', action='store_true', help='对比逐行解析和向量化编码主题字符串的耗时后退出')
+    parser.add_argument('--benchmark_rows', type=str, default='8000,1000000', help='基准测试的数据行数，逗号分隔')
+    
     return parser.parse_args()
 
 def main():
     # 解析命令行参数
     args = parse_args()
     
+    if args.benchmark:
+        benchmark_encoding([int(n) for n in args.benchmark_rows.split(',') if n.strip()])
+        return
+    
     # 读取topic.csv文件
     print(f"正在读取主题数据: {args.input}")
     
@@ -414,33 +787,125 @@ def main():
     
     # 将主题转换为向量
     print("正在转换主题数据为向量...")
-    vectors = []
-    for topics_str in topic_df['topics']:
-        vector = convert_to_vector(topics_str)
-        vectors.append(vector)
+    start = time.perf_counter()
+    vectors = encode_topics(topic_df['topics'])
+    print(f"转换完成，用时 {time.perf_counter() - start:.2f} 秒")
+    
+    # 没有poemId列时按行号编号
+    poem_ids = topic_df['poemId'].to_numpy() if 'poemId' in topic_df.columns else np.arange(1, len(topic_df) + 1)
+    texts = pd.Series(topic_df['topics'], dtype=object).fillna('').astype(str).tolist()
+    params = {
+        'n_neighbors': args.n_neighbors,
+        'min_dist': args.min_dist,
+        'spread': args.spread,
+        'scale': args.scale,
+        'n_clusters': args.n_clusters,
+        'dedup': args.dedup,
+        'dedup_jitter': args.dedup_jitter
+    }
+    embedding, loaded = choose_embedding(args.embedding, args.run_id, params)
+    
+    if embedding == 'transform':
+        model, state = loaded
+        changed = find_changed(state, poem_ids, texts)
+        removed = drop_missing(state, poem_ids)
+        print(f"增量模式: {len(texts)} 首诗中有 {len(changed)} 首新增或变化，{len(removed)} 首已删除")
+        if len(removed):
+            delete_results_from_db(removed, run_id=args.run_id)
+        if len(changed):
+            start = time.perf_counter()
+            new_coords = transform_umap(model['umap'], vectors[changed])
+            new_labels = model['kmeans'].predict(new_coords)
+            if args.dedup:
+                new_coords, new_labels = expand_results(new_coords, new_labels, np.arange(len(new_coords)),
+                                                        poem_ids[changed], jitter=args.dedup_jitter)
+            print(f"投影和聚类完成，用时 {time.perf_counter() - start:.2f} 秒")
+            
+            # 只写入新增或变化的诗
+            print("正在将新增或变化的结果保存到数据库...")
+            changed_texts = [texts[i] for i in changed]
+            save_results_to_db(
+                new_coords,
+                new_labels,
+                changed_texts,
+                vectors[changed],
+                poem_ids=poem_ids[changed],
+                run_id=args.run_id,
+                mode='upsert',
+                method=args.save_method
+            )
+            update_state(state, poem_ids[changed], changed_texts,
+                         coords=new_coords, labels=new_labels, vectors=vectors[changed])
+        if len(changed) or len(removed):
+            save_state(args.run_id, model['version'], state)
+        
+        # 用已保存的全部结果生成可视化
+        print("正在生成交互式可视化...")
+        create_interactive_plot(
+            state['coords'],
+            state['labels'],
+            state['inputs'],
+            state['vectors'],
+            output_file=args.output
+        )
+        print(f"处理完成！共{len(state['inputs'])}首诗，本次投影了{len(changed)}首。")
+        print(f"生成的图像文件：{args.output}")
+        return
     
-    vectors = np.array(vectors)
+    if args.dedup:
+        unique_vectors, inverse, counts = dedup_vectors(vectors)
+        print(f"去重模式: {len(vectors)} 首诗共有 {len(unique_vectors)} 种不同的主题向量")
+        embed_vectors, weights = unique_vectors, counts
+    else:
+        embed_vectors, weights = vectors, None
     
     # 降维
-    print("正在进行降维...")
+    print("正在进行降维（全量拟合）...")
     dim_reduction_results = reduce_dimensions(
-        vectors,
+        embed_vectors,
         n_neighbors=args.n_neighbors,
         min_dist=args.min_dist,
         spread=args.spread,
-        scale=args.scale
-    )
+        scale=args.scale,
+        methods=parse_methods(args.methods),
+        weights=weights
+    ).compute_all()
     
     # 使用UMAP结果进行聚类和可视化
     umap_result = dim_reduction_results['umap']
     
     # 聚类
     print(f"正在进行聚类 (n_clusters={args.n_clusters})...")
-    cluster_labels = cluster_points(umap_result, n_clusters=args.n_clusters)
+    start = time.perf_counter()
+    models = dim_reduction_results.models
+    cluster_labels = cluster_points(umap_result, n_clusters=args.n_clusters, sample_weight=weights, models=models)
+    print(f"聚类完成，用时 {time.perf_counter() - start:.2f} 秒")
+    
+    if args.dedup:
+        # 展开回每首诗，保存和可视化的格式与不去重时相同
+        umap_result, cluster_labels = expand_results(umap_result, cluster_labels, inverse,
+                                                     poem_ids, jitter=args.dedup_jitter)
     
     # 保存结果到数据库
     print("正在将结果保存到数据库...")
-    save_results_to_db(umap_result, cluster_labels, topic_df['topics'], vectors)
+    save_results_to_db(
+        umap_result,
+        cluster_labels,
+        topic_df['topics'],
+        vectors,
+        poem_ids=poem_ids,
+        run_id=args.run_id,
+        mode=args.save_mode,
+        method=args.save_method,
+        benchmark=args.save_benchmark
+    )
+    
+    # 保存模型，之后新增或变化的诗可以只做投影
+    save_model(
+        args.run_id,
+        {'params': params, 'umap': models['umap'], 'kmeans': models['kmeans']},
+        {'poem_ids': poem_ids, 'inputs': texts, 'coords': umap_result, 'labels': cluster_labels, 'vectors': vectors}
+    )
     
     # 创建交互式可视化
     print("正在生成交互式可视化...")
@@ -0,0 +1,229 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pymysql
+
+# 数据库连接参数（与各脚本中的connect_to_mysql保持一致）
+MYSQL_CONFIG = {
+    'host': 'localhost',
+    'user': 'root',
+    'password': '123456',  # 请替换为您的数据库密码
+    'database': 'lunwen',
+    'charset': 'utf8mb4',
+    'autocommit': True,  # 只读查询不需要事务，避免长连接读到旧快照
+    'connect_timeout': 10
+}
+
+# 连接池配置，可通过环境变量覆盖
+POOL_CONFIG = {
+    'max_size': int(os.environ.get('MYSQL_POOL_SIZE', 8)),                   # 最大连接数
+    'max_idle_time': float(os.environ.get('MYSQL_POOL_MAX_IDLE', 300)),     # 空闲超过该秒数的连接被回收
+    'checkout_timeout': float(os.environ.get('MYSQL_POOL_TIMEOUT', 10)),     # 等待空闲连接的最长时间
+    'ping_interval': float(os.environ.get('MYSQL_POOL_PING_INTERVAL', 30))   # 空闲超过该秒数的连接取出前先ping
+}
+
+
+class PoolTimeoutError(Exception):
+    """在checkout_timeout内没有拿到可用连接"""
+
+
+class PoolClosedError(Exception):
+    """连接池已经被close_all关闭"""
+
+
+class MySQLConnectionPool:
+    """有界、线程安全的pymysql连接池
+
+    取出连接时对空闲较久的连接做ping健康检查，失效则重新建立连接；
+    空闲超过max_idle_time的连接会被关闭回收。
+    """
+
+    def __init__(self, connect_kwargs=None, max_size=8, max_idle_time=300,
+                 checkout_timeout=10, ping_interval=30):
+        if max_size < 1:
+            raise ValueError("max_size必须大于0")
+        self.connect_kwargs = dict(connect_kwargs or MYSQL_CONFIG)
+        self.max_size = max_size
+        self.max_idle_time = max_idle_time
+        self.checkout_timeout = checkout_timeout
+        self.ping_interval = ping_interval
+
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = []  # [(connection, 归还时间)]，后进先出，尽量复用热连接
+        self._size = 0   # 已创建的连接数（空闲 + 使用中）
+        self._closed = False
+        self._pid = os.getpid()
+        self._stats = {
+            'checkouts': 0,     # 成功取出连接次数
+            'waits': 0,         # 因连接池已满而等待的次数
+            'wait_time': 0.0,   # 累计等待时间（秒）
+            'timeouts': 0,      # 等待超时次数
+            'created': 0,       # 新建连接次数
+            'reconnects': 0,    # 健康检查失败后重连的次数
+            'evicted': 0,       # 空闲超时被回收的连接数
+            'discarded': 0      # 出错后被丢弃的连接数
+        }
+
+    def _connect(self):
+        connection = pymysql.connect(**self.connect_kwargs)
+        with self._cond:
+            self._stats['created'] += 1
+        return connection
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _check_fork(self):
+        # fork出的子进程不能复用父进程的socket，直接丢弃继承来的连接
+        # 锁也要重建，fork时它可能正被父进程的其他线程持有
+        if self._pid != os.getpid():
+            self._cond = threading.Condition(threading.Lock())
+            self._pid = os.getpid()
+            self._idle = []
+            self._size = 0
+
+    def _collect_expired_locked(self, now):
+        expired = [conn for conn, last_used in self._idle if now - last_used > self.max_idle_time]
+        if expired:
+            self._idle = [(conn, last_used) for conn, last_used in self._idle
+                          if now - last_used <= self.max_idle_time]
+            self._size -= len(expired)
+            self._stats['evicted'] += len(expired)
+            self._cond.notify(len(expired))
+        return expired
+
+    def acquire(self):
+        """取出一个连接，连接池已满时最多等待checkout_timeout秒"""
+        self._check_fork()
+        if self._closed:
+            raise PoolClosedError("连接池已关闭")
+        start = time.monotonic()
+        deadline = start + self.checkout_timeout
+        waited = False
+        connection, last_used = None, None
+        expired = []
+
+        with self._cond:
+            while True:
+                expired.extend(self._collect_expired_locked(time.monotonic()))
+                if self._idle:
+                    connection, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(f"{self.checkout_timeout}秒内没有可用的数据库连接")
+                if not waited:
+                    waited = True
+                    self._stats['waits'] += 1
+                self._cond.wait(remaining)
+            if waited:
+                self._stats['wait_time'] += time.monotonic() - start
+
+        for conn in expired:
+            self._close_quietly(conn)
+
+        try:
+            if connection is None:
+                connection = self._connect()
+            elif time.monotonic() - last_used > self.ping_interval:
+                connection = self._health_check(connection)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._stats['checkouts'] += 1
+        return connection
+
+    def _health_check(self, connection):
+        try:
+            connection.ping(reconnect=False)
+            return connection
+        except Exception:
+            self._close_quietly(connection)
+            with self._cond:
+                self._stats['reconnects'] += 1
+            return self._connect()
+
+    def release(self, connection, discard=False):
+        """归还连接；discard=True或连接已断开时直接关闭"""
+        if self._pid != os.getpid():
+            return
+        if not discard and not connection.open:
+            discard = True
+        with self._cond:
+            if self._closed:
+                # close_all之后归还的连接直接关闭
+                discard = True
+            if discard:
+                self._size -= 1
+                self._stats['discarded'] += 1
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+        if discard:
+            self._close_quietly(connection)
+
+    @contextmanager
+    def connection(self):
+        """with pool.connection() as conn: ... 用完自动归还"""
+        connection = self.acquire()
+        discard = False
+        try:
+            yield connection
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            # 连接层面的错误，该连接不再可靠
+            discard = True
+            raise
+        finally:
+            self.release(connection, discard=discard)
+
+    def stats(self):
+        """返回连接池的统计信息"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle)
+            })
+        stats['wait_time'] = round(stats['wait_time'], 4)
+        return stats
+
+    def close_all(self):
+        """关闭所有空闲连接并停止出借，使用中的连接归还时再关闭"""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle = []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+# 获取进程内共享的默认连接池
+def get_pool():
+    global _default_pool
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                _default_pool = MySQLConnectionPool(MYSQL_CONFIG, **POOL_CONFIG)
+    return _default_pool
@@ -0,0 +1,117 @@
+import os
+import json
+import asyncio
+import collections
+
+# 输出合并配置，可通过环境变量覆盖
+BATCH_CONFIG = {
+    'flush_interval': float(os.environ.get('OUTPUT_FLUSH_MS', 100)) / 1000,      # 每隔多久发送一帧
+    'max_batch_bytes': int(os.environ.get('OUTPUT_BATCH_KB', 64)) * 1024         # 缓冲超过该字节数时立即发送
+}
+
+
+class OutputBatcher:
+    """把子进程的逐行输出合并成批量的WebSocket帧
+
+    行先进入缓冲区，每隔flush_interval秒、或缓冲超过max_batch_bytes字节时
+    作为一个output_batch帧发送。帧发布到事件中心后立即返回，客户端接收慢时
+    由事件中心按订阅者丢弃最旧的事件，不会拖慢子进程或其他客户端。
+    """
+
+    def __init__(self, send, script_id, flush_interval=0.1, max_batch_bytes=64 * 1024):
+        self.send = send
+        self.script_id = script_id
+        self.flush_interval = flush_interval
+        self.max_batch_bytes = max_batch_bytes
+        self.connected = True
+
+        self._lines = collections.deque()
+        self._pending_bytes = 0
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._task = None
+        self._stats = {'lines': 0, 'frames': 0, 'bytes': 0}
+
+    def start(self):
+        self._task = asyncio.create_task(self._flush_loop())
+        return self
+
+    def _append(self, line):
+        self._lines.append(line)
+        self._pending_bytes += len(line.encode('utf-8')) + 1
+        if self._pending_bytes >= self.max_batch_bytes:
+            self._ready.set()
+
+    async def add(self, line):
+        """加入一行输出"""
+        if not self.connected:
+            return
+        self._stats['lines'] += 1
+        self._append(line)
+        if self._ready.is_set():
+            # 缓冲区已经攒够一帧，让出事件循环，让发送任务和其他客户端有机会运行
+            await asyncio.sleep(0)
+
+    def _take_batch(self):
+        lines = []
+        size = 0
+        while self._lines and (not lines or size < self.max_batch_bytes):
+            line = self._lines.popleft()
+            line_bytes = len(line.encode('utf-8')) + 1
+            size += line_bytes
+            self._pending_bytes -= line_bytes
+            lines.append(line)
+        return lines
+
+    async def flush(self):
+        """发送缓冲区中的所有行"""
+        while self._lines and self.connected:
+            lines = self._take_batch()
+            frame = json.dumps({
+                'type': 'output_batch',
+                'lines': lines,
+                'coalesced': len(lines),
+                'scriptId': self.script_id
+            })
+            try:
+                await self.send(frame)
+            except Exception:
+                # 如果发送失败，假定连接已关闭，之后的输出直接丢弃
+                self.connected = False
+                self._lines.clear()
+                self._pending_bytes = 0
+                return
+            self._stats['frames'] += 1
+            self._stats['bytes'] += len(frame)
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._ready.clear()
+            await self.flush()
+            if self._closed:
+                return
+
+    async def close(self):
+        """发送剩余的输出并停止后台发送任务"""
+        self._closed = True
+        self._ready.set()
+        if self._task is not None:
+            await self._task
+        else:
+            await self.flush()
+
+    def stats(self):
+        """合并统计：总行数、帧数、发送字节数和平均每帧行数"""
+        stats = dict(self._stats)
+        stats['coalesced'] = stats['lines'] - stats['frames'] if stats['frames'] else 0
+        stats['lines_per_frame'] = round(stats['lines'] / stats['frames'], 1) if stats['frames'] else 0
+        return stats
+
+
+# 按默认配置创建并启动一个输出合并器
+def create_batcher(send, script_id):
+    return OutputBatcher(send, script_id, **BATCH_CONFIG).start()
@@ -0,0 +1,220 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+import hashlib
+import threading
+import collections
+
+from mysql_pool import get_pool
+
+# pypinyin是可选依赖：安装后支持按拼音全拼/首字母搜索诗人
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:
+    lazy_pinyin = None
+
+# 诗人列表快照的有效期（秒），过期后在后台刷新
+POET_LIST_TTL = float(os.environ.get('POET_LIST_TTL', 300))
+
+# 分页的默认/最大每页条数
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+# 诗人列表快照：poets为有序元组，search_keys与之一一对应，etag由内容计算
+PoetSnapshot = collections.namedtuple('PoetSnapshot', ['poets', 'search_keys', 'etag', 'loaded_at'])
+
+
+# 从poems表中获取所有诗人名称
+def load_poets():
+    with get_pool().connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT DISTINCT poetName FROM poems ORDER BY poetName")
+            return [row[0] for row in cursor.fetchall() if row[0]]
+
+
+# 诗人的搜索键：小写名称、拼音全拼、拼音首字母
+def build_search_keys(poet):
+    keys = [poet.lower()]
+    if lazy_pinyin is not None:
+        keys.append(''.join(lazy_pinyin(poet)).lower())
+        keys.append(''.join(lazy_pinyin(poet, style=Style.FIRST_LETTER)).lower())
+    return tuple(keys)
+
+
+class PoetDirectory:
+    """内存中的诗人列表快照
+
+    第一次访问时同步加载，之后快照过期时由一个后台线程刷新，
+    请求线程始终直接读取当前快照。内容不变时快照（和ETag）保持不变。
+    """
+
+    def __init__(self, loader=load_poets, ttl=POET_LIST_TTL):
+        self.loader = loader
+        self.ttl = ttl
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._stats = {'loads': 0, 'changes': 0, 'errors': 0}
+
+    def _build(self, poets):
+        poets = tuple(poets)
+        etag = hashlib.sha1('\n'.join(poets).encode('utf-8')).hexdigest()
+        return PoetSnapshot(poets, tuple(build_search_keys(p) for p in poets), etag, time.time())
+
+    def refresh(self):
+        """立即从数据库重新加载，返回内容是否发生变化"""
+        try:
+            poets = self.loader()
+        except Exception as e:
+            with self._lock:
+                self._stats['errors'] += 1
+            print(f"刷新诗人列表失败: {str(e)}")
+            raise
+        snapshot = self._build(poets)
+        with self._lock:
+            self._stats['loads'] += 1
+            changed = self._snapshot is None or self._snapshot.etag != snapshot.etag
+            if changed:
+                self._stats['changes'] += 1
+                self._snapshot = snapshot
+            else:
+                self._snapshot = self._snapshot._replace(loaded_at=snapshot.loaded_at)
+        if changed:
+            print(f"诗人列表已更新，共 {len(snapshot.poets)} 位诗人")
+        return changed
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def snapshot(self):
+        """返回当前快照；快照过期时触发后台刷新，期间继续返回旧快照"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.refresh()
+            return self._snapshot
+
+        if time.time() - snapshot.loaded_at > self.ttl:
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        return snapshot
+
+    @property
+    def loaded(self):
+        return self._snapshot is not None
+
+    def preload(self):
+        """启动时在后台线程中调用，加载失败只打印信息，之后的请求会再次尝试"""
+        try:
+            self.snapshot()
+        except Exception:
+            pass
+
+    def poets(self):
+        return list(self.snapshot().poets)
+
+    def search(self, query=None, page=None, page_size=None):
+        """按名称前缀或拼音（全拼/首字母）前缀搜索，并分页
+
+        返回 (当前页诗人列表, 匹配总数, 快照)；page为None时返回全部匹配结果。
+        """
+        snapshot = self.snapshot()
+        query = (query or '').strip().lower().replace(' ', '')
+        if query:
+            matches = [poet for poet, keys in zip(snapshot.poets, snapshot.search_keys)
+                       if any(key.startswith(query) for key in keys)]
+        else:
+            matches = snapshot.poets
+
+        total = len(matches)
+        if page is not None:
+            page_size = min(max(1, page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+            offset = (max(1, page) - 1) * page_size
+            matches = matches[offset:offset + page_size]
+        return list(matches), total, snapshot
+
+    def stats(self):
+        snapshot = self._snapshot
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            'poets': len(snapshot.poets) if snapshot else 0,
+            'etag': snapshot.etag if snapshot else None,
+            'age': round(time.time() - snapshot.loaded_at, 1) if snapshot else None,
+            'ttl': self.ttl,
+            'pinyin_search': lazy_pinyin is not None
+        })
+        return stats
+
+
+_default_directory = None
+_default_directory_lock = threading.Lock()
+
+
+# 获取进程内共享的诗人列表
+def get_poet_directory():
+    global _default_directory
+    if _default_directory is None:
+        with _default_directory_lock:
+            if _default_directory is None:
+                _default_directory = PoetDirectory()
+    return _default_directory
+
+
+# 在新的解释器中测量导入一个模块的耗时（秒）
+def measure_import(module, repeats=3):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    timings = []
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, '-c', code], cwd=directory,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            return None
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return min(timings)
+
+
+# 基准测试：WebSocket服务器获取诗人列表时需要导入的模块，以及缓存命中后的查询耗时
+def benchmark(repeats=3, lookups=10000):
+    for module, note in [('wordcloud_api_server', '原来的方式（导入Flask、cv2、wordcloud、matplotlib）'),
+                         ('poet_directory', '轻量的诗人列表模块')]:
+        seconds = measure_import(module, repeats)
+        if seconds is None:
+            print(f"导入 {module} 失败（缺少依赖），{note}")
+        else:
+            print(f"导入 {module}: {seconds * 1000:.0f} ms，{note}")
+
+    directory = PoetDirectory(loader=lambda: [f"诗人{i}" for i in range(2000)])
+    directory.snapshot()
+    start = time.perf_counter()
+    for _ in range(lookups):
+        directory.poets()
+    print(f"缓存命中时获取 2000 位诗人的列表: 平均 {(time.perf_counter() - start) / lookups * 1e6:.1f} us")
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='诗人列表快照')
+    parser.add_argument('--benchmark', action='store_true', help='测量导入耗时和缓存查询耗时')
+    parser.add_argument('--repeats', type=int, default=3, help='导入测量的重复次数')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.benchmark:
+        benchmark(args.repeats)
+    else:
+        directory = get_poet_directory()
+        print(f"共 {len(directory.poets())} 位诗人: {directory.stats()}")
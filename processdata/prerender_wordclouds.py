@@ -0,0 +1,162 @@
+import os
+import re
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from word_index import ALL_POETS, get_index
+from render_assets import get_asset_registry
+from render_cache import get_render_cache, hash_word_counts
+from render_pool import render_job, _init_worker
+from wordcloud_encode import parse_encode_options, IMAGE_FORMATS
+
+# 预渲染图片的默认输出目录
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'prerendered')
+
+MANIFEST_NAME = 'manifest.json'
+
+
+# 诗人名转换为可用的文件名
+def safe_filename(poet):
+    return re.sub(r'[\\/:*?"<>|\s]+', '_', poet).strip('_') or 'unnamed'
+
+
+def load_manifest(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'poets': {}}
+
+
+# 先写临时文件再替换，中途被打断也不会留下损坏的清单
+def save_manifest(path, manifest):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def prerender(output_dir=OUTPUT_DIR, workers=None, mask_name='default', encode_options=None,
+              force=False, write_cache=True, poets=None):
+    """为"全部诗人"和每位诗人预渲染词云图
+
+    清单中记录每位诗人的词频哈希和渲染缓存键；再次运行时只重新渲染缓存键变化
+    （词频或渲染参数变化）或输出文件缺失的诗人，每完成一位就更新一次清单，
+    中途中断后重新运行会从未完成的诗人继续。
+    """
+    # 在函数内导入，避免spawn出的渲染进程重新导入Flask应用
+    from wordcloud_api_server import get_poets, get_word_counts, update_word_index, wordcloud_cache_key
+
+    encode_options = encode_options or parse_encode_options({})
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    entries = manifest.setdefault('poets', {})
+
+    # 先增量更新词频索引，保证读到的是最新词频
+    update_word_index()
+
+    if poets is None:
+        poets = [ALL_POETS] + get_poets()
+    assets = get_asset_registry().get(mask_name)
+    extension = IMAGE_FORMATS[encode_options['image_format']][0].lower()
+    index = get_index()
+
+    # 计算每位诗人的缓存键，找出需要重新渲染的诗人
+    jobs = []
+    for poet in poets:
+        word_counts = index.word_counts(poet)
+        if word_counts is None:
+            word_counts = get_word_counts(poet)
+        if not word_counts:
+            print(f"跳过没有词频数据的诗人: {poet}")
+            continue
+        cache_key = wordcloud_cache_key(word_counts, assets, encode_options)
+        filename = f"{safe_filename(poet)}.{extension}"
+        entry = entries.get(poet)
+        if (not force and entry is not None and entry.get('cache_key') == cache_key
+                and os.path.exists(os.path.join(output_dir, entry['file']))):
+            continue
+        jobs.append((poet, word_counts, cache_key, filename))
+
+    print(f"共 {len(poets)} 位诗人，需要渲染 {len(jobs)} 位，使用 {workers} 个进程")
+    if not jobs:
+        return manifest
+
+    render_cache = get_render_cache() if write_cache else None
+    start = time.time()
+    done = failed = 0
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker) as executor:
+        futures = {}
+        for poet, word_counts, cache_key, filename in jobs:
+            future = executor.submit(render_job, word_counts, mask_name, encode_options, time.time())
+            futures[future] = (poet, word_counts, cache_key, filename)
+
+        for future in as_completed(futures):
+            poet, word_counts, cache_key, filename = futures[future]
+            try:
+                image_data, content_type, timings = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"渲染 {poet} 失败: {str(e)}")
+                continue
+
+            with open(os.path.join(output_dir, filename), 'wb') as f:
+                f.write(image_data)
+            if render_cache is not None:
+                render_cache.put(cache_key, image_data, poet=poet, content_type=content_type)
+
+            entries[poet] = {
+                'file': filename,
+                'cache_key': cache_key,
+                'counts_hash': hash_word_counts(word_counts),
+                'content_type': content_type,
+                'size': len(image_data),
+                'mask': mask_name,
+                'encode_options': encode_options,
+                'render_ms': timings['render_ms'] + timings['encode_ms'],
+                'rendered_at': time.time()
+            }
+            manifest['updated_at'] = time.time()
+            save_manifest(manifest_path, manifest)
+            done += 1
+            print(f"[{done + failed}/{len(jobs)}] {poet} 完成，{len(image_data) / 1024:.1f} KB，"
+                  f"用时 {timings['render_ms'] + timings['encode_ms']:.0f} ms")
+
+    print(f"预渲染完成：成功 {done} 位，失败 {failed} 位，总用时 {time.time() - start:.1f} 秒")
+    print(f"清单已保存到: {manifest_path}")
+    return manifest
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='批量预渲染所有诗人的词云图')
+    parser.add_argument('--output', type=str, default=OUTPUT_DIR, help='输出目录')
+    parser.add_argument('--workers', type=int, default=None, help='渲染进程数，默认为CPU核数')
+    parser.add_argument('--mask', type=str, default='default', help='使用的蒙版名称')
+    parser.add_argument('--image_format', type=str, default='png', choices=sorted(IMAGE_FORMATS), help='图片格式')
+    parser.add_argument('--compress_level', type=int, default=None, help='PNG压缩级别 0-9')
+    parser.add_argument('--quality', type=int, default=None, help='WebP/JPEG质量 1-100')
+    parser.add_argument('--max_side', type=int, default=None, help='长边最大像素数')
+    parser.add_argument('--poets', type=str, default=None, help='只渲染这些诗人，逗号分隔')
+    parser.add_argument('--force', action='store_true', help='忽略清单，全部重新渲染')
+    parser.add_argument('--no_cache', action='store_true', help='不写入API服务器的渲染缓存')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    prerender(
+        output_dir=args.output,
+        workers=args.workers,
+        mask_name=args.mask,
+        encode_options=parse_encode_options(vars(args)),
+        force=args.force,
+        write_cache=not args.no_cache,
+        poets=[p.strip() for p in args.poets.split(',') if p.strip()] if args.poets else None
+    )
@@ -0,0 +1,176 @@
+import os
+import time
+
+# 采样间隔（秒），可通过环境变量覆盖
+TELEMETRY_INTERVAL = float(os.environ.get('JOB_TELEMETRY_INTERVAL', 2.0))
+
+# 是否可以从/proc读取进程信息（Linux）
+PROC_AVAILABLE = os.path.exists('/proc/self/stat')
+
+if PROC_AVAILABLE:
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+    PAGE_KB = os.sysconf('SC_PAGE_SIZE') // 1024
+else:
+    CLOCK_TICKS = 100
+    PAGE_KB = 4
+
+
+# 读取/proc/<pid>/stat，返回 (CPU时间片数, 常驻内存KB)，进程不存在时返回None
+def read_proc_stat(pid):
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    # 进程名可能包含空格和括号，从最后一个')'之后开始按空格切分
+    fields = data[data.rfind(b')') + 2:].split()
+    utime, stime, rss = int(fields[11]), int(fields[12]), int(fields[21])
+    return utime + stime, rss * PAGE_KB
+
+
+# 读取/proc/<pid>/status中的VmHWM（进程启动以来的峰值常驻内存KB），读不到时返回None
+def read_peak_rss(pid):
+    try:
+        with open(f'/proc/{pid}/status', 'rb') as f:
+            for line in f:
+                if line.startswith(b'VmHWM:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+# 列出进程的直接子进程
+def read_children(pid):
+    children = []
+    try:
+        for task in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{task}/children', 'rb') as f:
+                children.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return children
+
+
+class JobTelemetry:
+    """一个任务的资源使用情况，CPU和内存是整个进程树（shell及其子进程）的合计"""
+
+    def __init__(self, job_id, pid):
+        self.job_id = job_id
+        self.pid = pid
+        self.started_at = time.time()
+        self.lines = 0
+        self.cpu_percent = None
+        self.cpu_seconds = None
+        self.rss_kb = None
+        self.peak_rss_kb = None
+        self.processes = 0
+        self._last_ticks = None
+        self._last_time = None
+
+    def to_dict(self):
+        return {
+            'id': self.job_id,
+            'pid': self.pid,
+            'elapsed': round(time.time() - self.started_at, 1),
+            'lines': self.lines,
+            'cpu_percent': self.cpu_percent,
+            'cpu_seconds': self.cpu_seconds,
+            'rss_kb': self.rss_kb,
+            'peak_rss_kb': self.peak_rss_kb,
+            'processes': self.processes
+        }
+
+
+class TelemetrySampler:
+    """运行中任务的资源采样器
+
+    每次sample()对所有被跟踪的任务做一遍：从任务的根进程沿children向下遍历，
+    每个进程只读取一次/proc/<pid>/stat。CPU%由两次采样之间CPU时间片的增量计算，
+    多核并行时可以超过100%。不支持/proc的系统上只统计运行时间和输出行数。
+    开始跟踪时立即采样一次，输出结束时调用方再用sample_job()采样一次（此时进程多半已退出，
+    只能读到最终的CPU时间），短于采样间隔的任务也有数据。峰值内存另外取进程树中各进程
+    VmHWM的最大值，采样时仍在运行的进程在两次采样之间的内存尖峰也能记录到；
+    在两次采样之间启动并退出的进程记录不到。
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._stats = {'samples': 0, 'sample_time': 0.0, 'processes_read': 0}
+
+    def track(self, job_id, pid):
+        telemetry = JobTelemetry(job_id, pid)
+        self._jobs[job_id] = telemetry
+        self.sample_job(job_id)
+        return telemetry
+
+    def untrack(self, job_id):
+        return self._jobs.pop(job_id, None)
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def sample(self):
+        if not PROC_AVAILABLE:
+            return
+        start = time.perf_counter()
+        now = time.monotonic()
+        processes_read = 0
+        for telemetry in list(self._jobs.values()):
+            processes_read += self._sample_tree(telemetry, now)
+
+        self._stats['samples'] += 1
+        self._stats['processes_read'] += processes_read
+        self._stats['sample_time'] += time.perf_counter() - start
+
+    def sample_job(self, job_id):
+        """立即采样单个任务，用于任务开始和结束时"""
+        telemetry = self._jobs.get(job_id)
+        if telemetry is None or not PROC_AVAILABLE:
+            return telemetry
+        self._stats['processes_read'] += self._sample_tree(telemetry, time.monotonic())
+        return telemetry
+
+    def _sample_tree(self, telemetry, now):
+        # 返回读取的进程数
+        ticks = 0
+        rss_kb = 0
+        hwm_kb = 0
+        count = 0
+        pending = [telemetry.pid]
+        while pending:
+            pid = pending.pop()
+            stat = read_proc_stat(pid)
+            if stat is None:
+                continue
+            ticks += stat[0]
+            rss_kb += stat[1]
+            hwm_kb = max(hwm_kb, read_peak_rss(pid) or 0)
+            count += 1
+            pending.extend(read_children(pid))
+        if count == 0:
+            return 0
+
+        # 已退出的子进程的CPU时间不再计入，合计值可能变小，此时不计算本次的CPU%
+        if telemetry._last_ticks is not None and ticks >= telemetry._last_ticks:
+            elapsed = now - telemetry._last_time
+            if elapsed > 0:
+                telemetry.cpu_percent = round((ticks - telemetry._last_ticks) / CLOCK_TICKS / elapsed * 100, 1)
+        telemetry._last_ticks = ticks
+        telemetry._last_time = now
+        telemetry.cpu_seconds = round(ticks / CLOCK_TICKS, 2)
+        telemetry.rss_kb = rss_kb
+        # 进程树当前的合计内存和单个进程的历史峰值，取较大者（根进程通常只是/bin/sh）
+        telemetry.peak_rss_kb = max(telemetry.peak_rss_kb or 0, rss_kb, hwm_kb)
+        telemetry.processes = count
+        return count
+
+    def jobs(self):
+        return [telemetry.to_dict() for telemetry in self._jobs.values()]
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats['avg_sample_ms'] = round(stats['sample_time'] / stats['samples'] * 1000, 3) if stats['samples'] else 0
+        stats['sample_time'] = round(stats['sample_time'], 3)
+        stats.update({'tracked': len(self._jobs), 'interval': TELEMETRY_INTERVAL, 'proc_available': PROC_AVAILABLE})
+        return stats
@@ -1,63 +1,149 @@
 import asyncio
 import websockets
 import json
-import subprocess
 import sys
-import os
 import signal
 import threading
+import itertools
 import uuid
 import time
+import locale
+import argparse
+import functools
+
+from output_batcher import create_batcher
+from job_scheduler import JobScheduler, SCHEDULER_CONFIG
+from event_hub import EventHub, HUB_CONFIG, GLOBAL_TOPIC
+from warm_workers import WarmWorkerPool, WARM_POOL_CONFIG
+from poet_directory import get_poet_directory
+from job_store import get_job_store, REPLAY_MAX_BYTES
+from proc_telemetry import TelemetrySampler, TELEMETRY_INTERVAL
 
 print("启动Python脚本运行服务器...")
 
 # 存储运行中的进程
 running_processes = {}
 
-# 处理命令执行
-async def run_command(websocket, command, script_id=None):
+# 任务调度器：限制同时运行的脚本数，超出的任务排队
+scheduler = JobScheduler(**SCHEDULER_CONFIG)
+
+# 任务事件的发布/订阅中心：任务的输出和状态发布到以脚本标识（scriptId）为主题的频道，
+# 发起任务的客户端和其他订阅了该任务（或全局主题）的客户端都会收到
+hub = EventHub(**HUB_CONFIG)
+
+# 流水线脚本的预热进程池，在main()中启动
+warm_pool = None
+
+# 子进程输出的编码（与原先text模式的Popen一致，使用系统默认编码）
+OUTPUT_ENCODING = locale.getpreferredencoding(False)
+
+# 单行输出的最大长度，超过后按该长度截断发送
+OUTPUT_LINE_LIMIT = 1024 * 1024
+
+# 运行中任务的CPU、内存、运行时间和输出行数
+telemetry = TelemetrySampler()
+
+# 运行中任务的资源使用情况，采样按本次运行的jobId记录，每项补上所属脚本的scriptId
+def job_usage():
+    jobs = []
+    for usage in telemetry.jobs():
+        info = running_processes.get(usage['id'])
+        usage['scriptId'] = info['script_id'] if info is not None else usage['id']
+        usage['jobId'] = usage['id']
+        jobs.append(usage)
+    return jobs
+
+# 定期采样所有运行中的任务，并把资源使用情况推送给订阅了对应脚本的客户端
+async def telemetry_loop():
+    while True:
+        await asyncio.sleep(TELEMETRY_INTERVAL)
+        try:
+            telemetry.sample()
+            for usage in job_usage():
+                hub.publish(usage['scriptId'], {
+                    'type': 'job_stats',
+                    'jobs': [usage],
+                    'scriptId': usage['scriptId'],
+                    'jobId': usage['jobId']
+                })
+        except Exception as e:
+            print(f"采样任务资源使用情况出错: {str(e)}")
+
+# 异步读取一行输出，过长的行分段返回，读到结尾时返回空字节串
+async def read_output_line(stream):
+    try:
+        return await stream.readline()
+    except ValueError:
+        # 行长度超过limit时readline会抛出异常，改为直接读取一段
+        return await stream.read(OUTPUT_LINE_LIMIT)
+
+# 处理命令执行，返回进程的退出码，出错时返回None
+# script_id是发给客户端的脚本标识，job_id区分同一脚本的每次运行（不提供时与script_id相同）
+async def run_command(websocket, command, script_id=None, preexec_fn=None, job_log=None, job_id=None):
     # 如果没有提供脚本ID，生成一个
     if not script_id:
         script_id = str(uuid.uuid4())
+    job_id = job_id or script_id
     
     process = None
+    batcher = None
+    usage = None
+    warm = None
     try:
-        # 在子进程中执行命令
-        process = subprocess.Popen(
-            command,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-            bufsize=1
-        )
+        # 流水线脚本优先交给已导入重量级库的预热进程运行
+        warm = await warm_pool.acquire(command) if warm_pool is not None else None
+        if warm is not None:
+            process, warm_info = warm
+            await websocket.send(json.dumps({
+                'type': 'output',
+                'content': f"使用预热进程运行，节省启动时间约 {warm_info['import_time']:.1f} 秒",
+                'scriptId': script_id
+            }))
+        else:
+            # 在子进程中执行命令，输出通过事件循环异步读取，不会阻塞其他客户端
+            process = await asyncio.create_subprocess_shell(
+                command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                limit=OUTPUT_LINE_LIMIT,
+                preexec_fn=preexec_fn
+            )
         
         # 存储进程信息
-        running_processes[script_id] = {
+        running_processes[job_id] = {
             'process': process,
+            'script_id': script_id,
             'command': command,
             'start_time': time.time(),
             'status': 'running'
         }
         
-        # 实时发送输出
-        for line in process.stdout:
-            try:
-                await websocket.send(json.dumps({
-                    'type': 'output',
-                    'content': line.strip(),
-                    'scriptId': script_id
-                }))
-            except Exception:
-                # 如果发送失败，假定连接已关闭
+        # 实时发送输出：逐行加入合并器，由合并器定时批量发布到事件中心（没有订阅者时不发送），
+        # 同时写入任务日志；客户端断开后也继续读取，避免管道写满导致子进程阻塞
+        batcher = create_batcher(websocket.send, script_id)
+        usage = telemetry.track(job_id, process.pid)
+        while True:
+            line = await read_output_line(process.stdout)
+            if not line:
                 break
+            usage.lines += 1
+            line = line.decode(OUTPUT_ENCODING, errors='replace').strip()
+            if job_log is not None:
+                # 输出同时写入任务日志（只入队，由任务记录线程写文件），客户端断开重连后可以回放
+                job_log.write(line)
+            await batcher.add(line)
         
-        # 等待进程完成
-        process.wait()
+        # 输出结束后、进程被回收前最后采样一次（记录最终的CPU时间），再等待进程完成，发送剩余的输出
+        telemetry.sample_job(job_id)
+        await process.wait()
+        telemetry.untrack(job_id)
+        if job_log is not None:
+            job_log.peak_rss_kb = usage.peak_rss_kb
+        await batcher.close()
         
         # 更新进程状态
-        if script_id in running_processes:
-            running_processes[script_id]['status'] = 'completed'
+        if job_id in running_processes:
+            running_processes[job_id]['status'] = 'completed'
         
         # 发送完成状态
         try:
@@ -65,15 +151,20 @@ async def run_command(websocket, command, script_id=None):
                 'type': 'status',
                 'status': 'completed',
                 'exit_code': process.returncode,
-                'scriptId': script_id
+                'output_stats': batcher.stats(),
+                'startup_saved': warm[1]['import_time'] if warm is not None else 0,
+                'resources': usage.to_dict(),
+                'scriptId': script_id,
+                'jobId': job_id
             }))
         except Exception:
             # 如果发送失败，忽略错误
             pass
             
         # 移除完成的进程
-        if script_id in running_processes:
-            del running_processes[script_id]
+        if job_id in running_processes:
+            del running_processes[job_id]
+        return process.returncode
             
     except Exception as e:
         if process:
@@ -81,10 +172,14 @@ async def run_command(websocket, command, script_id=None):
                 process.terminate()
             except:
                 pass
+        if usage is not None:
+            telemetry.untrack(job_id)
+        if batcher:
+            await batcher.close()
         
         # 更新进程状态
-        if script_id in running_processes:
-            running_processes[script_id]['status'] = 'error'
+        if job_id in running_processes:
+            running_processes[job_id]['status'] = 'error'
         
         try:
             await websocket.send(json.dumps({
@@ -95,25 +190,31 @@ async def run_command(websocket, command, script_id=None):
             await websocket.send(json.dumps({
                 'type': 'status',
                 'status': 'error',
-                'scriptId': script_id
+                'scriptId': script_id,
+                'jobId': job_id
             }))
         except Exception:
             # 如果发送失败，忽略错误
             pass
         
         # 移除出错的进程
-        if script_id in running_processes:
-            del running_processes[script_id]
+        if job_id in running_processes:
+            del running_processes[job_id]
 
-# 发送运行中脚本列表
+# 发送运行中和排队中的脚本列表
 async def send_script_list(websocket):
     scripts = []
-    for script_id, info in running_processes.items():
+    for job in scheduler.jobs():
+        usage = telemetry.get(job.id)
         scripts.append({
-            'id': script_id,
-            'command': info['command'],
-            'status': info['status'],
-            'start_time': info['start_time']
+            'id': job.script_id,
+            'jobId': job.id,
+            'command': job.command,
+            'status': job.status,
+            'position': job.position,
+            'resources': usage.to_dict() if usage is not None else None,
+            'queued_at': job.queued_at,
+            'start_time': job.started_at
         })
     
     await websocket.send(json.dumps({
@@ -121,6 +222,60 @@ async def send_script_list(websocket):
         'scripts': scripts
     }))
 
+# 任务记录（SQLite和日志文件）的读写在任务记录的线程里按提交顺序执行，不阻塞事件循环
+async def store_call(method, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(
+        get_job_store().executor, functools.partial(method, *args, **kwargs))
+
+# 任务状态变化时通知订阅了该任务的客户端
+async def notify_job_status(job):
+    message = {
+        'type': 'job_status',
+        'job': job.to_dict(),
+        'scriptId': job.script_id,
+        'jobId': job.id
+    }
+    try:
+        await store_call(get_job_store().save_job, job.to_dict())
+    except Exception as e:
+        print(f"保存任务记录失败: {str(e)}")
+    hub.publish(job.script_id, message)
+    if job.status == 'cancelled':
+        # 取消的任务不会再有完成消息，单独发送结束状态
+        hub.publish(job.script_id, {
+            'type': 'status',
+            'status': 'cancelled',
+            'scriptId': job.script_id,
+            'jobId': job.id
+        })
+
+# 把命令提交给调度器，运行时带上资源限制，输出发布到脚本的频道
+def submit_job(command, script_id, priority=None):
+    async def runner(job):
+        store = get_job_store()
+        job_log = await store_call(store.open_log, job.id)
+        exit_code = None
+        try:
+            exit_code = await run_command(hub.channel(job.script_id), command, job.script_id,
+                                          preexec_fn=scheduler.preexec_fn(), job_log=job_log,
+                                          job_id=job.id)
+            return exit_code
+        finally:
+            # 记录退出码、峰值内存和日志大小，然后关闭日志（并清理旧任务）
+            await store_call(store.save_job, job.to_dict(), exit_code=exit_code)
+            await store_call(store.close_log, job.id)
+
+    return scheduler.submit(command, runner, script_id=script_id, priority=priority,
+                            notify=notify_job_status)
+
+# 获取诗人列表：直接读取内存中的快照（按TTL在后台刷新），
+# 只有第一次加载时才在线程池中查询数据库，不阻塞事件循环
+async def get_poets():
+    directory = get_poet_directory()
+    if not directory.loaded:
+        return await asyncio.get_running_loop().run_in_executor(None, directory.poets)
+    return directory.poets()
+
 # 处理WebSocket连接
 async def handle_connection(websocket):
     print(f"客户端已连接: {websocket.remote_address}")
@@ -134,37 +289,129 @@ async def handle_connection(websocket):
                 
                 if data['action'] == 'run':
                     script_id = data.get('scriptId', str(uuid.uuid4()))
-                    await websocket.send(json.dumps({
+                    # 发起任务的客户端自动订阅该任务
+                    hub.subscribe(websocket, script_id)
+                    hub.publish(script_id, {
                         'type': 'output',
                         'content': f"运行命令: {data['command']}",
                         'scriptId': script_id
-                    }))
-                    # 异步运行命令
-                    asyncio.create_task(run_command(websocket, data['command'], script_id))
+                    })
+                    # 交给调度器，有空闲名额时异步运行命令，否则排队
+                    job = submit_job(data['command'], script_id, data.get('priority'))
+                    if job.status == 'queued':
+                        hub.publish(script_id, {
+                            'type': 'output',
+                            'content': f"同时运行的任务已达上限，已加入队列，当前排在第 {job.position} 位",
+                            'scriptId': script_id,
+                            'jobId': job.id
+                        })
+                
+                elif data['action'] == 'subscribe':
+                    # 订阅某个任务的事件，不带scriptId时订阅所有任务的事件
+                    hub.subscribe(websocket, data.get('scriptId') or GLOBAL_TOPIC)
+                
+                elif data['action'] == 'unsubscribe':
+                    hub.unsubscribe(websocket, data.get('scriptId') or GLOBAL_TOPIC)
                 
                 elif data['action'] == 'list_scripts':
                     # 发送当前运行的脚本列表
                     await send_script_list(websocket)
                 
-                elif data['action'] == 'terminate':
-                    # 终止特定脚本
+                elif data['action'] in ('terminate', 'cancel'):
+                    # 终止任务：带jobId时只处理这一次运行，只带scriptId时处理该脚本所有排队和运行中的任务；
+                    # 还在排队的任务直接取消
+                    job_id = data.get('jobId')
                     script_id = data.get('scriptId')
-                    if script_id and script_id in running_processes:
-                        process_info = running_processes[script_id]
-                        process_info['process'].terminate()
-                        await websocket.send(json.dumps({
-                            'type': 'output',
-                            'content': f"已终止命令: {process_info['command']}",
-                            'scriptId': script_id
-                        }))
+                    if job_id:
+                        jobs = [job for job in [scheduler.get(job_id)] if job is not None]
+                    else:
+                        jobs = scheduler.find(script_id) if script_id else []
+                    for job in jobs:
+                        if scheduler.cancel(job.id):
+                            hub.publish(job.script_id, {
+                                'type': 'output',
+                                'content': "已取消排队中的任务",
+                                'scriptId': job.script_id,
+                                'jobId': job.id
+                            })
+                        elif job.id in running_processes:
+                            process_info = running_processes[job.id]
+                            job.status = 'terminated'
+                            process_info['process'].terminate()
+                            hub.publish(job.script_id, {
+                                'type': 'output',
+                                'content': f"已终止命令: {process_info['command']}",
+                                'scriptId': job.script_id,
+                                'jobId': job.id
+                            })
+                
+                elif data['action'] == 'job_status':
+                    # 查询任务状态（含排队位置和排队/运行/结束时间），按jobId或scriptId查询，都不带时返回所有任务
+                    job_id = data.get('jobId')
+                    script_id = data.get('scriptId')
+                    if job_id:
+                        job = scheduler.get(job_id)
+                        jobs = [job.to_dict()] if job is not None else []
+                    elif script_id:
+                        jobs = [job.to_dict() for job in scheduler.find(script_id, include_finished=True)]
+                    else:
+                        jobs = [job.to_dict() for job in scheduler.jobs(include_finished=True)]
+                    await websocket.send(json.dumps({
+                        'type': 'job_list',
+                        'jobs': jobs,
+                        'scheduler': scheduler.stats(),
+                        'warm_pool': warm_pool.stats() if warm_pool is not None else None
+                    }))
+                
+                elif data['action'] == 'job_stats':
+                    # 运行中任务的CPU%、内存、运行时间和输出行数（最近一次采样的结果）
+                    await websocket.send(json.dumps({
+                        'type': 'job_stats',
+                        'jobs': job_usage(),
+                        'sampler': telemetry.stats()
+                    }))
+                
+                elif data['action'] == 'job_history':
+                    # 查询最近的任务记录（包括服务器重启前的任务），带scriptId时只返回该脚本的每次运行
+                    script_id = data.get('scriptId')
+                    if script_id is not None and not isinstance(script_id, str):
+                        raise ValueError("scriptId必须是字符串")
+                    jobs = await store_call(get_job_store().recent_jobs, int(data.get('limit', 50)), script_id)
+                    await websocket.send(json.dumps({
+                        'type': 'job_history',
+                        'jobs': jobs
+                    }))
+                
+                elif data['action'] == 'replay':
+                    # 从指定偏移量回放任务的输出，客户端用返回的next_offset继续请求，直到eof；
+                    # 带jobId时回放那一次运行，只带scriptId时回放该脚本最近一次运行
+                    job_id = data.get('jobId')
+                    script_id = data.get('scriptId')
+                    if not isinstance(job_id or script_id, str) or not (job_id or script_id):
+                        raise ValueError("replay需要提供jobId或scriptId")
+                    store = get_job_store()
+                    if not job_id:
+                        job_id = await store_call(store.latest_job_id, script_id)
+                    offset = int(data.get('offset', 0))
+                    max_bytes = int(data.get('max_bytes', REPLAY_MAX_BYTES))
+                    if job_id is None:
+                        result = {'lines': [], 'offset': offset, 'next_offset': offset, 'skipped': 0, 'eof': True}
+                        job = None
+                    else:
+                        result = await store_call(store.replay, job_id, offset, max_bytes)
+                        job = await store_call(store.get_job, job_id)
+                    result.update({
+                        'type': 'replay',
+                        'scriptId': job['script_id'] if job is not None else script_id,
+                        'jobId': job_id,
+                        'job': job
+                    })
+                    await websocket.send(json.dumps(result))
                 
                 elif data['action'] == 'fetch_poets':
                     # 获取诗人列表
                     try:
-                        # 尝试导入获取诗人列表的函数
-                        sys.path.append(os.path.join(os.path.dirname(__file__)))
-                        from wordcloud_api_server import get_poets
-                        poets = get_poets()
+                        poets = await get_poets()
                         await websocket.send(json.dumps({
                             'type': 'poet_list',
                             'success': True,
@@ -183,22 +430,43 @@ async def handle_connection(websocket):
                     'type': 'output',
                     'content': "错误: 收到无效的JSON数据"
                 }))
+            except (KeyError, TypeError, ValueError) as e:
+                # 缺少字段或字段类型不对时只回复错误，不断开连接
+                await websocket.send(json.dumps({
+                    'type': 'output',
+                    'content': f"错误: 无效的请求参数 {e!r}"
+                }))
     except websockets.exceptions.ConnectionClosed:
         print("客户端断开连接")
+    finally:
+        # 取消该客户端的所有订阅
+        hub.remove(websocket)
 
 # 清理所有运行中的进程
 def cleanup_processes():
-    for script_id, info in list(running_processes.items()):
+    for job_id, info in list(running_processes.items()):
         try:
-            if info['process'].poll() is None:  # 如果进程仍在运行
+            if info['process'].returncode is None:  # 如果进程仍在运行
                 info['process'].terminate()
                 print(f"已终止进程: {info['command']}")
         except:
             pass
     running_processes.clear()
+    if warm_pool is not None:
+        warm_pool.kill_idle()
 
 # 启动WebSocket服务器
 async def main():
+    global warm_pool
+    # 启动流水线脚本的预热进程
+    if WARM_POOL_CONFIG['size'] > 0:
+        warm_pool = WarmWorkerPool(WARM_POOL_CONFIG['size'], scheduler.preexec_fn(), OUTPUT_LINE_LIMIT)
+        await warm_pool.start()
+    # 定期采样运行中任务的资源使用情况
+    asyncio.create_task(telemetry_loop())
+    # 后台预先加载诗人列表
+    threading.Thread(target=get_poet_directory().preload, daemon=True).start()
+    
     # 在localhost的6789端口上启动WebSocket服务器
     server = await websockets.serve(handle_connection, "localhost", 6789)
     print("服务器已启动在 ws://localhost:6789")
@@ -218,8 +486,77 @@ def signal_handler(sig, frame):
 signal.signal(signal.SIGINT, signal_handler)
 signal.signal(signal.SIGTERM, signal_handler)
 
+# 自检用的WebSocket替身，记录发送的消息和所有替身共用的到达序号
+class RecordingWebSocket:
+    arrivals = itertools.count()
+
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, message):
+        self.messages.append((next(self.arrivals), json.loads(message)))
+
+# 自检：同时运行多个输出频繁的子进程，检查输出是否完整、事件循环是否保持响应
+async def check_concurrent_streams(scripts=4, lines=2000):
+    # 每100行暂停10ms，让每个子进程的输出跨越多个合并周期
+    child = f"import time; [(print('line', i, flush=True), i % 100 or time.sleep(0.01)) for i in range({lines})]"
+    command = f'"{sys.executable}" -c "{child}"'
+
+    # 另一个协程每10ms醒来一次，记录最大的调度延迟，模拟其他客户端的请求
+    lag = {'max': 0.0, 'ticks': 0}
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lag['max'] = max(lag['max'], time.perf_counter() - start - 0.01)
+            lag['ticks'] += 1
+
+    sockets = [RecordingWebSocket() for _ in range(scripts)]
+    ticker_task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(run_command(ws, command, f"check-{i}") for i, ws in enumerate(sockets)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await ticker_task
+
+    ok = True
+    # 每个脚本第一帧和最后一帧（含最后一行）的到达序号
+    spans = []
+    for i, ws in enumerate(sockets):
+        batches = [(arrival, m['lines']) for arrival, m in ws.messages if m['type'] == 'output_batch']
+        numbers = [int(line.split()[1]) for _, batch in batches for line in batch]
+        status = [m for _, m in ws.messages if m['type'] == 'status']
+        complete = numbers == list(range(lines)) and status and status[-1].get('exit_code') == 0
+        ok = ok and complete
+        if batches:
+            spans.append((batches[0][0], batches[-1][0]))
+        print(f"脚本 {i}: 收到 {len(numbers)}/{lines} 行输出（{len(batches)} 帧，"
+              f"行号{'连续' if numbers == list(range(lines)) else '不连续'}），"
+              f"状态: {status[-1].get('exit_code') if status else None}，"
+              f"合并统计: {status[-1].get('output_stats') if status else None}")
+
+    # 任何一个脚本发出最后一行之前，其他脚本都应该已经发出过输出，而不是一个接一个
+    overlapped = len(spans) == scripts and max(s for s, _ in spans) < min(e for _, e in spans)
+    print(f"总用时 {elapsed:.2f} 秒，事件循环最大延迟 {lag['max'] * 1000:.1f} ms（{lag['ticks']} 次调度）")
+    print(f"各脚本输出交替进行: {'是' if overlapped else '否'}")
+    print("自检通过" if ok and overlapped else "自检失败")
+    return ok and overlapped
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='Python脚本运行WebSocket服务器')
+    parser.add_argument('--check_streams', type=int, default=None,
+                        help='不启动服务器，同时运行N个输出频繁的子进程进行自检')
+    parser.add_argument('--check_lines', type=int, default=2000, help='自检时每个子进程输出的行数')
+    return parser.parse_args()
+
 # 启动服务器
 if __name__ == "__main__":
+    args = parse_args()
+    if args.check_streams:
+        sys.exit(0 if asyncio.run(check_concurrent_streams(args.check_streams, args.check_lines)) else 1)
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
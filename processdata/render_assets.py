@@ -0,0 +1,240 @@
+import os
+import time
+import threading
+import collections
+
+import numpy as np
+import cv2
+from PIL import Image
+from wordcloud import ImageColorGenerator, STOPWORDS
+
+# 蒙版、停用词所在目录的候选位置（按顺序查找）
+CIYUNTU_DIRS = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ciyuntu'),
+    os.path.join('processdata', 'ciyuntu'),
+    os.path.join('..', 'ciyuntu'),
+    'ciyuntu',
+    os.path.join('..', '..', 'processdata', 'ciyuntu'),
+    os.path.abspath(os.path.join('D:', '01', 'lunwen', 'processdata', 'ciyuntu'))
+]
+
+
+def ciyuntu_paths(filename):
+    return [os.path.join(directory, filename) for directory in CIYUNTU_DIRS]
+
+
+# 停用词文件的候选路径
+STOPWORDS_PATHS = ciyuntu_paths('stopwords2.txt')
+
+# 常见的中文字体路径
+FONT_PATHS = [
+    'C:\\Windows\\Fonts\\simhei.ttf',  # Windows黑体
+    'C:\\Windows\\Fonts\\simkai.ttf',  # Windows楷体
+    'C:\\Windows\\Fonts\\simsun.ttc',  # Windows宋体
+    'C:\\Windows\\Fonts\\msyh.ttc',    # Windows微软雅黑
+    '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',  # Linux文泉驿微米黑
+    '/System/Library/Fonts/PingFang.ttc'  # macOS苹方
+]
+
+# 找不到任何字体时使用的默认路径
+DEFAULT_FONT_PATH = 'C:\\Windows\\Fonts\\simhei.ttf'
+
+# 基本中文停用词
+CHINESE_STOPWORDS = {'的', '了', '和', '是', '在', '我', '有', '与', '这', '那', '你', '他', '她', '它'}
+
+# 可供请求选择的蒙版：名称 -> 候选路径
+MASKS = {
+    'default': ciyuntu_paths('ciyun1.png'),
+    'ciyun': ciyuntu_paths('ciyun.png'),
+    'ciyun2': ciyuntu_paths('ciyun2.png'),
+    'anli1': ciyuntu_paths('anli1.png'),
+    'anlie': ciyuntu_paths('anlie.png'),
+    'zhezhao': ciyuntu_paths('zhezhao.png')
+}
+
+# 两次检查文件修改时间之间的最短间隔（秒）
+CHECK_INTERVAL = 2.0
+
+# 一套渲染资源；数组均为只读，可在线程间共享，也可以pickle后传给子进程
+RenderAssets = collections.namedtuple('RenderAssets', [
+    'mask_name', 'mask_data', 'inner_mask', 'image_colors', 'font_path', 'stopwords', 'fingerprint'
+])
+
+
+# 返回候选路径中第一个存在的文件，都不存在时返回None
+def find_existing(paths):
+    for path in paths:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+# 文件指纹：路径 + 修改时间 + 大小，文件变化后指纹随之变化
+def file_fingerprint(path):
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+# 加载停用词列表
+def load_stopwords(paths=STOPWORDS_PATHS):
+    stopwords = set(STOPWORDS)
+    stopwords.update(CHINESE_STOPWORDS)
+
+    path = find_existing(paths)
+    if path is None:
+        print("警告: 无法加载stopwords2.txt文件，将只使用基本停用词")
+        return frozenset(stopwords)
+
+    with open(path, 'r', encoding='utf-8') as f:
+        stopwords.update(line.strip() for line in f if line.strip())
+    stopwords = frozenset(stopwords)
+    print(f"成功从 {path} 加载停用词，总共 {len(stopwords)} 个停用词")
+    return stopwords
+
+
+# 检查并确保字体文件存在
+def ensure_font_exists(paths=FONT_PATHS):
+    font_path = find_existing(paths)
+    if font_path is not None:
+        print(f"使用字体: {font_path}")
+        return font_path
+
+    # 如果找不到任何字体，给出警告并使用默认路径
+    print("警告: 找不到任何中文字体文件，将使用默认字体路径，可能导致中文显示为方块")
+    return DEFAULT_FONT_PATH
+
+
+# 读取蒙版图片，返回(RGBA数组, 缩小后的内部蒙版)
+def load_mask(path):
+    mask_img = Image.open(path).convert('RGBA')
+    print(f"成功加载蒙版图片: {path}，尺寸: {mask_img.size}")
+    mask_data = np.array(mask_img)
+
+    # 创建一个只在轮廓内部有值的mask
+    mask = np.zeros(mask_data.shape[:2], np.uint8)
+    mask[mask_data[:, :, 3] <= 50] = 255  # 不透明区域（轮廓内部）
+    mask[mask_data[:, :, 3] > 50] = 0     # 透明区域（轮廓外部）
+
+    # 清理mask噪点
+    kernel = np.ones((3, 3), np.uint8)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+
+    # 创建缩小的内部mask，避免文字太靠近边缘
+    erosion_kernel = np.ones((5, 5), np.uint8)
+    inner_mask = cv2.erode(mask, erosion_kernel, iterations=1)
+
+    print(f"蒙版中非零像素数量: {np.count_nonzero(mask)}，内部蒙版中非零像素数量: {np.count_nonzero(inner_mask)}")
+    mask_data.setflags(write=False)
+    inner_mask.setflags(write=False)
+    return mask_data, inner_mask
+
+
+class AssetRegistry:
+    """渲染资源注册表
+
+    蒙版（含形态学处理和颜色生成器）、停用词和字体在第一次使用时加载一次，
+    之后直接复用。每隔check_interval秒检查一次源文件的修改时间，
+    只有文件变化时才重新加载对应的资源。
+    """
+
+    def __init__(self, masks=None, stopwords_paths=STOPWORDS_PATHS, font_paths=FONT_PATHS,
+                 check_interval=CHECK_INTERVAL):
+        self.stopwords_paths = list(stopwords_paths)
+        self.font_paths = list(font_paths)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mask_paths = {}
+        self._masks = {}     # 名称 -> (指纹, mask_data, inner_mask, image_colors)
+        self._shared = None  # (停用词指纹, 字体指纹, stopwords, font_path)
+        self._assets = {}    # 名称 -> RenderAssets
+        self._checked_at = {}
+        for name, paths in (masks or MASKS).items():
+            self.register_mask(name, paths)
+
+    def register_mask(self, name, paths):
+        """注册一个可按名称选择的蒙版"""
+        if isinstance(paths, str):
+            paths = [paths]
+        with self._lock:
+            self._mask_paths[name] = list(paths)
+            self._assets.pop(name, None)
+            self._checked_at.pop(name, None)
+
+    def mask_names(self):
+        return sorted(self._mask_paths)
+
+    def _load_shared_locked(self):
+        stopwords_path = find_existing(self.stopwords_paths)
+        font_path = find_existing(self.font_paths)
+        stopwords_fp = file_fingerprint(stopwords_path)
+        font_fp = file_fingerprint(font_path)
+        if self._shared is None or self._shared[:2] != (stopwords_fp, font_fp):
+            if self._shared is not None:
+                print("停用词或字体文件已变化，重新加载")
+            self._shared = (stopwords_fp, font_fp,
+                            load_stopwords(self.stopwords_paths), ensure_font_exists(self.font_paths))
+        return self._shared
+
+    def _load_mask_locked(self, name):
+        path = find_existing(self._mask_paths[name])
+        if path is None:
+            raise FileNotFoundError(f"无法找到蒙版图片 {name}，请确保文件存在并提供正确的路径")
+        fingerprint = file_fingerprint(path)
+        cached = self._masks.get(name)
+        if cached is None or cached[0] != fingerprint:
+            if cached is not None:
+                print(f"蒙版图片 {path} 已变化，重新加载")
+            mask_data, inner_mask = load_mask(path)
+            cached = (fingerprint, mask_data, inner_mask, ImageColorGenerator(mask_data))
+            self._masks[name] = cached
+        return cached
+
+    def get(self, mask_name='default'):
+        """返回指定蒙版的一套渲染资源"""
+        if mask_name not in self._mask_paths:
+            raise KeyError(f"未注册的蒙版: {mask_name}")
+
+        now = time.monotonic()
+        assets = self._assets.get(mask_name)
+        if assets is not None and now - self._checked_at.get(mask_name, 0) < self.check_interval:
+            return assets
+
+        with self._lock:
+            mask_fp, mask_data, inner_mask, image_colors = self._load_mask_locked(mask_name)
+            stopwords_fp, font_fp, stopwords, font_path = self._load_shared_locked()
+            fingerprint = f"{mask_name}|{mask_fp}|{stopwords_fp}|{font_fp}"
+            assets = self._assets.get(mask_name)
+            if assets is None or assets.fingerprint != fingerprint:
+                assets = RenderAssets(mask_name, mask_data, inner_mask, image_colors,
+                                      font_path, stopwords, fingerprint)
+                self._assets[mask_name] = assets
+            self._checked_at[mask_name] = now
+        return assets
+
+    def preload(self):
+        """启动时加载所有已注册的蒙版，找不到的蒙版只打印警告"""
+        for name in self.mask_names():
+            try:
+                self.get(name)
+            except FileNotFoundError as e:
+                print(f"警告: {str(e)}")
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+# 获取进程内共享的默认资源注册表
+def get_asset_registry():
+    global _default_registry
+    if _default_registry is None:
+        with _default_registry_lock:
+            if _default_registry is None:
+                _default_registry = AssetRegistry()
+    return _default_registry
@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import collections
+
+# 缓存目录默认位置
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'wordclouds')
+
+# 缓存容量配置，可通过环境变量覆盖
+CACHE_CONFIG = {
+    'memory_max_bytes': int(os.environ.get('WORDCLOUD_CACHE_MEMORY_MB', 64)) * 1024 * 1024,
+    'disk_max_bytes': int(os.environ.get('WORDCLOUD_CACHE_DISK_MB', 512)) * 1024 * 1024
+}
+
+# 磁盘超出上限后清理到上限的这个比例，避免每次写入都触发清理
+DISK_EVICT_TARGET = 0.9
+
+CacheEntry = collections.namedtuple('CacheEntry', ['key', 'data', 'meta'])
+
+
+# 由各个参与渲染的部分计算内容哈希作为缓存键
+def make_cache_key(*parts):
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# 词频的哈希（与Counter中元素的插入顺序无关）
+def hash_word_counts(word_counts):
+    digest = hashlib.sha256()
+    for word, count in sorted(word_counts.items()):
+        digest.update(f"{word}\t{count}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """渲染结果缓存：内存LRU + 磁盘两级
+
+    键是渲染输入的内容哈希，值是编码好的图片字节。内存层按字节数做LRU淘汰，
+    磁盘层按文件修改时间淘汰最久未使用的条目。每个条目记录所属诗人，
+    诗人的数据变化后可以通过invalidate()删除对应条目。
+    """
+
+    def __init__(self, directory=CACHE_DIR, memory_max_bytes=64 * 1024 * 1024,
+                 disk_max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._memory = collections.OrderedDict()  # key -> CacheEntry，最近使用的在末尾
+        self._memory_bytes = 0
+        self._disk_bytes = self._scan_disk_bytes()
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+            'invalidations': 0
+        }
+
+    def _paths(self, key):
+        return (os.path.join(self.directory, key + '.bin'),
+                os.path.join(self.directory, key + '.json'))
+
+    def _scan_disk_bytes(self):
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.bin'):
+                continue
+            try:
+                total += os.path.getsize(os.path.join(self.directory, name))
+            except OSError:
+                continue
+        return total
+
+    def _remember_locked(self, entry):
+        if len(entry.data) > self.memory_max_bytes:
+            return
+        old = self._memory.pop(entry.key, None)
+        if old is not None:
+            self._memory_bytes -= len(old.data)
+        self._memory[entry.key] = entry
+        self._memory_bytes += len(entry.data)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted.data)
+            self._stats['memory_evictions'] += 1
+
+    def get(self, key):
+        """查找缓存，未命中返回None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return entry
+
+        data_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(data_path, 'rb') as f:
+                data = f.read()
+            # 更新修改时间，作为磁盘层的LRU依据
+            os.utime(data_path)
+        except (OSError, ValueError):
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+
+        entry = CacheEntry(key, data, meta)
+        with self._lock:
+            self._stats['disk_hits'] += 1
+            self._remember_locked(entry)
+        return entry
+
+    def put(self, key, data, poet=None, **meta):
+        """写入缓存，meta中可以附带content_type等信息"""
+        meta = dict(meta, poet=poet, size=len(data), created_at=time.time())
+        entry = CacheEntry(key, data, meta)
+        with self._lock:
+            self._remember_locked(entry)
+            self._stats['stores'] += 1
+
+        data_path, meta_path = self._paths(key)
+        try:
+            # 覆盖已有的条目时先扣除旧文件的大小
+            old_size = os.path.getsize(data_path)
+        except OSError:
+            old_size = 0
+        try:
+            # 先写临时文件再替换，避免其他进程读到写了一半的文件
+            tmp_suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(data_path + tmp_suffix, 'wb') as f:
+                f.write(data)
+            with open(meta_path + tmp_suffix, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(data_path + tmp_suffix, data_path)
+            os.replace(meta_path + tmp_suffix, meta_path)
+        except OSError as e:
+            print(f"写入词云缓存文件失败: {str(e)}")
+            return entry
+
+        with self._lock:
+            self._disk_bytes += len(data) - old_size
+            over_limit = self._disk_bytes > self.disk_max_bytes
+        if over_limit:
+            self._evict_disk()
+        return entry
+
+    def _evict_disk(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.bin'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, name[:-len('.bin')]))
+
+        # 按最近使用时间从旧到新删除
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        target = self.disk_max_bytes * DISK_EVICT_TARGET
+        evicted = 0
+        for _, size, key in files:
+            if total <= target:
+                break
+            self._remove_files(key)
+            total -= size
+            evicted += 1
+
+        with self._lock:
+            self._disk_bytes = total
+            self._stats['disk_evictions'] += evicted
+
+    def _remove_files(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def invalidate(self, poets):
+        """删除属于指定诗人的所有缓存条目，返回删除的条目数"""
+        poets = set(poets)
+        if not poets:
+            return 0
+
+        removed = set()
+        with self._lock:
+            for key, entry in list(self._memory.items()):
+                if entry.meta.get('poet') in poets:
+                    del self._memory[key]
+                    self._memory_bytes -= len(entry.data)
+                    removed.add(key)
+
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            key = name[:-len('.json')]
+            try:
+                with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+                    poet = json.load(f).get('poet')
+            except (OSError, ValueError):
+                continue
+            if poet in poets:
+                self._remove_files(key)
+                removed.add(key)
+
+        with self._lock:
+            self._disk_bytes = self._scan_disk_bytes()
+            self._stats['invalidations'] += len(removed)
+        return len(removed)
+
+    def stats(self):
+        """返回缓存的统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'memory_max_bytes': self.memory_max_bytes,
+                'disk_bytes': self._disk_bytes,
+                'disk_max_bytes': self.disk_max_bytes
+            })
+        return stats
+
+
+class SingleFlight:
+    """合并同时进行的相同计算
+
+    同一个键的第一个调用者负责计算，计算期间到达的其他调用者等待并共享
+    同一个结果（或同一个异常），计算结束后键即被移除，不缓存结果。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> [完成事件, 结果, 异常]
+        self._stats = {
+            'executed': 0,   # 实际执行计算的次数
+            'coalesced': 0   # 被合并、直接等待他人结果的请求数
+        }
+
+    def do(self, key, func):
+        """执行func()并返回 (结果, 是否共享了其他请求的结果)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = [threading.Event(), None, None]
+                self._calls[key] = call
+                self._stats['executed'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1], True
+
+        try:
+            call[1] = func()
+        except BaseException as e:
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call[0].set()
+        return call[1], False
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+        return stats
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+# 获取进程内共享的默认渲染缓存
+def get_render_cache():
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = RenderCache(CACHE_DIR, **CACHE_CONFIG)
+    return _default_cache
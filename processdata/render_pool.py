@@ -0,0 +1,281 @@
+import os
+import sys
+import time
+import types
+import atexit
+import threading
+import traceback
+import contextlib
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from wordcloud import WordCloud
+
+from render_assets import get_asset_registry
+from wordcloud_encode import encode_wordcloud
+
+# 词云参数（蒙版、字体、停用词、尺寸在生成时另外传入）
+WORDCLOUD_PARAMS = {
+    'background_color': None,   # 将背景设置为透明
+    'mode': "RGBA",             # 使用RGBA模式支持透明度
+    'max_font_size': 45,        # 降低最大字体大小（原为60）
+    'min_font_size': 8,         # 添加最小字体大小
+    'prefer_horizontal': 0.9,
+    'relative_scaling': 0.5,    # 降低词频对字体大小的影响（原为0.8）
+    'random_state': 42,
+    # 添加额外参数以支持中文
+    'collocations': False,      # 避免词组重复
+    'regexp': r"[\w\u4e00-\u9fa5]+"  # 增加对中文字符的支持
+}
+
+
+# 生成词云图
+def generate_wordcloud(word_counts, max_words=2000, mask_name='default'):
+    if not word_counts:
+        return None, None
+        
+    # 蒙版、字体、停用词在启动时已加载，这里直接取用
+    try:
+        assets = get_asset_registry().get(mask_name)
+    except FileNotFoundError as e:
+        print(f"错误：{str(e)}")
+        return None, None
+    
+    try:
+        wordcloud = WordCloud(
+            mask=assets.inner_mask,
+            max_words=max_words,
+            stopwords=assets.stopwords,  # 添加停用词
+            font_path=assets.font_path,  # 使用已确认存在的字体
+            width=assets.inner_mask.shape[1],
+            height=assets.inner_mask.shape[0],
+            **WORDCLOUD_PARAMS
+        ).generate_from_frequencies(word_counts)
+        
+        if wordcloud is None or len(wordcloud.words_) == 0:
+            print("警告：词云生成失败或为空！")
+            return None, None
+
+        print(f"词云中的词语数量: {len(wordcloud.words_)}")
+        
+        # 使用图像颜色为词云着色
+        colored_wordcloud = wordcloud.recolor(color_func=assets.image_colors)
+        
+        return wordcloud, colored_wordcloud
+        
+    except Exception as e:
+        print(f"生成词云图像时出错: {str(e)}")
+        traceback.print_exc()
+        return None, None
+
+
+# 渲染进程池配置，可通过环境变量覆盖；workers为0时在请求线程内直接渲染
+RENDER_POOL_CONFIG = {
+    'workers': int(os.environ.get('WORDCLOUD_RENDER_WORKERS', min(4, os.cpu_count() or 1))),
+    'max_queue': int(os.environ.get('WORDCLOUD_RENDER_MAX_QUEUE', 16)),     # 排队 + 执行中的任务上限
+    'timeout': float(os.environ.get('WORDCLOUD_RENDER_TIMEOUT', 60))        # 单个请求等待渲染结果的最长时间
+}
+
+# 保留最近多少个任务的耗时记录
+RECENT_JOBS = 50
+
+
+class RenderQueueFull(Exception):
+    """渲染队列已满"""
+
+
+class RenderTimeout(Exception):
+    """等待渲染结果超时"""
+
+
+# 工作进程初始化：预先加载所有蒙版、停用词和字体
+def _init_worker():
+    get_asset_registry().preload()
+
+
+# 空任务，用于提前启动工作进程
+def _noop():
+    return os.getpid()
+
+
+# 启动工作进程时临时替换的空__main__模块
+_EMPTY_MAIN = types.ModuleType('__main__')
+
+
+@contextlib.contextmanager
+def _without_main_script():
+    """启动工作进程期间把__main__换成空模块
+
+    spawn启动工作进程时会按__main__.__file__把启动脚本重新导入为__mp_main__，
+    由wordcloud_api_server启动时工作进程就会再导入一遍Flask、pymysql等。
+    替换对整个进程可见，所以只在创建或重建进程池、一次性启动全部工作进程时使用，
+    不在每次渲染请求中使用。
+    """
+    main_module = sys.modules.get('__main__')
+    sys.modules['__main__'] = _EMPTY_MAIN
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = main_module
+
+
+# 在工作进程中执行的渲染任务，返回 (图片字节, Content-Type, 耗时)
+def render_job(word_counts, mask_name, encode_options, submitted_at):
+    started = time.time()
+    _, colored_wordcloud = generate_wordcloud(word_counts, mask_name=mask_name)
+    if colored_wordcloud is None:
+        raise RuntimeError('词云生成失败')
+    rendered = time.time()
+    image_data, content_type = encode_wordcloud(colored_wordcloud, **encode_options)
+    finished = time.time()
+    return image_data, content_type, {
+        'queued_ms': round((started - submitted_at) * 1000, 1),
+        'render_ms': round((rendered - started) * 1000, 1),
+        'encode_ms': round((finished - rendered) * 1000, 1),
+        'pid': os.getpid()
+    }
+
+
+class RenderPool:
+    """词云渲染进程池
+
+    WordCloud布局是纯Python的CPU密集计算，放在多个进程里才能并行。
+    每个工作进程启动时预加载渲染资源；排队 + 执行中的任务超过max_queue时
+    直接拒绝（由调用方返回503），不让请求无限堆积。
+    """
+
+    def __init__(self, workers=2, max_queue=16, timeout=60):
+        if workers < 1:
+            raise ValueError("workers必须大于0")
+        self.workers = workers
+        self.max_queue = max(max_queue, workers)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._executor = self._create_executor()
+        self._recent = collections.deque(maxlen=RECENT_JOBS)
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'timeouts': 0,
+            'restarts': 0
+        }
+
+    def _create_executor(self):
+        # 使用spawn，避免在多线程的Flask进程中fork
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+
+    def warm_up(self):
+        """提交与工作进程数相同的空任务，让全部工作进程提前启动并完成预加载
+
+        进程池只在没有空闲进程时才新建进程，工作进程启动需要较长时间，
+        连续提交workers个空任务会一次启动全部进程，之后的渲染任务不再新建进程。
+        """
+        with self._lock:
+            executor = self._executor
+        with _without_main_script():
+            for _ in range(self.workers):
+                executor.submit(_noop)
+
+    def _job_done(self, future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def render(self, word_counts, mask_name='default', encode_options=None, poet=None):
+        """提交渲染任务并等待结果，返回 (图片字节, Content-Type)"""
+        with self._lock:
+            if self._in_flight >= self.max_queue:
+                self._stats['rejected'] += 1
+                raise RenderQueueFull(f"渲染队列已满（{self._in_flight}/{self.max_queue}）")
+            self._in_flight += 1
+            self._stats['submitted'] += 1
+            executor = self._executor
+
+        submitted_at = time.time()
+        try:
+            future = executor.submit(render_job, word_counts, mask_name, encode_options or {}, submitted_at)
+        except BrokenProcessPool:
+            with self._lock:
+                self._in_flight -= 1
+            self._restart(executor)
+            raise
+        future.add_done_callback(self._job_done)
+
+        job = {'poet': poet, 'mask': mask_name, 'submitted_at': submitted_at}
+        try:
+            image_data, content_type, timings = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # 还没开始执行的任务直接取消，已在执行的任务让它跑完
+            future.cancel()
+            self._record(job, 'timeout', 'timeouts')
+            raise RenderTimeout(f"{self.timeout}秒内没有完成渲染")
+        except BrokenProcessPool:
+            self._record(job, 'error', 'failed')
+            self._restart(executor)
+            raise
+        except Exception:
+            self._record(job, 'error', 'failed')
+            raise
+
+        job.update(timings)
+        self._record(job, 'completed', 'completed')
+        return image_data, content_type
+
+    def _record(self, job, status, counter):
+        job['status'] = status
+        job['total_ms'] = round((time.time() - job['submitted_at']) * 1000, 1)
+        with self._lock:
+            self._stats[counter] += 1
+            self._recent.append(job)
+
+    def _restart(self, broken_executor):
+        # 工作进程异常退出后进程池不可再用，重新创建
+        with self._lock:
+            if self._executor is not broken_executor:
+                return
+            print("渲染进程池已损坏，正在重新创建")
+            self._executor = self._create_executor()
+            self._stats['restarts'] += 1
+        broken_executor.shutdown(wait=False)
+        self.warm_up()
+
+    def stats(self):
+        """返回队列深度、计数和最近任务的耗时"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'in_flight': self._in_flight,
+                'queue_depth': max(0, self._in_flight - self.workers),
+                'recent_jobs': list(self._recent)
+            })
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+# 获取进程内共享的渲染进程池，workers配置为0时返回None
+def get_render_pool():
+    global _default_pool
+    if RENDER_POOL_CONFIG['workers'] <= 0:
+        return None
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                _default_pool = RenderPool(**RENDER_POOL_CONFIG)
+                atexit.register(_default_pool.shutdown)
+    return _default_pool
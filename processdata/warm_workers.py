@@ -0,0 +1,255 @@
+import os
+import sys
+import json
+import time
+import shlex
+import runpy
+import asyncio
+import argparse
+import importlib
+import traceback
+
+# 预热进程池配置，可通过环境变量覆盖
+WARM_POOL_CONFIG = {
+    'size': int(os.environ.get('WARM_WORKERS', 1))  # 保持空闲待命的预热进程数，0表示不使用
+}
+
+# 可以在预热进程中运行的流水线脚本（文件名）
+PIPELINE_SCRIPTS = ('topic_clustering.py', 'emotion_visualization.py')
+
+# 预热进程启动时预先导入的库
+HEAVY_MODULES = [
+    'numpy',
+    'pandas',
+    'matplotlib.pyplot',
+    'seaborn',
+    'scipy.spatial',
+    'scipy.interpolate',
+    'sklearn.cluster',
+    'sklearn.manifold',
+    'sklearn.decomposition',
+    'umap',
+    'mysql.connector'
+]
+
+# 命令中出现这些字符时需要shell解释，不使用预热进程
+SHELL_CHARACTERS = set('|&;<>`$()*?')
+
+# 被认为是Python解释器的命令名
+PYTHON_NAMES = ('python', 'python3', 'python.exe', 'python3.exe', 'py')
+
+# 预热进程导入完成后输出的就绪标记
+READY_MARKER = '__WARM_WORKER_READY__ '
+
+WORKER_SCRIPT = os.path.abspath(__file__)
+
+
+# 判断命令是否为可预热运行的流水线脚本，是则返回脚本的argv（脚本为绝对路径），否则返回None
+def match_pipeline(command, cwd=None):
+    if any(ch in SHELL_CHARACTERS for ch in command):
+        return None
+    try:
+        argv = shlex.split(command, posix=os.name != 'nt')
+    except ValueError:
+        return None
+    argv = [arg.strip('"') for arg in argv]
+    if len(argv) < 2 or '=' in argv[0]:
+        return None
+    if os.path.basename(argv[0]).lower() not in PYTHON_NAMES and argv[0] != sys.executable:
+        return None
+    if argv[1].startswith('-'):
+        # python -u script.py 等带解释器参数的命令按原方式运行
+        return None
+
+    script = os.path.abspath(os.path.join(cwd or os.getcwd(), argv[1]))
+    if os.path.basename(script) not in PIPELINE_SCRIPTS or not os.path.exists(script):
+        return None
+    return [script] + argv[2:]
+
+
+# 预热进程的入口：导入重量级库，报告就绪，然后从stdin读取一个任务并运行
+def serve():
+    start = time.perf_counter()
+    failed = []
+    for name in HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            failed.append(f"{name}: {str(e)}")
+    import_time = time.perf_counter() - start
+    print(READY_MARKER + json.dumps({
+        'pid': os.getpid(),
+        'import_time': round(import_time, 3),
+        'failed': failed
+    }), flush=True)
+
+    line = sys.stdin.readline()
+    if not line:
+        return 0
+    job = json.loads(line)
+    os.chdir(job['cwd'])
+    # 与直接运行脚本时一致：argv[0]为脚本路径，脚本所在目录在sys.path最前面
+    sys.argv = job['argv']
+    sys.path[0] = os.path.dirname(job['argv'][0])
+
+    try:
+        runpy.run_path(job['argv'][0], run_name='__main__')
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        print(e.code)
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+class WarmWorkerPool:
+    """预热进程池
+
+    每个预热进程启动后先导入numpy、sklearn、umap、matplotlib等库，然后空闲待命。
+    运行流水线脚本时取出一个空闲进程，把argv交给它，在进程内用runpy执行脚本的
+    __main__；进程的stdout与普通子进程一样通过管道读取。每个预热进程只运行一个
+    任务就退出，任务之间不共享状态；被取走的进程会在后台补充。
+    """
+
+    def __init__(self, size=1, preexec_fn=None, limit=2 ** 20):
+        self.size = size
+        self.preexec_fn = preexec_fn
+        self.limit = limit
+        self._idle = []       # [(process, 就绪信息)]
+        self._starting = 0
+        self._stats = {'started': 0, 'used': 0, 'misses': 0, 'saved_time': 0.0}
+
+    async def start(self):
+        """补充空闲进程到size个（在后台启动）"""
+        self._idle = [(p, info) for p, info in self._idle if p.returncode is None]
+        while len(self._idle) + self._starting < self.size:
+            self._starting += 1
+            asyncio.create_task(self._spawn())
+
+    async def _spawn(self):
+        try:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, '-u', WORKER_SCRIPT, '--serve',
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                limit=self.limit,
+                preexec_fn=self.preexec_fn
+            )
+            self._stats['started'] += 1
+            # 跳过导入时的警告输出，直到就绪标记
+            while True:
+                line = await process.stdout.readline()
+                if not line:
+                    print("预热进程启动失败")
+                    return
+                line = line.decode('utf-8', errors='replace').strip()
+                if line.startswith(READY_MARKER):
+                    info = json.loads(line[len(READY_MARKER):])
+                    break
+            if info['failed']:
+                print(f"预热进程中部分库导入失败: {info['failed']}")
+            info['ready_at'] = time.time()
+            self._idle.append((process, info))
+        except Exception as e:
+            print(f"启动预热进程出错: {str(e)}")
+        finally:
+            self._starting -= 1
+
+    async def acquire(self, command, cwd=None):
+        """命令是流水线脚本且有空闲的预热进程时，在预热进程中开始运行并返回 (process, 就绪信息)，
+        否则返回None，由调用方按原方式启动子进程"""
+        argv = match_pipeline(command, cwd)
+        if argv is None:
+            return None
+
+        while self._idle:
+            process, info = self._idle.pop(0)
+            if process.returncode is not None:
+                continue
+            try:
+                process.stdin.write((json.dumps({'argv': argv, 'cwd': cwd or os.getcwd()}) + '\n').encode('utf-8'))
+                await process.stdin.drain()
+                process.stdin.close()
+            except Exception:
+                continue
+            self._stats['used'] += 1
+            self._stats['saved_time'] += info['import_time']
+            await self.start()
+            return process, info
+
+        self._stats['misses'] += 1
+        await self.start()
+        return None
+
+    def kill_idle(self):
+        """退出时结束所有空闲的预热进程"""
+        for process, _ in self._idle:
+            try:
+                if process.returncode is None:
+                    process.kill()
+            except Exception:
+                pass
+        self._idle.clear()
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats['saved_time'] = round(stats['saved_time'], 2)
+        stats.update({'size': self.size, 'idle': len(self._idle), 'starting': self._starting})
+        return stats
+
+
+# 基准测试：冷启动一个导入重量级库的解释器 vs 把任务交给已预热的进程
+async def benchmark(repeats=3):
+    probe = os.path.join(os.path.dirname(WORKER_SCRIPT), 'lda_visualization', 'topic_clustering.py')
+    imports = '; '.join(f'import {name}' for name in HEAVY_MODULES)
+
+    cold = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(sys.executable, '-c', imports)
+        await process.wait()
+        cold.append(time.perf_counter() - start)
+
+    pool = WarmWorkerPool(size=1)
+    warm = []
+    for _ in range(repeats):
+        await pool.start()
+        while not pool._idle:
+            await asyncio.sleep(0.05)
+        start = time.perf_counter()
+        # --help让脚本在解析参数后立即退出，只测量交接和脚本自身的导入开销
+        process, _ = await pool.acquire(f'python "{probe}" --help')
+        await process.stdout.read()
+        await process.wait()
+        warm.append(time.perf_counter() - start)
+    pool.kill_idle()
+
+    cold_avg = sum(cold) / len(cold)
+    warm_avg = sum(warm) / len(warm)
+    print(f"冷启动（新解释器 + 导入 {len(HEAVY_MODULES)} 个库）: 平均 {cold_avg:.2f} 秒")
+    print(f"预热进程（交接任务 + 脚本启动）: 平均 {warm_avg:.2f} 秒")
+    print(f"每个任务节省启动时间约 {cold_avg - warm_avg:.2f} 秒")
+    return cold_avg, warm_avg
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='流水线脚本的预热进程')
+    parser.add_argument('--serve', action='store_true', help='作为预热进程运行（由python_socket.py启动）')
+    parser.add_argument('--benchmark', action='store_true', help='对比冷启动与预热进程的启动耗时')
+    parser.add_argument('--repeats', type=int, default=3, help='基准测试重复次数')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.serve:
+        sys.exit(serve())
+    elif args.benchmark:
+        asyncio.run(benchmark(args.repeats))
@@ -0,0 +1,234 @@
+import os
+import re
+import time
+import sqlite3
+import argparse
+import threading
+import collections
+
+from mysql_pool import get_pool
+
+# 代表"全部诗人"的特殊名称，与前端下拉框保持一致
+ALL_POETS = "全部诗人"
+
+# 索引文件默认位置
+INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'word_index.sqlite3')
+
+# 一次IN查询中包含的诗人数量
+POET_BATCH_SIZE = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vocab (
+    word_id INTEGER PRIMARY KEY,
+    word TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS poet_counts (
+    poet TEXT NOT NULL,
+    word_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (poet, word_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS poet_meta (
+    poet TEXT PRIMARY KEY,
+    signature TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    word_total INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+# 每个诗人的数据指纹：行数 + 各行(poemId, topicWords)的CRC32之和，任意一首诗变化都会改变指纹
+POET_SIGNATURE_SQL = """
+SELECT p.poetName, COUNT(*), COALESCE(SUM(CRC32(CONCAT(t.poemId, ':', COALESCE(t.topicWords, '')))), 0)
+FROM topic t
+JOIN poems p ON t.poemId = p.poemId
+WHERE p.poetName IS NOT NULL AND p.poetName <> ''
+GROUP BY p.poetName
+"""
+
+ALL_SIGNATURE_SQL = """
+SELECT COUNT(*), COALESCE(SUM(CRC32(CONCAT(poemId, ':', COALESCE(topicWords, '')))), 0)
+FROM topic
+"""
+
+
+# 将一条topicWords拆分为单个词（与process_topic_words的规则一致）
+def split_topic_words(topic_words):
+    if topic_words is None or len(topic_words.strip()) == 0:
+        return []
+
+    words = []
+    # 先尝试使用正则表达式匹配双引号内的内容
+    matches = re.findall(r'"([^"]*)"', topic_words)
+    if matches:
+        # 对于每个匹配项，按照逗号（中文或英文）分割单个词
+        for match in matches:
+            words.extend(word.strip() for word in re.split(r'[,，]', match))
+    else:
+        # 没有引号时先按中文逗号分割主题，再按英文逗号分割单个词
+        for topic in topic_words.replace('"', '').split('，'):
+            words.extend(word.strip() for word in topic.split(','))
+    return [word for word in words if word]
+
+
+class WordIndex:
+    """按诗人预先统计好的词频索引（SQLite）
+
+    词表存成 word_id -> word，每个诗人的词频存成 (poet, word_id, count)，
+    查询某个诗人的词频只需读取该诗人的词表大小的数据，不再逐行解析topicWords。
+    poet_meta中记录每个诗人的数据指纹，增量更新时只重建指纹变化的诗人。
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # sqlite连接不能跨线程使用，每个线程各自持有一个
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def signature(self, poet):
+        """返回诗人当前的数据指纹，索引中没有该诗人时返回None"""
+        row = self._connect().execute(
+            "SELECT signature FROM poet_meta WHERE poet = ?", (poet,)).fetchone()
+        return row[0] if row else None
+
+    def poets(self):
+        rows = self._connect().execute(
+            "SELECT poet FROM poet_meta WHERE poet <> ? ORDER BY poet", (ALL_POETS,)).fetchall()
+        return [row[0] for row in rows]
+
+    def word_counts(self, poet):
+        """读取诗人的词频，返回collections.Counter；索引中没有该诗人时返回None"""
+        poet = poet or ALL_POETS
+        conn = self._connect()
+        if self.signature(poet) is None:
+            return None
+        rows = conn.execute("""
+            SELECT v.word, c.count
+            FROM poet_counts c
+            JOIN vocab v ON v.word_id = c.word_id
+            WHERE c.poet = ?
+        """, (poet,)).fetchall()
+        return collections.Counter(dict(rows))
+
+    def _word_ids(self, conn, words):
+        conn.executemany("INSERT OR IGNORE INTO vocab (word) VALUES (?)", ((w,) for w in words))
+        ids = {}
+        words = list(words)
+        for i in range(0, len(words), 500):
+            chunk = words[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            ids.update(conn.execute(
+                f"SELECT word, word_id FROM vocab WHERE word IN ({placeholders})", chunk).fetchall())
+        return ids
+
+    def _store(self, conn, poet, signature, row_count, counts):
+        conn.execute("DELETE FROM poet_counts WHERE poet = ?", (poet,))
+        ids = self._word_ids(conn, counts.keys())
+        conn.executemany(
+            "INSERT INTO poet_counts (poet, word_id, count) VALUES (?, ?, ?)",
+            ((poet, ids[word], count) for word, count in counts.items()))
+        conn.execute(
+            "INSERT OR REPLACE INTO poet_meta (poet, signature, row_count, word_total, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (poet, signature, row_count, sum(counts.values()), time.time()))
+
+    def _remove(self, conn, poet):
+        conn.execute("DELETE FROM poet_counts WHERE poet = ?", (poet,))
+        conn.execute("DELETE FROM poet_meta WHERE poet = ?", (poet,))
+
+    def update(self, full=False):
+        """从MySQL增量更新索引，返回本次重建或删除的诗人列表
+
+        full=True时忽略已有指纹，重建所有诗人。
+        """
+        start = time.time()
+        with get_pool().connection() as mysql_conn:
+            with mysql_conn.cursor() as cursor:
+                cursor.execute(POET_SIGNATURE_SQL)
+                remote = {poet: f"{count}:{checksum}" for poet, count, checksum in cursor.fetchall()}
+                cursor.execute(ALL_SIGNATURE_SQL)
+                count, checksum = cursor.fetchone()
+                remote[ALL_POETS] = f"{count}:{checksum}"
+
+                conn = self._connect()
+                local = dict(conn.execute("SELECT poet, signature FROM poet_meta").fetchall())
+                changed = [poet for poet, signature in remote.items()
+                           if full or local.get(poet) != signature]
+                removed = [poet for poet in local if poet not in remote]
+                print(f"词频索引: 共 {len(remote) - 1} 位诗人，需要重建 {len(changed)} 位，删除 {len(removed)} 位")
+
+                poet_changed = [poet for poet in changed if poet != ALL_POETS]
+                with conn:
+                    for poet in removed:
+                        self._remove(conn, poet)
+
+                    for i in range(0, len(poet_changed), POET_BATCH_SIZE):
+                        batch = poet_changed[i:i + POET_BATCH_SIZE]
+                        placeholders = ','.join(['%s'] * len(batch))
+                        cursor.execute(f"""
+                            SELECT p.poetName, t.topicWords
+                            FROM topic t
+                            JOIN poems p ON t.poemId = p.poemId
+                            WHERE p.poetName IN ({placeholders})
+                        """, batch)
+                        counts = {poet: collections.Counter() for poet in batch}
+                        rows = {poet: 0 for poet in batch}
+                        for poet, topic_words in cursor.fetchall():
+                            if poet not in counts:
+                                continue
+                            counts[poet].update(split_topic_words(topic_words))
+                            rows[poet] += 1
+                        for poet in batch:
+                            self._store(conn, poet, remote[poet], rows[poet], counts[poet])
+
+                    if ALL_POETS in changed:
+                        cursor.execute("SELECT topicWords FROM topic")
+                        counts = collections.Counter()
+                        rows = 0
+                        for (topic_words,) in cursor.fetchall():
+                            counts.update(split_topic_words(topic_words))
+                            rows += 1
+                        self._store(conn, ALL_POETS, remote[ALL_POETS], rows, counts)
+
+        print(f"词频索引更新完成，用时 {time.time() - start:.2f} 秒")
+        return changed + removed
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+# 获取进程内共享的默认索引
+def get_index():
+    global _default_index
+    if _default_index is None:
+        with _default_index_lock:
+            if _default_index is None:
+                _default_index = WordIndex(INDEX_PATH)
+    return _default_index
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='构建/增量更新诗人词频索引')
+    parser.add_argument('--index', type=str, default=INDEX_PATH, help='索引文件路径')
+    parser.add_argument('--full', action='store_true', help='忽略已有指纹，重建全部诗人')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    changed = WordIndex(args.index).update(full=args.full)
+    print(f"本次更新了 {len(changed)} 位诗人的词频")
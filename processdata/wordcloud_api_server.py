@@ -1,23 +1,29 @@
 import os
 import pymysql
-import numpy as np
 import pandas as pd
 import base64
 import matplotlib
 # 在导入pyplot之前，设置后端为非交互式的"Agg"
 matplotlib.use('Agg')  # 必须在导入pyplot之前设置
 from matplotlib import pyplot as plt
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, make_response, url_for
 from flask_cors import CORS
-from wordcloud import WordCloud, ImageColorGenerator, STOPWORDS
-from PIL import Image
 import collections
 import re
-import cv2
 import io
 import time
 import hashlib
+import threading
 import traceback
+from datetime import datetime, timezone
+from mysql_pool import get_pool, MYSQL_CONFIG
+from poet_directory import get_poet_directory, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from word_index import get_index, split_topic_words
+from render_cache import get_render_cache, make_cache_key, hash_word_counts, SingleFlight
+from render_assets import get_asset_registry
+from wordcloud_encode import encode_wordcloud, parse_encode_options, ENCODE_DEFAULTS
+from render_pool import (generate_wordcloud, get_render_pool, WORDCLOUD_PARAMS,
+                         RenderQueueFull, RenderTimeout)
 
 # 设置matplotlib支持中文显示
 matplotlib.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'SimSun', 'Arial Unicode MS']
@@ -29,35 +35,26 @@ app = Flask(__name__)
 # 添加CORS支持，允许前端跨域请求
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-# 连接MySQL数据库
+# 合并同时到达的相同词云请求（相同诗人 + 相同渲染参数只计算一次）
+wordcloud_flight = SingleFlight()
+
+# 是否以调试模式运行Flask
+DEBUG = True
+
+# /generate_wordcloud支持的返回格式
+RESPONSE_FORMATS = ('base64', 'png', 'url')
+
+# 连接MySQL数据库（单独建立连接，API请求请使用连接池）
 def connect_to_mysql():
-    connection = pymysql.connect(
-        host='localhost',
-        user='root',
-        password='123456',  # 请替换为您的数据库密码
-        database='lunwen',
-        charset='utf8mb4'
-    )
-    return connection
+    return pymysql.connect(**MYSQL_CONFIG)
 
-# 获取所有诗人列表
+# 获取所有诗人列表（读取内存中的诗人列表快照）
 def get_poets():
-    connection = connect_to_mysql()
-    try:
-        with connection.cursor() as cursor:
-            # 从poems表中获取所有诗人名称
-            sql = "SELECT DISTINCT poetName FROM poems ORDER BY poetName"
-            cursor.execute(sql)
-            results = cursor.fetchall()
-            poets = [result[0] for result in results if result[0]]
-            return poets
-    finally:
-        connection.close()
+    return get_poet_directory().poets()
 
 # 根据诗人获取topicWords数据
 def get_topic_words_by_poet(poet_name=None):
-    connection = connect_to_mysql()
-    try:
+    with get_pool().connection() as connection:
         with connection.cursor() as cursor:
             if poet_name and poet_name != "全部诗人":
                 # 根据诗人名筛选topicWords
@@ -75,8 +72,6 @@ def get_topic_words_by_poet(poet_name=None):
             
             results = cursor.fetchall()
             return results
-    finally:
-        connection.close()
 
 # 处理topicWords数据，统计词频
 def process_topic_words(topic_words_data):
@@ -85,34 +80,7 @@ def process_topic_words(topic_words_data):
     print(f"处理 {len(topic_words_data)} 条topicWords数据")
     
     for row in topic_words_data:
-        if row[0] is None or len(row[0].strip()) == 0:
-            continue
-            
-        topic_words = row[0]
-        # 先尝试使用正则表达式匹配双引号内的内容
-        matches = re.findall(r'"([^"]*)"', topic_words)
-        
-        if matches:
-            # 如果找到匹配项，使用它们
-            for match in matches:
-                # 对于每个匹配项，按照逗号（中文或英文）分割单个词
-                words = re.split(r'[,，]', match)
-                for word in words:
-                    word = word.strip()  # 去除空格
-                    if word:  # 确保单词不为空
-                        all_words.append(word)
-        else:
-            # 如果没有匹配项，按照旧的方式处理
-            # 尝试按照中文逗号分割
-            topics = topic_words.replace('"', '').split('，')
-            
-            # 对于每个主题，按照英文逗号分割单个词
-            for topic in topics:
-                words = topic.split(',')
-                for word in words:
-                    word = word.strip()  # 去除空格
-                    if word:  # 确保单词不为空
-                        all_words.append(word)
+        all_words.extend(split_topic_words(row[0]))
     
     # 统计词频
     word_counts = collections.Counter(all_words)
@@ -121,160 +89,42 @@ def process_topic_words(topic_words_data):
     
     return word_counts
 
-# 加载停用词列表
-def load_stopwords():
-    stopwords = set(STOPWORDS)
-    # 在这里添加基本中文停用词
-    chinese_stopwords = {'的', '了', '和', '是', '在', '我', '有', '与', '这', '那', '你', '他', '她', '它'}
-    stopwords.update(chinese_stopwords)
-    
-    # 尝试从stopwords2.txt文件加载停用词
-    stopwords_paths = [
-        os.path.join('processdata', 'ciyuntu', 'stopwords2.txt'),
-        os.path.join('..', 'ciyuntu', 'stopwords2.txt'),
-        os.path.join('ciyuntu', 'stopwords2.txt'),
-        os.path.abspath(os.path.join('D:', '01', 'lunwen', 'processdata', 'ciyuntu', 'stopwords2.txt'))
-    ]
-    
-    loaded = False
-    for path in stopwords_paths:
-        try:
-            print(f"尝试从 {path} 加载停用词列表")
-            with open(path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    word = line.strip()
-                    if word:  # 确保单词不为空
-                        stopwords.add(word)
-            print(f"成功从 {path} 加载停用词")
-            loaded = True
-            break
-        except FileNotFoundError:
-            continue
-    
-    if not loaded:
-        print("警告: 无法加载stopwords2.txt文件，将只使用基本停用词")
-    else:
-        print(f"总共加载了 {len(stopwords)} 个停用词")
-    
-    return stopwords
-
-# 检查并确保字体文件存在
-def ensure_font_exists():
-    # 常见的中文字体路径
-    font_paths = [
-        'C:\\Windows\\Fonts\\simhei.ttf',  # Windows黑体
-        'C:\\Windows\\Fonts\\simkai.ttf',  # Windows楷体
-        'C:\\Windows\\Fonts\\simsun.ttc',  # Windows宋体
-        'C:\\Windows\\Fonts\\msyh.ttc',    # Windows微软雅黑
-        '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',  # Linux文泉驿微米黑
-        '/System/Library/Fonts/PingFang.ttc'  # macOS苹方
-    ]
-    
-    for font_path in font_paths:
-        if os.path.exists(font_path):
-            print(f"使用字体: {font_path}")
-            return font_path
+# 获取诗人的词频：优先读取预先构建的词频索引，索引中没有时退回逐行解析topicWords
+def get_word_counts(poet_name):
+    try:
+        word_counts = get_index().word_counts(poet_name)
+        if word_counts is not None:
+            print(f"从词频索引读取 {poet_name} 的词频，共 {len(word_counts)} 个不同的词")
+            return word_counts
+    except Exception as e:
+        print(f"读取词频索引失败，改为实时统计: {str(e)}")
     
-    # 如果找不到任何字体，给出警告并使用默认路径
-    print("警告: 找不到任何中文字体文件，将使用默认字体路径，可能导致中文显示为方块")
-    return 'C:\\Windows\\Fonts\\simhei.ttf'
+    topic_words_data = get_topic_words_by_poet(poet_name)
+    if not topic_words_data:
+        return None
+    print(f"获取到 {len(topic_words_data)} 条主题词数据")
+    return process_topic_words(topic_words_data)
 
-# 生成词云图
-def generate_wordcloud(word_counts, max_words=2000):
-    if not word_counts:
-        return None, None
-        
-    # 加载mask图片
-    mask_paths = [
-        os.path.join('..', 'ciyuntu', 'ciyun1.png'),
-        os.path.join('ciyuntu', 'ciyun1.png'),
-        os.path.join('processdata', 'ciyuntu', 'ciyun1.png'),
-        os.path.join('..', '..', 'processdata', 'ciyuntu', 'ciyun1.png'),
-        os.path.abspath(os.path.join('D:', '01', 'lunwen', 'processdata', 'ciyuntu', 'ciyun1.png'))
-    ]
-    
-    mask_img = None
-    for mask_path in mask_paths:
-        try:
-            print(f"尝试加载蒙版图片: {mask_path}")
-            mask_img = Image.open(mask_path).convert('RGBA')
-            print(f"成功加载蒙版图片: {mask_path}")
-            break
-        except FileNotFoundError:
-            continue
-    
-    if mask_img is None:
-        print("错误：无法找到蒙版图片。请确保文件存在并提供正确的路径。")
-        return None, None
-    
-    print(f"原始蒙版图片尺寸(PIL格式): {mask_img.size}")
-    mask_data = np.array(mask_img)
-    
-    # 创建一个只在轮廓内部有值的mask
-    mask = np.zeros(mask_data.shape[:2], np.uint8)
-    mask[mask_data[:, :, 3] <= 50] = 255  # 不透明区域（轮廓内部）
-    mask[mask_data[:, :, 3] > 50] = 0     # 透明区域（轮廓外部）
-    
-    # 清理mask噪点
-    kernel = np.ones((3, 3), np.uint8)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-    
-    # 创建缩小的内部mask，避免文字太靠近边缘
-    erosion_kernel = np.ones((5, 5), np.uint8)
-    inner_mask = cv2.erode(mask, erosion_kernel, iterations=1)
-    
-    print(f"蒙版numpy数组尺寸: {mask.shape}")
-    print(f"蒙版中非零像素数量: {np.count_nonzero(mask)}")
-    print(f"内部蒙版中非零像素数量: {np.count_nonzero(inner_mask)}")
-    
-    # 设置词云参数
-    font_path = ensure_font_exists()
-    
-    # 加载停用词
-    stopwords = load_stopwords()
-    
-    # 创建图像颜色生成器
-    image_colors = ImageColorGenerator(mask_data)
-    
+# 增量更新词频索引，只重建数据发生变化的诗人
+def update_word_index(full=False):
     try:
-        wordcloud = WordCloud(
-            background_color=None,  # 将背景设置为透明
-            mode="RGBA",            # 使用RGBA模式支持透明度
-            mask=inner_mask,
-            max_words=max_words,
-            max_font_size=45,       # 降低最大字体大小（原为60）
-            min_font_size=8,        # 添加最小字体大小
-            stopwords=stopwords,    # 添加停用词
-            prefer_horizontal=0.9,
-            relative_scaling=0.5,   # 降低词频对字体大小的影响（原为0.8）
-            font_path=font_path,    # 使用已确认存在的字体
-            width=mask.shape[1],
-            height=mask.shape[0],
-            random_state=42,
-            # 添加额外参数以支持中文
-            collocations=False,     # 避免词组重复
-            regexp=r"[\w\u4e00-\u9fa5]+"  # 增加对中文字符的支持
-        ).generate_from_frequencies(word_counts)
-        
-        if wordcloud is None or len(wordcloud.words_) == 0:
-            print("警告：词云生成失败或为空！")
-            return None, None
-
-        print(f"词云中的词语数量: {len(wordcloud.words_)}")
-        
-        # 使用图像颜色为词云着色
-        colored_wordcloud = wordcloud.recolor(color_func=image_colors)
-        
-        return wordcloud, colored_wordcloud
-        
+        changed = get_index().update(full=full)
+        # 数据变化的诗人对应的词云缓存失效
+        removed = get_render_cache().invalidate(changed)
+        if removed:
+            print(f"已清除 {removed} 个过期的词云缓存")
+        # 有诗人新增或删除时立即刷新诗人列表快照
+        if changed:
+            get_poet_directory().refresh()
+        return changed
     except Exception as e:
-        print(f"生成词云图像时出错: {str(e)}")
+        print(f"更新词频索引时出错: {str(e)}")
         traceback.print_exc()
-        return None, None
+        return None
 
-# 保存词云图到内存字节流并返回base64编码
-def save_wordcloud_to_base64(wordcloud):
+# 通过matplotlib保存词云图到内存字节流并返回PNG字节
+# （旧的编码路径，API已改用wordcloud_encode直接编码，这里保留用于对比基准）
+def save_wordcloud_to_png(wordcloud):
     if wordcloud is None:
         return None
         
@@ -309,99 +159,257 @@ def save_wordcloud_to_base64(wordcloud):
         # 重要：确保关闭图形释放资源
         plt.close(fig)
         
-        # 将字节流转换为base64编码
-        img_bytes.seek(0)
-        base64_data = base64.b64encode(img_bytes.read()).decode('utf-8')
+        png_data = img_bytes.getvalue()
         
         # 释放BytesIO资源
         img_bytes.close()
         
-        return base64_data
+        return png_data
     except Exception as e:
-        print(f"保存词云图到base64时出错: {str(e)}")
+        print(f"保存词云图到PNG时出错: {str(e)}")
         traceback.print_exc()
         # 确保出错时也关闭图形
         plt.close('all')
         return None
 
+# 保存词云图到内存字节流并返回base64编码
+def save_wordcloud_to_base64(wordcloud):
+    png_data = save_wordcloud_to_png(wordcloud)
+    if png_data is None:
+        return None
+    return base64.b64encode(png_data).decode('utf-8')
+
+# 词云渲染结果的缓存键：词频、渲染资源（蒙版、字体、停用词）、词云参数和编码参数的内容哈希
+def wordcloud_cache_key(word_counts, assets, encode_options=None, max_words=2000):
+    return make_cache_key(
+        hash_word_counts(word_counts),
+        assets.fingerprint,
+        dict(WORDCLOUD_PARAMS, max_words=max_words),
+        encode_options or ENCODE_DEFAULTS
+    )
+
 # API端点：获取所有诗人名称
+# 可选参数：q（名称或拼音前缀）、page（从1开始）、page_size；不带page时返回全部匹配的诗人
+# 响应带ETag，诗人列表未变化时客户端的条件请求直接得到304
 @app.route('/poets', methods=['GET'])
 def api_get_poets():
     try:
-        poets = get_poets()
-        return jsonify({
-            'success': True,
-            'poets': poets
-        })
+        query = request.args.get('q', '')
+        page = request.args.get('page', type=int)
+        page_size = request.args.get('page_size', type=int)
+        poets, total, snapshot = get_poet_directory().search(query, page, page_size)
+
+        # 快照内容不变时ETag不变，先比较ETag，命中时不需要序列化列表
+        etag = snapshot.etag[:16] + '-' + hashlib.sha1(
+            f"{query}|{page}|{page_size}".encode('utf-8')).hexdigest()[:8]
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            body = {
+                'success': True,
+                'poets': poets,
+                'total': total
+            }
+            if page is not None:
+                body['page'] = max(1, page)
+                body['page_size'] = min(max(1, page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+            response = jsonify(body)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+# API端点：诗人列表快照状态
+@app.route('/poet_stats', methods=['GET'])
+def api_poet_stats():
+    return jsonify({
+        'success': True,
+        'directory': get_poet_directory().stats()
+    })
+
+# API端点：数据库连接池状态
+@app.route('/pool_stats', methods=['GET'])
+def api_pool_stats():
+    return jsonify({
+        'success': True,
+        'pool': get_pool().stats()
+    })
+
+# API端点：词云渲染缓存状态
+@app.route('/cache_stats', methods=['GET'])
+def api_cache_stats():
+    return jsonify({
+        'success': True,
+        'cache': get_render_cache().stats()
+    })
+
+# 生成词云图时的业务错误，携带返回给前端的HTTP状态码
+class WordCloudError(Exception):
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.status = status
+
+# 获取诗人的词云图（优先从渲染缓存读取），返回 (缓存条目, 是否命中缓存)
+def get_wordcloud_image(poet_name, mask_name='default', encode_options=None):
+    encode_options = encode_options or dict(ENCODE_DEFAULTS)
+    if mask_name not in get_asset_registry().mask_names():
+        raise WordCloudError(f'未知的蒙版: {mask_name}', 400)
+    
+    # 获取词频数据
+    word_counts = get_word_counts(poet_name)
+    
+    if word_counts is None:
+        print(f"未找到诗人 {poet_name} 的数据")
+        raise WordCloudError(f'未找到 {poet_name} 的数据', 404)
+    
+    if not word_counts:
+        print(f"无法从诗人 {poet_name} 提取任何有效词语")
+        raise WordCloudError(f'无法从 {poet_name} 提取任何有效词语', 404)
+    
+    print(f"成功提取 {len(word_counts)} 个不同词语")
+    
+    # 词频和渲染参数都相同的词云图直接从缓存读取
+    render_cache = get_render_cache()
+    cache_key = wordcloud_cache_key(word_counts, get_asset_registry().get(mask_name), encode_options)
+    cached = render_cache.get(cache_key)
+    
+    if cached is not None:
+        print(f"命中词云缓存: {cache_key[:12]}")
+        return cached, True
+    
+    render_pool = get_render_pool()
+    if render_pool is not None:
+        # 交给渲染进程池，避免CPU密集的布局计算在GIL上排队
+        try:
+            image_data, content_type = render_pool.render(word_counts, mask_name, encode_options, poet=poet_name)
+        except RenderQueueFull as e:
+            print(f"拒绝词云请求: {str(e)}")
+            raise WordCloudError('服务器繁忙，请稍后重试', 503)
+        except RenderTimeout as e:
+            print(f"词云渲染超时: {str(e)}")
+            raise WordCloudError('词云生成超时', 504)
+        except Exception as e:
+            print(f"渲染进程生成词云失败: {str(e)}")
+            raise WordCloudError('词云生成失败', 500)
+        return render_cache.put(cache_key, image_data, poet=poet_name, content_type=content_type), False
+    
+    # 生成词云图
+    _, colored_wordcloud = generate_wordcloud(word_counts, mask_name=mask_name)
+    
+    if colored_wordcloud is None:
+        print("词云生成失败")
+        raise WordCloudError('词云生成失败', 500)
+        
+    print(f"词云生成成功，正在编码为{encode_options['image_format']}")
+    
+    try:
+        image_data, content_type = encode_wordcloud(colored_wordcloud, **encode_options)
+    except Exception as e:
+        print(f"词云图编码失败: {str(e)}")
+        traceback.print_exc()
+        raise WordCloudError('词云图保存失败', 500)
+    
+    return render_cache.put(cache_key, image_data, poet=poet_name, content_type=content_type), False
+
+# 直接返回图片字节，带ETag和Last-Modified，浏览器可以用条件请求重新验证
+def image_response(entry, immutable=False):
+    response = make_response(entry.data)
+    response.mimetype = entry.meta.get('content_type', 'image/png')
+    response.set_etag(entry.key)
+    response.last_modified = datetime.fromtimestamp(entry.meta.get('created_at', time.time()), timezone.utc)
+    if immutable:
+        # 按内容哈希寻址的URL，内容永远不会变
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        # 同一个诗人的URL在数据更新后内容会变，每次都需要重新验证
+        response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+# API端点：渲染进程池的队列深度、最近任务耗时和请求合并计数
+@app.route('/render_stats', methods=['GET'])
+def api_render_stats():
+    render_pool = get_render_pool()
+    return jsonify({
+        'success': True,
+        'enabled': render_pool is not None,
+        'render': render_pool.stats() if render_pool is not None else None,
+        'coalescing': wordcloud_flight.stats()
+    })
+
 # API端点：生成词云图
-@app.route('/generate_wordcloud', methods=['POST'])
+# format参数：base64（默认，JSON中带base64图片，兼容WordCloudView.vue）、
+#            png（直接返回图片字节）、url（返回可缓存的图片地址）
+# 编码参数：image_format（png/webp/jpeg）、compress_level、quality、max_side
+@app.route('/generate_wordcloud', methods=['GET', 'POST'])
 def api_generate_wordcloud():
     try:
         print("收到词云图生成请求")
-        data = request.json
+        data = dict(request.args.items())
+        data.update(request.get_json(silent=True) or {})
         poet_name = data.get('poet_name', '全部诗人')
-        print(f"请求生成词云图的诗人: {poet_name}")
+        mask_name = data.get('mask', 'default')
+        response_format = data.get('format', 'base64')
+        print(f"请求生成词云图的诗人: {poet_name}，蒙版: {mask_name}，返回格式: {response_format}")
         
-        # 获取主题词数据
-        topic_words_data = get_topic_words_by_poet(poet_name)
-        
-        if not topic_words_data:
-            print(f"未找到诗人 {poet_name} 的数据")
+        if response_format not in RESPONSE_FORMATS:
             return jsonify({
                 'success': False,
-                'error': f'未找到 {poet_name} 的数据'
-            }), 404
-            
-        print(f"获取到 {len(topic_words_data)} 条主题词数据")
-            
-        # 处理数据，统计词频
-        word_counts = process_topic_words(topic_words_data)
+                'error': f'未知的返回格式: {response_format}'
+            }), 400
         
-        if not word_counts:
-            print(f"无法从诗人 {poet_name} 提取任何有效词语")
+        try:
+            encode_options = parse_encode_options(data)
+        except ValueError as e:
             return jsonify({
                 'success': False,
-                'error': f'无法从 {poet_name} 提取任何有效词语'
-            }), 404
+                'error': f'无效的编码参数: {str(e)}'
+            }), 400
         
-        print(f"成功提取 {len(word_counts)} 个不同词语")
+        # 相同的请求正在计算时直接等待它的结果
+        poet_name = str(poet_name or '全部诗人').strip()
+        flight_key = (poet_name, mask_name, tuple(sorted(encode_options.items())))
+        (entry, cached), shared = wordcloud_flight.do(
+            flight_key, lambda: get_wordcloud_image(poet_name, mask_name, encode_options))
+        if shared:
+            print(f"与正在进行的相同请求合并: {poet_name}")
         
-        # 生成词云图
-        _, colored_wordcloud = generate_wordcloud(word_counts)
+        if response_format == 'png':
+            return image_response(entry)
         
-        if colored_wordcloud is None:
-            print("词云生成失败")
+        if response_format == 'url':
             return jsonify({
-                'success': False,
-                'error': '词云生成失败'
-            }), 500
-            
-        print("词云生成成功，正在转换为base64")
-            
-        # 将词云图转换为base64编码
-        base64_image = save_wordcloud_to_base64(colored_wordcloud)
+                'success': True,
+                'poet': poet_name,
+                'url': url_for('api_wordcloud_image', key=entry.key, _external=True),
+                'etag': entry.key,
+                'cached': cached
+            })
         
-        if base64_image is None:
-            print("词云图保存为base64失败")
-            return jsonify({
-                'success': False,
-                'error': '词云图保存失败'
-            }), 500
+        # 将词云图转换为base64编码
+        base64_image = base64.b64encode(entry.data).decode('utf-8')
             
         print(f"成功生成诗人 {poet_name} 的词云图，base64长度: {len(base64_image)}")
             
         return jsonify({
             'success': True,
             'poet': poet_name,
-            'image': base64_image
+            'image': base64_image,
+            'content_type': entry.meta.get('content_type', 'image/png'),
+            'cached': cached
         })
         
+    except WordCloudError as e:
+        response = jsonify({
+            'success': False,
+            'error': str(e)
+        })
+        if e.status == 503:
+            response.headers['Retry-After'] = '1'
+        return response, e.status
     except Exception as e:
         error_msg = f"生成词云图时出错: {str(e)}"
         print(error_msg)
@@ -411,28 +419,55 @@ def api_generate_wordcloud():
             'error': error_msg
         }), 500
 
-# 在WebSocket服务器中添加处理诗人列表请求的功能
-# 这部分需要添加到python_socket.py的handle_connection函数中
-"""
-elif data['action'] == 'fetch_poets':
-    # 获取诗人列表
-    try:
-        from wordcloud_api_server import get_poets
-        poets = get_poets()
-        await websocket.send(json.dumps({
-            'type': 'poet_list',
-            'success': True,
-            'poets': poets
-        }))
-    except Exception as e:
-        await websocket.send(json.dumps({
-            'type': 'poet_list',
+# API端点：按内容哈希获取已渲染的词云图
+@app.route('/wordcloud_image/<key>', methods=['GET'])
+def api_wordcloud_image(key):
+    if not re.fullmatch(r'[0-9a-f]{64}', key):
+        return jsonify({
             'success': False,
-            'error': str(e)
-        }))
-"""
+            'error': '无效的图片地址'
+        }), 400
+    
+    entry = get_render_cache().get(key)
+    if entry is None:
+        return jsonify({
+            'success': False,
+            'error': '图片不存在或已过期，请重新生成'
+        }), 404
+    return image_response(entry, immutable=True)
+
+# API端点：增量更新词频索引
+@app.route('/rebuild_index', methods=['POST'])
+def api_rebuild_index():
+    data = request.get_json(silent=True) or {}
+    changed = update_word_index(full=bool(data.get('full', False)))
+    if changed is None:
+        return jsonify({
+            'success': False,
+            'error': '更新词频索引失败'
+        }), 500
+    return jsonify({
+        'success': True,
+        'updated_poets': len(changed)
+    })
+
+# 启动时的准备工作：加载渲染资源、启动渲染进程、更新词频索引
+def start_background_tasks():
+    # 启动时加载诗人列表快照
+    threading.Thread(target=get_poet_directory().preload, daemon=True).start()
+    # 启动时一次性加载蒙版、停用词和字体
+    get_asset_registry().preload()
+    # 提前启动渲染工作进程，让它们预加载渲染资源
+    render_pool = get_render_pool()
+    if render_pool is not None:
+        render_pool.warm_up()
+    # 后台增量更新词频索引，更新完成前未入索引的诗人会实时统计
+    threading.Thread(target=update_word_index, daemon=True).start()
 
 # 启动Flask应用
 if __name__ == '__main__':
     print("启动词云图API服务器...")
-    app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
+    # 调试模式下Werkzeug的重载器会另起一个子进程运行应用，准备工作只在该子进程中执行
+    if not DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_tasks()
+    app.run(host='0.0.0.0', port=5000, debug=DEBUG)
\ No newline at end of file
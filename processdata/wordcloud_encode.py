@@ -0,0 +1,163 @@
+import io
+import os
+import csv
+import time
+import argparse
+import collections
+
+import numpy as np
+from PIL import Image
+
+# 支持的图片格式：名称 -> (PIL格式, Content-Type)
+IMAGE_FORMATS = {
+    'png': ('PNG', 'image/png'),
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg')
+}
+
+# 默认编码参数
+ENCODE_DEFAULTS = {
+    'image_format': 'png',
+    'compress_level': 6,   # PNG压缩级别 0-9，越大越小越慢
+    'quality': 85,         # WebP/JPEG质量 1-100，WebP取100时使用无损压缩
+    'max_side': None       # 长边超过该像素数时等比缩小，None表示保持原尺寸
+}
+
+# JPEG不支持透明度，透明区域铺上的背景色
+JPEG_BACKGROUND = (255, 255, 255)
+
+
+# 将WordCloud对象、numpy数组或PIL图片统一转换为PIL图片
+def to_pil_image(image):
+    if isinstance(image, Image.Image):
+        return image
+    if isinstance(image, np.ndarray):
+        return Image.fromarray(image)
+    # WordCloud对象
+    return image.to_image()
+
+
+# 直接编码词云图，不经过matplotlib，返回 (图片字节, Content-Type)
+def encode_wordcloud(wordcloud, image_format='png', compress_level=6, quality=85, max_side=None):
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"不支持的图片格式: {image_format}")
+    pil_format, content_type = IMAGE_FORMATS[image_format]
+
+    image = to_pil_image(wordcloud)
+
+    # 可选的等比缩小
+    if max_side and max(image.size) > max_side:
+        scale = max_side / max(image.size)
+        size = (max(1, round(image.size[0] * scale)), max(1, round(image.size[1] * scale)))
+        image = image.resize(size, Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    if image_format == 'png':
+        image.save(buffer, pil_format, compress_level=compress_level)
+    elif image_format == 'webp':
+        image.save(buffer, pil_format, quality=quality, lossless=quality >= 100, method=4)
+    else:
+        # JPEG不支持透明度，先把透明区域合成到背景色上
+        if image.mode in ('RGBA', 'LA'):
+            background = Image.new('RGB', image.size, JPEG_BACKGROUND)
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(buffer, pil_format, quality=quality, optimize=True)
+    return buffer.getvalue(), content_type
+
+
+# 从请求参数中解析编码参数，参数无效时抛出ValueError
+def parse_encode_options(params):
+    options = dict(ENCODE_DEFAULTS)
+    image_format = str(params.get('image_format', options['image_format'])).lower()
+    if image_format == 'jpg':
+        image_format = 'jpeg'
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"不支持的图片格式: {image_format}")
+    options['image_format'] = image_format
+
+    if params.get('compress_level') is not None:
+        options['compress_level'] = int(params['compress_level'])
+        if not 0 <= options['compress_level'] <= 9:
+            raise ValueError("compress_level必须在0到9之间")
+    if params.get('quality') is not None:
+        options['quality'] = int(params['quality'])
+        if not 1 <= options['quality'] <= 100:
+            raise ValueError("quality必须在1到100之间")
+    if params.get('max_side') is not None:
+        options['max_side'] = int(params['max_side'])
+        if options['max_side'] < 16:
+            raise ValueError("max_side不能小于16")
+    return options
+
+
+# 从topic.csv统计词频，供离线基准测试使用（不需要数据库）
+def load_word_counts_from_csv(path):
+    from word_index import split_topic_words
+
+    word_counts = collections.Counter()
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            word_counts.update(split_topic_words(row.get('topicWords')))
+    return word_counts
+
+
+def _time_call(func, repeats):
+    timings = []
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return result, float(np.median(timings))
+
+
+# 对比matplotlib旧路径与直接编码路径的耗时和输出大小
+def benchmark(input_path, repeats=5, mask_name='default'):
+    from wordcloud_api_server import generate_wordcloud, save_wordcloud_to_png
+
+    word_counts = load_word_counts_from_csv(input_path)
+    print(f"从 {input_path} 统计到 {len(word_counts)} 个不同的词，正在生成词云...")
+    _, colored_wordcloud = generate_wordcloud(word_counts, mask_name=mask_name)
+    if colored_wordcloud is None:
+        print("词云生成失败，无法进行基准测试")
+        return []
+
+    cases = [('matplotlib PNG（旧路径）', lambda: save_wordcloud_to_png(colored_wordcloud))]
+    for options in [
+        {'image_format': 'png', 'compress_level': 1},
+        {'image_format': 'png', 'compress_level': 6},
+        {'image_format': 'png', 'compress_level': 9},
+        {'image_format': 'webp', 'quality': 80},
+        {'image_format': 'webp', 'quality': 100},
+        {'image_format': 'jpeg', 'quality': 85},
+        {'image_format': 'png', 'compress_level': 6, 'max_side': 320},
+    ]:
+        name = '直接编码 ' + ', '.join(f"{k}={v}" for k, v in options.items())
+        cases.append((name, lambda options=options: encode_wordcloud(colored_wordcloud, **options)[0]))
+
+    results = []
+    print(f"{'编码方式':<48}{'中位耗时(ms)':>14}{'大小(KB)':>12}")
+    for name, func in cases:
+        data, seconds = _time_call(func, repeats)
+        results.append((name, seconds, len(data)))
+        print(f"{name:<48}{seconds * 1000:>14.1f}{len(data) / 1024:>12.1f}")
+    return results
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='词云图编码方式基准测试')
+    parser.add_argument('--input', type=str,
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'topic.csv'),
+                        help='用于统计词频的topic.csv路径')
+    parser.add_argument('--repeats', type=int, default=5, help='每种编码方式重复的次数')
+    parser.add_argument('--mask', type=str, default='default', help='使用的蒙版名称')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    benchmark(args.input, repeats=args.repeats, mask_name=args.mask)